@@ -3,20 +3,84 @@ from django.contrib import admin
 ''' 
 # Register your models here.
 '''
-from .models import Author, Genre, Book, BookInstance, Language
+from .models import Author, Genre, Book, BookInstance, Language, CatalogStats, LoanNotice, SlowQuery
+## count the rows of large tables from the planner's estimate (see pagination.py)
+from .pagination import EstimatedCountPaginator
+from .loans import change_status
+from django.utils.text import Truncator
 
 '''
 # Inline classes enable editing associated records (e.g. BookInstance) at the same time of editing the main record (e.g. Book)
 # There are two types of inline classes TabularInline (horizonal layout) or StackedInline (vertical layout, just like the default model layout)
 '''
-class BookInstanceInline(admin.TabularInline):
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+
+## An inline formset showing one page of the related records (e.g. 20 of the 3,000 copies of a book),
+## selected with the ?<prefix>-page=<number> URL parameter. Posting the form only validates and saves that page,
+## so opening and saving a record takes the same time whatever the number of related records.
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    per_page = 20
+    ## GET parameters of the change page, set by PaginatedInlineMixin.get_formset()
+    query = None
+    
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = self.queryset if self.queryset.ordered else self.queryset.order_by(self.model._meta.pk.name)
+            self.paginator = Paginator(queryset, self.per_page)
+            self.page = self.paginator.get_page(self.query.get(self.page_param) if self.query else None)
+            self._queryset = list(self.page.object_list)
+        return self._queryset
+    
+    @property
+    def page_param(self):
+        return '%s-page' % self.prefix
+    
+    def page_query(self, number):
+        ## the query string of the change page, showing the given page of this inline
+        query = self.query.copy()
+        query[self.page_param] = number
+        return query.urlencode()
+    
+    def previous_page_query(self):
+        return self.page_query(self.page.previous_page_number()) if self.page.has_previous() else None
+    
+    def next_page_query(self):
+        return self.page_query(self.page.next_page_number()) if self.page.has_next() else None
+
+class PaginatedInlineMixin(object):
+    formset = PaginatedInlineFormSet
+    per_page = PaginatedInlineFormSet.per_page
+    
+    def __init__(self, *args, **kwargs):
+        super(PaginatedInlineMixin, self).__init__(*args, **kwargs)
+        ## the paginated template includes the regular one (tabular or stacked) and adds the page links
+        self.base_template = self.template
+        self.template = 'admin/catalog/paginated_inline.html'
+    
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super(PaginatedInlineMixin, self).get_formset(request, obj, **kwargs)
+        return type(formset.__name__, (formset,), {'per_page': self.per_page, 'query': request.GET})
+
+class BookInstanceInline(PaginatedInlineMixin, admin.TabularInline):
     model = BookInstance
     ## specific how may place holder records (i.e. blank record) to be displayed within Inline. The default is 3. Minimum is 0. 
     extra = 1
+    ## a text input for the borrower id, instead of a <select> with every user in each row
+    raw_id_fields = ('borrower',)
     
-class BookInline(admin.StackedInline):
+    def get_queryset(self, request):
+        ## the title of the book is shown with each copy (BookInstance.__str__)
+        return super(BookInstanceInline, self).get_queryset(request).select_related('book').defer('book__search_vector')
+    
+class BookInline(PaginatedInlineMixin, admin.StackedInline):
     model = Book
     extra = 0
+    per_page = 10
+    
+    def get_queryset(self, request):
+        ## the genre field of each form reads the book's genres: load them for the whole page in one query
+        return super(BookInline, self).get_queryset(request).defer('search_vector').prefetch_related('genre')
 
 '''
 # create a subclass under ModelAdmin class to configure admin page for a model
@@ -24,6 +88,9 @@ class BookInline(admin.StackedInline):
 class AuthorAdmin(admin.ModelAdmin):
     ## On list view, display last name, first name, date of birth, date of death for Author page on admin site
     list_display = ('last_name', 'first_name', 'dob', 'dod')
+    paginator = EstimatedCountPaginator
+    ## do not count the whole table a second time to show "(N total)" next to a filtered count
+    show_full_result_count = False
     ## On form view (for add and edit), specify how fields are displayed. Fields will be displayed horizontally if included in a tuple
     fields = ['first_name', 'last_name', ('dob', 'dod')]
     inlines = [BookInline]
@@ -36,14 +103,29 @@ class BookAdmin(admin.ModelAdmin):
     ## Instead we'll define a display_genre function to get the information as a string.
     ## The function is defined in Methods of Book model in model.py 
     list_display = ('title', 'author', 'display_genre')
+    ## load the authors with the books (one JOIN) instead of one query per row
+    list_select_related = ('author',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ## add Inline class defined above
     inlines = [BookInstanceInline]
+    
+    def get_queryset(self, request):
+        ## display_genre() slices genre.all(), which uses the prefetched genres: one query for the genres of the whole page.
+        ## The search document is never shown in the admin.
+        return super(BookAdmin, self).get_queryset(request).prefetch_related('genre').defer('search_vector')
 admin.site.register(Book, BookAdmin)
 
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'id', 'status', 'due_back','borrower')
+    ## book and borrower are shown on every row (and BookInstance.__str__ uses the book title)
+    list_select_related = ('book', 'borrower')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     ## On list view, add filter to admin site
     list_filter = ('status', 'due_back')
+    ## change the status of all selected copies at once (see loans.change_status())
+    actions = ['mark_available', 'mark_maintenance', 'mark_reserved']
     ## On form view, group fields into sections. 
     ## Each section has its own title (or None, if you don't want a title) and an associated tuple of fields in a dictionary
     fieldsets = (
@@ -52,6 +134,28 @@ class BookInstanceAdmin(admin.ModelAdmin):
             ### section 2
             ('Availability', {'fields':('status', 'due_back','borrower')}),
             )
+    
+    def get_queryset(self, request):
+        ## the changelist skips list_select_related when the queryset already has a select_related(), so repeat it here
+        return (super(BookInstanceAdmin, self).get_queryset(request)
+                .select_related(*self.list_select_related).defer('book__search_vector'))
+    
+    def apply_status(self, request, queryset, status):
+        ## one UPDATE per chunk of copies, whether 10 or 50,000 are selected
+        changed = change_status(queryset, status)
+        self.message_user(request, '%d copies marked as %s.' % (changed, dict(BookInstance.LOAN_STATUS)[status].lower()))
+    
+    def mark_available(self, request, queryset):
+        self.apply_status(request, queryset, 'a')
+    mark_available.short_description = 'Mark selected copies as available'
+    
+    def mark_maintenance(self, request, queryset):
+        self.apply_status(request, queryset, 'm')
+    mark_maintenance.short_description = 'Mark selected copies as in maintenance'
+    
+    def mark_reserved(self, request, queryset):
+        self.apply_status(request, queryset, 'r')
+    mark_reserved.short_description = 'Mark selected copies as reserved'
 admin.site.register(BookInstance, BookInstanceAdmin)
 
 #admin.site.register(Book)
@@ -59,3 +163,41 @@ admin.site.register(BookInstance, BookInstanceAdmin)
 admin.site.register(Genre)
 admin.site.register(Language)
 #admin.site.register(BookInstance)
+
+## the dashboard counters are maintained automatically, so they are shown read-only
+class CatalogStatsAdmin(admin.ModelAdmin):
+    list_display = ('num_books', 'num_instances', 'num_instances_available', 'num_instances_on_loan', 'num_authors', 'num_genre_c', 'updated')
+    readonly_fields = list_display
+    
+    def has_add_permission(self, request):
+        return False
+admin.site.register(CatalogStats, CatalogStatsAdmin)
+
+## notices are written by "manage.py notify_borrowers"; the admin only shows what was sent
+class LoanNoticeAdmin(admin.ModelAdmin):
+    list_display = ('copy', 'borrower', 'kind', 'due_back', 'sent')
+    list_filter = ('kind', 'sent')
+    list_select_related = ('copy__book', 'borrower')
+    readonly_fields = list_display
+    
+    def has_add_permission(self, request):
+        return False
+admin.site.register(LoanNotice, LoanNoticeAdmin)
+
+## slow queries are captured by SlowQueryMiddleware (see slowqueries.py); the admin only browses the buffer, or empties it
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('captured', 'duration_ms', 'view', 'full_scan', 'statement')
+    list_filter = ('full_scan', 'view')
+    search_fields = ('sql', 'view')
+    fields = ('captured', 'duration_ms', 'view', 'full_scan', 'sql', 'plan', 'stack')
+    readonly_fields = fields
+    
+    def statement(self, obj):
+        return Truncator(obj.sql).chars(120)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+admin.site.register(SlowQuery, SlowQueryAdmin)
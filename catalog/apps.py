@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+    
+    def ready(self):
+        # connect the signal handlers that maintain the catalog counters
+        import catalog.signals
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+'''
+Latency benchmark of every page of the site (used by "manage.py benchmark").
+
+Each worker (a thread with its own database connection) plays a session script: one request to every route in
+ROUTES, in order, as an anonymous visitor, a reader or a librarian, and repeats it. The script is ordered so that
+the requests that change data undo each other (borrow then return, create then update then delete), so a run
+leaves the catalog as it found it. Each worker gets its own reader and copies, so workers do not compete for them.
+Requests go through the whole Django stack (middleware, views, templates) with the test client, not over a socket.
+
+For every route the run records the latency of each request and the number of SQL queries it made, and reports
+percentiles (p50/p95/p99), throughput and errors. results() returns them as a dict, saved as JSON by the command.
+'''
+
+import datetime
+import json
+import math
+import platform
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import resolve, reverse
+
+from catalog.models import Book, BookInstance, CatalogStats, Genre, Language
+
+
+## a route of the session script: url_name of the route, who requests it, and a function of the worker's Fixtures
+## returning (method, url, request arguments)
+Route = namedtuple('Route', ['name', 'session', 'request'])
+
+ANONYMOUS, READER, LIBRARIAN = 'anonymous', 'reader', 'librarian'
+
+
+def get(url_name, *args, **params):
+    ## request arguments of a GET of url_name
+    return 'get', reverse(url_name, args=args), {'data': params}
+
+def post(url_name, *args, **data):
+    ## request arguments of a form POST to url_name
+    return 'post', reverse(url_name, args=args), {'data': data}
+
+def post_json(url_name, data):
+    return 'post', reverse(url_name), {'data': json.dumps(data), 'content_type': 'application/json'}
+
+def due_date(weeks):
+    return (datetime.date.today() + datetime.timedelta(weeks=weeks)).isoformat()
+
+def book_form(fixtures, title):
+    return {'title': title, 'author': fixtures.author.pk, 'summary': 'Benchmark book', 'isbn': '9780000000000',
+            'genre': [fixtures.genre.pk], 'language': fixtures.language.pk, 'pubdate': '2018-01-01'}
+
+
+ROUTES = (
+    Route('landing', ANONYMOUS, lambda f: get('landing')),
+    Route('login', ANONYMOUS, lambda f: get('login')),
+    Route('register', ANONYMOUS, lambda f: get('register')),
+    Route('index', READER, lambda f: get('index')),
+    Route('books', READER, lambda f: get('books')),
+    Route('book_search', READER, lambda f: get('book_search', q=f.search_word)),
+    Route('book_details', READER, lambda f: get('book_details', f.popular_book.pk)),
+    Route('authors', READER, lambda f: get('authors')),
+    Route('author_details', READER, lambda f: get('author_details', f.author.pk)),
+    Route('autocomplete_author', READER, lambda f: get('autocomplete_author', q=f.author.last_name[:3])),
+    Route('autocomplete_book', READER, lambda f: get('autocomplete_book', q=f.search_word[:3])),
+    Route('autocomplete_genre', READER, lambda f: get('autocomplete_genre', q=f.genre.name[:3])),
+    Route('my_borrow', READER, lambda f: get('my_borrow')),
+    Route('borrow_book', READER, lambda f: post('borrow_book', f.copy.pk, due_back=due_date(2))),
+    Route('return_book', READER, lambda f: post('return_book', f.copy.pk)),
+    Route('checkout', READER, lambda f: post_json('checkout', {'copies': [str(f.copy.pk)], 'due_back': due_date(2)})),
+    Route('checkin', LIBRARIAN, lambda f: ('post', reverse('checkin'), {'data': str(f.copy.pk), 'content_type': 'text/plain'})),
+    Route('all_borrow', LIBRARIAN, lambda f: get('all_borrow')),
+    Route('overdue', LIBRARIAN, lambda f: get('overdue')),
+    Route('renew-book-librarian', LIBRARIAN, lambda f: post('renew-book-librarian', f.loan.pk, renewal_date=due_date(3))),
+    Route('bulk_renew', LIBRARIAN, lambda f: post_json('bulk_renew', {'borrower': f.reader.username, 'renewal_date': due_date(3)})),
+    Route('book_create', LIBRARIAN, lambda f: post('book_create', **book_form(f, 'Benchmark book'))),
+    Route('book_update', LIBRARIAN, lambda f: post('book_update', f.created['book_create'], **book_form(f, 'Benchmark book (updated)'))),
+    Route('book_delete', LIBRARIAN, lambda f: post('book_delete', f.created['book_create'])),
+    Route('author_create', LIBRARIAN, lambda f: post('author_create', first_name='Bench', last_name='Mark', dob='', dod='')),
+    Route('author_update', LIBRARIAN, lambda f: post('author_update', f.created['author_create'], first_name='Bench', last_name='Marked', dob='', dod='')),
+    Route('author_delete', LIBRARIAN, lambda f: post('author_delete', f.created['author_create'])),
+    Route('export_catalog', LIBRARIAN, lambda f: get('export_catalog', 'books')),
+    Route('admin:index', LIBRARIAN, lambda f: get('admin:index')),
+)
+
+
+class Fixtures(object):
+    ## The records a worker needs: its reader, a copy to borrow and return, a copy kept on loan (to renew),
+    ## and existing records to look at. The catalog itself must exist already (see generate_catalog, or benchmark --seed-books).
+    def __init__(self, number, librarian):
+        self.librarian = librarian
+        self.reader, created = User.objects.get_or_create(username='bench_reader_%d' % number)
+        ## the most copied book of the catalog: the largest details page
+        self.popular_book = Book.objects.exclude(author=None).order_by('-copies_available', 'pk').first()
+        if self.popular_book is None:
+            raise ValueError('The catalog has no books with an author; run generate_catalog first, or pass --seed-books')
+        self.author = self.popular_book.author
+        self.search_word = self.popular_book.title.split()[0]
+        self.genre = self.popular_book.genre.first() or Genre.objects.create(name='Benchmark')
+        self.language = self.popular_book.language or Language.objects.create(name='en')
+        self.book = Book.objects.create(title='Benchmark copies %d' % number, summary='Copies used by the benchmark',
+                                        isbn='9780000000000', author=self.author, language=self.language,
+                                        pubdate=datetime.date.today())
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Benchmark', status='a')
+        self.loan = BookInstance.objects.create(book=self.book, imprint='Benchmark', status='o', borrower=self.reader,
+                                                due_back=datetime.date.today() + datetime.timedelta(weeks=1))
+        ## primary keys of the records created by the *_create routes, for the *_update and *_delete routes
+        self.created = {}
+
+    def delete(self):
+        ## copies outlive their book (on_delete=SET_NULL), so delete them first
+        BookInstance.objects.filter(book=self.book).delete()
+        self.book.delete()
+        self.reader.delete()
+
+
+def host():
+    ## a host name the site accepts (the test client's default, 'testserver', is usually not in ALLOWED_HOSTS)
+    for name in settings.ALLOWED_HOSTS:
+        if name not in ('*', '') and not name.startswith('.'):
+            return name
+    return 'testserver'
+
+
+## result of one request
+Sample = namedtuple('Sample', ['route', 'seconds', 'queries', 'status', 'error'])
+
+
+class QueryCounter(object):
+    ## execute_wrapper() counting the SQL queries of the current thread's connection
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Worker(threading.Thread):
+    def __init__(self, number, librarian, routes, iterations, warmup):
+        super(Worker, self).__init__()
+        self.number = number
+        self.librarian = librarian
+        self.routes = routes
+        self.iterations = iterations
+        self.warmup = warmup
+        self.samples = []
+        self.failure = None
+
+    def run(self):
+        try:
+            fixtures = Fixtures(self.number, self.librarian)
+            try:
+                clients = {session: Client(HTTP_HOST=host()) for session in (ANONYMOUS, READER, LIBRARIAN)}
+                clients[READER].force_login(fixtures.reader)
+                clients[LIBRARIAN].force_login(self.librarian)
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    for iteration in range(self.warmup + self.iterations):
+                        for route in self.routes:
+                            sample = self.request(clients[route.session], route, fixtures, counter)
+                            if iteration >= self.warmup:
+                                self.samples.append(sample)
+            finally:
+                fixtures.delete()
+        except Exception as error:
+            self.failure = error
+        finally:
+            connection.close()
+
+    @staticmethod
+    def request(client, route, fixtures, counter):
+        counter.count = 0
+        started = time.perf_counter()
+        try:
+            method, url, kwargs = route.request(fixtures)
+            response = getattr(client, method)(url, **kwargs)
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    pass
+        except Exception as error:
+            return Sample(route.name, time.perf_counter() - started, counter.count, None, repr(error))
+        seconds = time.perf_counter() - started
+        error = None
+        if response.status_code >= 400:
+            error = 'HTTP %d' % response.status_code
+        elif route.name.endswith('_create'):
+            if response.status_code != 302:
+                error = 'form rejected'
+            else:
+                ## the new record's page, e.g. /catalog/book/12
+                fixtures.created[route.name] = resolve(response.url).kwargs['pk']
+        return Sample(route.name, seconds, counter.count, response.status_code, error)
+
+
+def percentile(values, percent):
+    ## nearest-rank percentile of sorted values
+    if not values:
+        return None
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run(routes=ROUTES, iterations=10, concurrency=1, warmup=1):
+    ## Run the session script iterations times in each of concurrency workers. Return the results (see results()).
+    librarian, created = User.objects.get_or_create(username='bench_librarian',
+                                                   defaults={'is_staff': True, 'is_superuser': True})
+    workers = [Worker(number, librarian, routes, iterations, warmup) for number in range(concurrency)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        if worker.failure is not None:
+            raise worker.failure
+    samples = [sample for worker in workers for sample in worker.samples]
+    return results(samples, elapsed, routes, iterations=iterations, concurrency=concurrency, warmup=warmup)
+
+
+def results(samples, elapsed, routes, **options):
+    stats = CatalogStats.load()
+    database = settings.DATABASES['default']
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'database': connection.vendor,
+            'database_name': str(database['NAME']),
+            'debug': settings.DEBUG,
+            'python': platform.python_version(),
+        },
+        'options': options,
+        'dataset': {name: getattr(stats, name) for name in ('num_books', 'num_authors', 'num_instances', 'num_instances_on_loan')},
+        'elapsed': round(elapsed, 3),
+        'requests': len(samples),
+        'throughput': round(len(samples) / elapsed, 1) if elapsed else None,
+        'errors': sum(1 for sample in samples if sample.error),
+        'routes': {},
+    }
+    for route in routes:
+        route_samples = [sample for sample in samples if sample.route == route.name]
+        latencies = sorted(sample.seconds * 1000 for sample in route_samples)
+        queries = [sample.queries for sample in route_samples]
+        errors = sorted({sample.error for sample in route_samples if sample.error})
+        report['routes'][route.name] = {
+            'session': route.session,
+            'requests': len(route_samples),
+            'errors': sum(1 for sample in route_samples if sample.error),
+            'error_kinds': errors,
+            'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'max_ms': round(latencies[-1], 2) if latencies else None,
+            'queries_mean': round(sum(queries) / len(queries), 1) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+    return report
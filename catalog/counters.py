@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+Bookkeeping for the denormalized copy counters:
+- the per-book counters on Book (copies_available, copies_on_loan, copies_reserved, copies_maintenance)
+- the catalog-wide counters in CatalogStats
+- the number of copies each user has on loan, in BorrowerStats
+
+Every change to a copy (BookInstance) is described as a Transition and passed to record_transitions(),
+which applies the resulting deltas with UPDATE ... SET x = x + n statements.
+Saves and deletes of single copies are recorded by the signal handlers in signals.py.
+Code that changes copies with QuerySet.update() or bulk_create() must call record_transitions() itself,
+inside the same transaction as the change.
+'''
+
+from collections import Counter, defaultdict, namedtuple
+
+from django.db.models import Count, F, Q
+
+from catalog.models import Book, CatalogStats, BorrowerStats
+
+
+## old_status is None for a copy that did not exist before, new_status is None for a deleted copy.
+## The borrowers only matter for copies on loan; they default to None.
+Transition = namedtuple('Transition', ['old_book_id', 'old_status', 'new_book_id', 'new_status',
+                                       'old_borrower_id', 'new_borrower_id'])
+Transition.__new__.__defaults__ = (None, None)
+
+## counter field on Book for each LOAN_STATUS value
+STATUS_COUNTERS = {
+    'm': 'copies_maintenance',
+    'o': 'copies_on_loan',
+    'a': 'copies_available',
+    'r': 'copies_reserved',
+}
+
+
+def record_transitions(transitions):
+    ## Apply the counter deltas of the given transitions. Books with identical deltas share one UPDATE statement.
+    book_deltas = defaultdict(Counter)
+    stats_deltas = Counter()
+    borrower_deltas = Counter()
+    changed_books = set()
+    for old_book_id, old_status, new_book_id, new_status, old_borrower_id, new_borrower_id in transitions:
+        ## any change to a copy (e.g. its due date) changes the cached copies section of its book
+        changed_books.update((old_book_id, new_book_id))
+        if old_status == 'o' and old_borrower_id is not None:
+            borrower_deltas[old_borrower_id] -= 1
+        if new_status == 'o' and new_borrower_id is not None:
+            borrower_deltas[new_borrower_id] += 1
+        if old_book_id == new_book_id and old_status == new_status:
+            continue
+        if old_status in STATUS_COUNTERS and old_book_id is not None:
+            book_deltas[old_book_id][STATUS_COUNTERS[old_status]] -= 1
+        if new_status in STATUS_COUNTERS and new_book_id is not None:
+            book_deltas[new_book_id][STATUS_COUNTERS[new_status]] += 1
+        if old_status is None:
+            stats_deltas['num_instances'] += 1
+        if new_status is None:
+            stats_deltas['num_instances'] -= 1
+        stats_deltas['num_instances_available'] += int(new_status == 'a') - int(old_status == 'a')
+        stats_deltas['num_instances_on_loan'] += int(new_status == 'o') - int(old_status == 'o')
+
+    groups = defaultdict(list)
+    for book_id, deltas in book_deltas.items():
+        deltas = frozenset((name, delta) for name, delta in deltas.items() if delta)
+        if deltas:
+            groups[deltas].append(book_id)
+    ## update the rows in primary key order, so that concurrent transactions lock them in the same order
+    for deltas, book_ids in sorted(groups.items(), key=lambda item: min(item[1])):
+        Book.objects.filter(pk__in=sorted(book_ids)).update(**{name: F(name) + delta for name, delta in deltas})
+
+    CatalogStats.bump(**stats_deltas)
+    BorrowerStats.bump(borrower_deltas)
+    Book.invalidate_copies_cache(*changed_books)
+
+
+def count_copies(books):
+    ## Annotate a Book queryset with the copy counts computed from BookInstance (named like the counters, prefixed 'real_')
+    return books.annotate(**{
+        'real_' + name: Count('bookinstance', filter=Q(bookinstance__status=status))
+        for status, name in STATUS_COUNTERS.items()
+    })
+
+
+def find_drift(books):
+    ## Yield (book, {counter: (stored, counted)}) for every book in the queryset whose counters are off
+    for book in count_copies(books).order_by('pk'):
+        drift = {}
+        for name in STATUS_COUNTERS.values():
+            stored, counted = getattr(book, name), getattr(book, 'real_' + name)
+            if stored != counted:
+                drift[name] = (stored, counted)
+        if drift:
+            yield book, drift
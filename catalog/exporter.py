@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming export of the catalog (used by "manage.py export_catalog" and the staff download view).
+
+Books are exported with their author, language and genre list, and copies (BookInstance) with their book id and
+borrower, as JSON Lines or CSV. The rows are read with QuerySet.iterator(), which uses a server-side cursor on
+PostgreSQL and fetches chunk_size rows at a time, and are written out one line at a time: memory use stays flat
+whatever the size of the catalog. On PostgreSQL the genres of each book are aggregated (ArrayAgg) in the same query;
+other databases (e.g. the SQLite benchmark profile) read them with one query per chunk of books.
+
+The book records use the fields of import_catalog, so an export can be imported again.
+'''
+
+import csv
+import json
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+from catalog.models import Book, BookInstance
+from catalog.loans import chunked
+
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = ('jsonl', 'csv')
+
+BOOK_FIELDS = ('id', 'title', 'summary', 'isbn', 'pubdate', 'author_first_name', 'author_last_name', 'language',
+               'genres', 'copies')
+COPY_FIELDS = ('id', 'book_id', 'imprint', 'status', 'due_back', 'borrower')
+
+
+## pseudo file for csv.writer: write() returns the line instead of storing it, so that rows can be streamed one by one
+class Echo(object):
+    def write(self, value):
+        return value
+
+
+def book_records(chunk_size=EXPORT_CHUNK_SIZE):
+    ## yield one dict per book (fields BOOK_FIELDS), in primary key order
+    books = (Book.objects.order_by('pk')
+             .values('id', 'title', 'summary', 'isbn', 'pubdate', 'author__first_name', 'author__last_name',
+                     'language__name', *Book.COPY_COUNTERS))
+    if connection.vendor == 'postgresql':
+        books = books.annotate(genre_names=ArrayAgg('genre__name', filter=Q(genre__isnull=False))).iterator(chunk_size=chunk_size)
+    else:
+        ## other databases have no array aggregate: read the genres of each chunk of books with one more query
+        books = with_genre_names(books.iterator(chunk_size=chunk_size), chunk_size)
+    for book in books:
+        yield {
+            'id': book['id'],
+            'title': book['title'],
+            'summary': book['summary'],
+            'isbn': book['isbn'],
+            'pubdate': book['pubdate'],
+            'author_first_name': book['author__first_name'],
+            'author_last_name': book['author__last_name'],
+            'language': book['language__name'],
+            'genres': sorted(book['genre_names'] or []),
+            'copies': sum(book[name] for name in Book.COPY_COUNTERS),
+        }
+
+
+def with_genre_names(books, chunk_size):
+    ## add 'genre_names' to book dicts, one query per chunk of books
+    for chunk in chunked(books, chunk_size):
+        genres = defaultdict(list)
+        for book_id, name in (Book.genre.through.objects.filter(book_id__in=[book['id'] for book in chunk])
+                              .values_list('book_id', 'genre__name')):
+            genres[book_id].append(name)
+        for book in chunk:
+            book['genre_names'] = genres[book['id']]
+            yield book
+
+
+def copy_records(chunk_size=EXPORT_CHUNK_SIZE):
+    ## yield one dict per copy (fields COPY_FIELDS), in primary key order
+    copies = BookInstance.objects.order_by('pk').values_list(
+        'id', 'book_id', 'imprint', 'status', 'due_back', 'borrower__username')
+    for row in copies.iterator(chunk_size=chunk_size):
+        yield dict(zip(COPY_FIELDS, row))
+
+
+## records and fields of each kind of export
+EXPORTS = {
+    'books': (book_records, BOOK_FIELDS),
+    'copies': (copy_records, COPY_FIELDS),
+}
+
+
+def export_lines(kind, format, chunk_size=EXPORT_CHUNK_SIZE):
+    ## Yield the export of kind ('books' or 'copies') in format ('jsonl' or 'csv'), one line at a time
+    records, fields = EXPORTS[kind]
+    if format == 'jsonl':
+        for record in records(chunk_size):
+            yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+        return
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for record in records(chunk_size):
+        ## genres are separated by semicolons, as import_catalog expects
+        yield writer.writerow([';'.join(record[name]) if name == 'genres' else record[name] for name in fields])
@@ -72,6 +72,10 @@ class SetReturnDateForm(ModelForm):
         # change label and help_text of due_back field
         labels = {'due_back': _('Return by')}
         help_texts = {'due_back': _('Enter a date between today and 3 weeks')}
+    # the model field is optional (blank=True) for copies not on loan, but a borrower has to give a return date
+    def __init__(self, *args, **kwargs):
+        super(SetReturnDateForm, self).__init__(*args, **kwargs)
+        self.fields['due_back'].required = True
     # define validateion rules for due_back
     def clean_due_back(self):
         data = self.cleaned_data['due_back']
@@ -83,3 +87,108 @@ class SetReturnDateForm(ModelForm):
         else:
             pass
         return data
+
+
+'''
+define select widgets that only render the selected options.
+The other options are fetched from an autocomplete view (e.g. AuthorAutocomplete) as the user types, see static/js/autocomplete.js.
+A plain Select would render one <option> per record of the whole table.
+'''
+from django.urls import reverse
+
+class AutocompleteMixin(object):
+    def __init__(self, url_name, attrs=None, choices=()):
+        super(AutocompleteMixin, self).__init__(attrs, choices)
+        ## name of the URL returning the options as JSON
+        self.url_name = url_name
+    
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super(AutocompleteMixin, self).build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(self.url_name)
+        return attrs
+    
+    def optgroups(self, name, value, attrs=None):
+        ## only load the selected records instead of iterating over every choice
+        selected = [v for v in value if v not in ('', None)]
+        options = []
+        if not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '---------', not selected, 0))
+        if selected:
+            field = self.choices.field
+            try:
+                objects = list(self.choices.queryset.filter(pk__in=selected))
+            except (ValueError, ValidationError):
+                ## invalid values submitted with the form are reported by the form field
+                objects = []
+            for obj in objects:
+                options.append(self.create_option(name, field.prepare_value(obj), field.label_from_instance(obj), True, len(options)))
+        return [(None, options, 0)]
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass
+
+
+'''
+define the forms used by BookCreate and BookUpdate
+'''
+from catalog.models import Book
+
+class BookForm(ModelForm):
+    class Meta:
+        model = Book
+        fields = '__all__'
+        widgets = {
+            'author': AutocompleteSelect('autocomplete_author'),
+            'genre': AutocompleteSelectMultiple('autocomplete_genre'),
+        }
+
+class BookUpdateForm(BookForm):
+    class Meta(BookForm.Meta):
+        fields = ['title', 'author', 'summary', 'genre']
+
+
+'''
+define a form to renew many loans at once (bulk_renew view and "manage.py renew_loans")
+The loans are selected by borrower, book and/or a due date window. They are renewed either until renewal_date
+(checked with the rule of RenewBookForm) or by a number of weeks each, see loans.renew_loans().
+'''
+from django.contrib.auth.models import User
+from catalog.loans import RENEWAL_WEEKS_LIMIT
+
+class BulkRenewForm(RenewBookForm):
+    renewal_date = forms.DateField(required=False, help_text="Renew the loans until this date, at most 12 weeks from now.")
+    weeks = forms.IntegerField(required=False, min_value=1, max_value=RENEWAL_WEEKS_LIMIT,
+                               help_text="Or extend each loan by this many weeks.")
+    borrower = forms.ModelChoiceField(User.objects.all(), required=False, to_field_name='username')
+    book = forms.ModelChoiceField(Book.objects.all(), required=False)
+    due_after = forms.DateField(required=False, help_text="Only loans due on or after this date.")
+    due_before = forms.DateField(required=False, help_text="Only loans due on or before this date.")
+    
+    def clean_renewal_date(self):
+        if self.cleaned_data['renewal_date'] is None:
+            return None
+        return super(BulkRenewForm, self).clean_renewal_date()
+    
+    def clean(self):
+        cleaned_data = super(BulkRenewForm, self).clean()
+        ## a field with an invalid value is already reported
+        given = [name for name in ('renewal_date', 'weeks') if cleaned_data.get(name) is not None or self.has_error(name)]
+        if len(given) != 1:
+            raise ValidationError(_('Give either a renewal date or a number of weeks'))
+        if not any(cleaned_data.get(name) for name in ('borrower', 'book', 'due_after', 'due_before')):
+            ## renewing every loan of the library is not what anyone means by accident
+            raise ValidationError(_('Select the loans by borrower, book or due date'))
+        return cleaned_data
+    
+    def get_loans(self):
+        ## the copies on loan selected by the form
+        filters = {
+            'borrower': self.cleaned_data.get('borrower'),
+            'book': self.cleaned_data.get('book'),
+            'due_back__gte': self.cleaned_data.get('due_after'),
+            'due_back__lte': self.cleaned_data.get('due_before'),
+        }
+        return BookInstance.objects.on_loan().filter(**{name: value for name, value in filters.items() if value is not None})
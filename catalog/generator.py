@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic catalog for benchmarks (used by "manage.py generate_catalog").
+
+The data is skewed the way a real library is: a few authors write many books, a few books have many copies and
+most of the loans, and a few readers borrow most of the books (Zipf distributions). Most copies are available,
+some are in maintenance or reserved, and about a quarter of the loans are overdue.
+Everything is drawn from one random.Random(seed), copy ids included, so the same seed gives the same catalog.
+
+Records are written in batches and never all held in memory: with bulk_create(), and with COPY for the copies
+and the genres of the books on PostgreSQL, where building a model instance per row would take most of the time. The copy counters of each book
+are set when it is inserted; the catalog and borrower counters are recounted at the end (reconcile_stats).
+'''
+
+import csv
+import datetime
+import io
+import itertools
+import uuid
+from bisect import bisect
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.counters import STATUS_COUNTERS
+
+
+GENRES = ('Fantasy', 'Science Fiction', 'Crime', 'Romance', 'Historical Fiction', 'Biography', 'Poetry', 'Comics',
+          'Horror', 'Children', 'Classics', 'Travel', 'Cooking', 'Science', 'Philosophy', 'Economics')
+## share of the books in each language
+LANGUAGES = (('en', 70), ('sp', 15), ('fr', 10), ('cn', 5))
+## share of the copies not on loan in each status
+STATUSES = (('a', 80), ('m', 10), ('r', 10))
+FIRST_NAMES = ('Anna', 'Ben', 'Chen', 'Dara', 'Elena', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jonas', 'Kemi', 'Liam',
+               'Mei', 'Nora', 'Omar', 'Paula', 'Quinn', 'Rosa', 'Sam', 'Tariq', 'Uma', 'Victor', 'Wen', 'Yara')
+LAST_NAMES = ('Smith', 'Garcia', 'Wang', 'Martin', 'Okafor', 'Rossi', 'Dubois', 'Novak', 'Kim', 'Silva', 'Jensen',
+              'Haddad', 'Ivanova', 'Tanaka', 'Murphy', 'Costa', 'Fischer', 'Levi', 'Patel', 'Berg')
+TITLE_WORDS = ('Shadow', 'River', 'Winter', 'Garden', 'Empire', 'Silence', 'Glass', 'Harbor', 'Storm', 'Letters',
+               'Night', 'Mountain', 'Island', 'Machine', 'Memory', 'Crown', 'Forest', 'City', 'Fire', 'Song')
+
+## exponent of the Zipf distributions: the item of rank r is drawn with weight 1 / r ** ZIPF_EXPONENT
+ZIPF_EXPONENT = 0.9
+## a loan is due between OVERDUE_DAYS days ago and LOAN_DAYS days from today
+OVERDUE_DAYS = 10
+LOAN_DAYS = 28
+BATCH_SIZE = 2000
+COPY_FIELDS = ('id', 'book_id', 'imprint', 'status', 'due_back', 'borrower_id')
+
+
+class Zipf(object):
+    ## draw ranks 0..n-1 from a Zipf distribution
+    def __init__(self, n, exponent=ZIPF_EXPONENT):
+        self.cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+    def draw(self, rng):
+        return bisect(self.cum_weights, rng.random() * self.cum_weights[-1])
+
+    def sample(self, rng, k):
+        ## yield k ranks, one at a time
+        for i in range(k):
+            yield self.draw(rng)
+
+
+def weighted(rng, choices):
+    ## draw one value of ((value, weight), ...)
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def insert(model, objects):
+    ## bulk_create() objects and return their primary keys, in order. Databases that do not return ids from bulk inserts
+    ## (e.g. SQLite) number new rows after the largest existing key: the generator must be the only writer.
+    if connection.features.can_return_ids_from_bulk_insert or not objects:
+        model.objects.bulk_create(objects)
+        return [obj.pk for obj in objects]
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    model.objects.bulk_create(objects)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+
+def insert_rows(model, fields, rows):
+    ## Insert rows (tuples of the values of fields, by attribute name). PostgreSQL loads them with COPY, which saves
+    ## building a model instance and compiling an INSERT for every row; other databases use bulk_create().
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create([model(**dict(zip(fields, row))) for row in rows])
+        return
+    data = io.StringIO()
+    ## None is written as \N, which COPY reads as NULL
+    csv.writer(data).writerows([r'\N' if value is None else value for value in row] for row in rows)
+    data.seek(0)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(r"COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\N')" % (
+            connection.ops.quote_name(model._meta.db_table), columns), data)
+
+
+class CatalogGenerator(object):
+    def __init__(self, books, copies_per_book, users, active_loans, seed=0, batch_size=BATCH_SIZE, password=None):
+        self.books = books
+        self.copies_per_book = copies_per_book
+        self.users = users
+        self.active_loans = active_loans
+        self.rng = Random(seed)
+        self.seed = seed
+        self.batch_size = batch_size
+        ## one hash for all the readers: hashing a password takes a while on purpose
+        self.password = make_password(password)
+        self.today = datetime.date.today()
+        ## number of records created, by kind
+        self.created = {}
+
+    def generate(self):
+        user_ids = self.generate_users()
+        author_ids = self.generate_authors()
+        genre_ids = self.get_or_insert(Genre, GENRES)
+        language_ids = dict(zip([code for code, share in LANGUAGES],
+                                self.get_or_insert(Language, [code for code, share in LANGUAGES])))
+        copies, loans = self.plan_copies()
+        self.generate_books(author_ids, genre_ids, language_ids, user_ids, copies, loans)
+
+    def get_or_insert(self, model, names):
+        ## return the primary keys of the records with the given names, inserting the missing ones
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'pk'))
+        missing = [name for name in names if name not in existing]
+        existing.update(zip(missing, insert(model, [model(name=name) for name in missing])))
+        self.created[model._meta.verbose_name_plural] = len(missing)
+        return [existing[name] for name in names]
+
+    def generate_users(self):
+        ## usernames carry the seed, so catalogs generated with different seeds can share a database
+        users = (User(username='reader%d_%d' % (self.seed, number), password=self.password)
+                 for number in range(self.users))
+        user_ids = []
+        for batch in iter(lambda: list(itertools.islice(users, self.batch_size)), []):
+            with transaction.atomic():
+                user_ids.extend(insert(User, batch))
+        self.created['users'] = len(user_ids)
+        return user_ids
+
+    def generate_authors(self):
+        ## about one author per 8 books
+        count = max(1, self.books // 8)
+        authors = [Author(first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                          dob=self.today - datetime.timedelta(days=self.rng.randint(25 * 365, 90 * 365)))
+                   for number in range(count)]
+        author_ids = []
+        for start in range(0, count, self.batch_size):
+            with transaction.atomic():
+                author_ids.extend(insert(Author, authors[start:start + self.batch_size]))
+        self.created['authors'] = len(author_ids)
+        return author_ids
+
+    def plan_copies(self):
+        ## Number of copies and of loans of each book (by book number). Every book has at least one copy;
+        ## the other copies, and the loans, go to the popular books. A book cannot lend more copies than it has.
+        popularity = Zipf(self.books)
+        ## the book of each popularity rank, so that popular books are spread over the catalog
+        book_of_rank = list(range(self.books))
+        self.rng.shuffle(book_of_rank)
+        copies = [1] * self.books
+        for rank in popularity.sample(self.rng, max(0, self.books * (self.copies_per_book - 1))):
+            copies[book_of_rank[rank]] += 1
+        loans = [0] * self.books
+        for rank in popularity.sample(self.rng, self.active_loans):
+            book = book_of_rank[rank]
+            if loans[book] < copies[book]:
+                loans[book] += 1
+        return copies, loans
+
+    def generate_books(self, author_ids, genre_ids, language_ids, user_ids, copies, loans):
+        author_popularity = Zipf(len(author_ids))
+        genre_popularity = Zipf(len(genre_ids))
+        reader_activity = Zipf(len(user_ids)) if user_ids else None
+        self.created.update(books=0, copies=0, loans=0)
+        for start in range(0, self.books, self.batch_size):
+            numbers = range(start, min(start + self.batch_size, self.books))
+            books = []
+            copy_statuses = []
+            for number in numbers:
+                statuses = ['o'] * (loans[number] if reader_activity else 0)
+                statuses += [weighted(self.rng, STATUSES) for copy in range(copies[number] - len(statuses))]
+                copy_statuses.append(statuses)
+                counters = {name: statuses.count(status) for status, name in STATUS_COUNTERS.items()}
+                books.append(Book(
+                    title='%s of the %s' % (self.rng.choice(TITLE_WORDS), self.rng.choice(TITLE_WORDS)),
+                    summary='Synthetic book number %d.' % number,
+                    isbn='978%010d' % self.rng.randrange(10 ** 10),
+                    pubdate=self.today - datetime.timedelta(days=self.rng.randrange(70 * 365)),
+                    author_id=author_ids[author_popularity.draw(self.rng)],
+                    language_id=language_ids[weighted(self.rng, LANGUAGES)],
+                    **counters
+                ))
+
+            with transaction.atomic():
+                book_ids = insert(Book, books)
+                genres = []
+                for book_id in book_ids:
+                    for genre_id in {genre_ids[rank] for rank in genre_popularity.sample(self.rng, self.rng.randint(1, 3))}:
+                        genres.append((book_id, genre_id))
+                insert_rows(Book.genre.through, ('book_id', 'genre_id'), genres)
+                insert_rows(BookInstance, COPY_FIELDS, [
+                    self.make_copy(book_id, status, user_ids, reader_activity)
+                    for book_id, statuses in zip(book_ids, copy_statuses) for status in statuses
+                ])
+            self.created['books'] += len(book_ids)
+            self.created['copies'] += sum(len(statuses) for statuses in copy_statuses)
+            self.created['loans'] += sum(statuses.count('o') for statuses in copy_statuses)
+
+    def make_copy(self, book_id, status, user_ids, reader_activity):
+        ## return the values of COPY_FIELDS for a new copy
+        borrower_id = due_back = None
+        if status == 'o':
+            borrower_id = user_ids[reader_activity.draw(self.rng)]
+            due_back = self.today + datetime.timedelta(days=self.rng.randint(-OVERDUE_DAYS, LOAN_DAYS))
+        return (uuid.UUID(int=self.rng.getrandbits(128), version=4), book_id,
+                'Imprint %d' % self.rng.randint(1950, self.today.year), status, due_back, borrower_id)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+'''
+Bulk loading of books, with their authors, genres, language and copies (used by "manage.py import_catalog").
+
+Records are cleaned one by one and written in batches: one INSERT for the new authors, genres and languages,
+one for the books, one for their genre rows and one for their copies, whatever the size of the batch.
+Authors, genres and languages are found through lookup maps loaded once, instead of a query per record.
+
+bulk_create() does not send the model signals, so the counters are set here: the copy counters are written with
+each book, and CatalogStats is bumped once per batch. The full-text search document of each book is still computed
+by the database trigger (see migration 0010).
+'''
+
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from catalog.models import Author, Book, BookInstance, CatalogStats, Genre, Language
+from catalog.counters import STATUS_COUNTERS
+from catalog.signals import genre_counts_as_c
+
+
+## copies on loan need a borrower, so imported copies can only be available, in maintenance or reserved
+IMPORT_STATUSES = ('a', 'm', 'r')
+
+
+class CatalogImporter(object):
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        ## lookup maps: natural key -> primary key (None for records to be created by a dry run).
+        ## If several records share a name, the latest one is used.
+        self.authors = {(first_name, last_name): pk for pk, first_name, last_name
+                        in Author.objects.order_by('pk').values_list('pk', 'first_name', 'last_name')}
+        self.genres = {name: pk for pk, name in Genre.objects.order_by('pk').values_list('pk', 'name')}
+        self.languages = {name: pk for pk, name in Language.objects.order_by('pk').values_list('pk', 'name')}
+        ## language codes by display name, e.g. 'English' -> 'en'
+        self.language_codes = {display.lower(): code for code, display in Language.LANGUAGE}
+        self.pending = []
+        ## number of records created, by kind
+        self.created = Counter()
+
+    def add(self, record):
+        ## Clean a record (a dict read from the input) and queue it. Raise ValidationError if the record is invalid.
+        self.pending.append(self.clean(record))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def clean(self, record):
+        cleaned = {}
+        errors = {}
+        for name in ('title', 'summary', 'isbn', 'pubdate'):
+            value = self.text(record, name, errors)
+            if name in errors:
+                continue
+            try:
+                cleaned[name] = Book._meta.get_field(name).clean(value or None, None)
+            except ValidationError as error:
+                errors[name] = error.messages
+
+        first_name = self.text(record, 'author_first_name', errors).strip()
+        last_name = self.text(record, 'author_last_name', errors).strip()
+        cleaned['author'] = (first_name, last_name) if first_name or last_name else None
+        for name, value in (('first_name', first_name), ('last_name', last_name)):
+            max_length = Author._meta.get_field(name).max_length
+            if len(value) > max_length:
+                errors['author_' + name] = ['Ensure this value has at most %d characters.' % max_length]
+
+        ## genres are a list in JSON, and separated by semicolons in CSV
+        genres = record.get('genres') or []
+        if isinstance(genres, str):
+            genres = genres.split(';')
+        if not isinstance(genres, list) or not all(isinstance(genre, str) for genre in genres):
+            errors['genres'] = ['Enter a list of genre names.']
+            genres = []
+        cleaned['genres'] = sorted({genre.strip() for genre in genres if genre and genre.strip()})
+        max_length = Genre._meta.get_field('name').max_length
+        if any(len(genre) > max_length for genre in cleaned['genres']):
+            errors['genres'] = ['Genre names are limited to %d characters.' % max_length]
+
+        language = self.text(record, 'language', errors).strip()
+        language = self.language_codes.get(language.lower(), language)
+        if language and language not in dict(Language.LANGUAGE):
+            errors['language'] = ['Unknown language %r.' % language]
+        cleaned['language'] = language or None
+
+        try:
+            cleaned['copies'] = int(record.get('copies') or 0)
+            if cleaned['copies'] < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors['copies'] = ['Enter a number of copies (0 or more).']
+        cleaned['status'] = self.text(record, 'status', errors) or 'a'
+        if cleaned['status'] not in IMPORT_STATUSES:
+            errors['status'] = ['Copy status must be one of %s.' % ', '.join(IMPORT_STATUSES)]
+        cleaned['imprint'] = self.text(record, 'imprint', errors)[:BookInstance._meta.get_field('imprint').max_length]
+
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    @staticmethod
+    def text(record, name, errors):
+        ## the value of a text column, '' if missing; any other type (e.g. a number or a list in JSON) is an error
+        value = record.get(name)
+        if value is None or isinstance(value, str):
+            return value or ''
+        errors[name] = ['Enter a text value.']
+        return ''
+
+    def flush(self):
+        ## write the queued records
+        records, self.pending = self.pending, []
+        if not records:
+            return
+        if self.dry_run:
+            self.resolve(records)
+            return
+        with transaction.atomic():
+            self.write(records)
+
+    def resolve(self, records):
+        ## Make sure every author, genre and language of the records is in the lookup maps, creating the missing ones
+        missing_authors = sorted({record['author'] for record in records if record['author'] and record['author'] not in self.authors})
+        missing_genres = sorted({genre for record in records for genre in record['genres'] if genre not in self.genres})
+        missing_languages = sorted({record['language'] for record in records if record['language'] and record['language'] not in self.languages})
+        self.created.update(authors=len(missing_authors), genres=len(missing_genres), languages=len(missing_languages))
+        if self.dry_run:
+            self.authors.update((key, None) for key in missing_authors)
+            self.genres.update((name, None) for name in missing_genres)
+            self.languages.update((name, None) for name in missing_languages)
+            self.created.update(books=len(records), copies=sum(record['copies'] for record in records))
+            return
+        if missing_authors:
+            self.insert([Author(first_name=first_name, last_name=last_name) for first_name, last_name in missing_authors],
+                        self.authors, lambda author: (author.first_name, author.last_name),
+                        Author.objects.filter(first_name__in={first_name for first_name, last_name in missing_authors},
+                                              last_name__in={last_name for first_name, last_name in missing_authors}))
+        if missing_genres:
+            self.insert([Genre(name=name) for name in missing_genres], self.genres, lambda genre: genre.name,
+                        Genre.objects.filter(name__in=missing_genres))
+        if missing_languages:
+            self.insert([Language(name=name) for name in missing_languages], self.languages, lambda language: language.name,
+                        Language.objects.filter(name__in=missing_languages))
+        CatalogStats.bump(num_authors=len(missing_authors), num_genre_c=sum(1 for name in missing_genres if genre_counts_as_c(name)))
+
+    @staticmethod
+    def insert(objects, lookup, key, inserted):
+        ## Insert objects and add them to lookup. bulk_create() fills in the primary keys on PostgreSQL;
+        ## on other databases they are read back from the inserted queryset.
+        type(objects[0]).objects.bulk_create(objects)
+        if not connection.features.can_return_ids_from_bulk_insert:
+            objects = inserted.order_by('pk')
+        for obj in objects:
+            lookup[key(obj)] = obj.pk
+
+    def write(self, records):
+        self.resolve(records)
+        books = []
+        for record in records:
+            statuses = Counter({record['status']: record['copies']})
+            books.append(Book(
+                title=record['title'],
+                summary=record['summary'],
+                isbn=record['isbn'],
+                pubdate=record['pubdate'],
+                author_id=self.authors[record['author']] if record['author'] else None,
+                language_id=self.languages[record['language']] if record['language'] else None,
+                **{name: statuses[status] for status, name in STATUS_COUNTERS.items()}
+            ))
+        if connection.features.can_return_ids_from_bulk_insert:
+            Book.objects.bulk_create(books)
+        else:
+            ## without the new primary keys the genres and copies cannot be linked, so insert the books one by one;
+            ## a raw save skips the signal handlers but also pre_save(), so create_dt (auto_now_add) is set here
+            now = timezone.now()
+            for book in books:
+                book.create_dt = now
+                book.save_base(raw=True)
+
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=self.genres[genre])
+            for book, record in zip(books, records) for genre in record['genres']
+        ])
+        BookInstance.objects.bulk_create([
+            BookInstance(book_id=book.pk, imprint=record['imprint'], status=record['status'])
+            for book, record in zip(books, records) for copy in range(record['copies'])
+        ], batch_size=self.batch_size)
+
+        copies = sum(record['copies'] for record in records)
+        available = sum(record['copies'] for record in records if record['status'] == 'a')
+        CatalogStats.bump(num_books=len(books), num_instances=copies, num_instances_available=available)
+        self.created.update(books=len(books), copies=copies)
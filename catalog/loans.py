@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+Loan transitions of copies (BookInstance), done as single conditional UPDATE statements.
+
+The status check is part of the WHERE clause, so the database decides which of several concurrent
+requests wins: exactly one UPDATE matches the row, the others match nothing and "lose the race".
+Only the changed columns are written.
+UPDATE does not send model signals, so the copy counters are recorded here (see counters.py).
+'''
+
+import datetime
+import uuid
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, DateField, Q, Value, When
+
+from catalog.models import BookInstance
+from catalog.counters import Transition, record_transitions
+from catalog.metrics import count_loan_event
+
+
+def borrow_copy(copy, borrower, due_back):
+    ## Lend an available copy to borrower. Return False if the copy is not available (any more).
+    with transaction.atomic():
+        claimed = BookInstance.objects.filter(pk=copy.pk, book_id=copy.book_id, status='a').update(
+            status='o', borrower=borrower, due_back=due_back)
+        if not claimed:
+            return False
+        record_transitions([Transition(copy.book_id, 'a', copy.book_id, 'o', new_borrower_id=borrower.pk)])
+    count_loan_event('borrow')
+    copy.status, copy.borrower, copy.due_back = 'o', borrower, due_back
+    copy.remember_loaded_values('status', 'borrower_id', 'due_back')
+    return True
+
+
+def return_copy(copy, borrower):
+    ## Take back a copy lent to borrower. Return False if the copy is not on loan to borrower (any more).
+    with transaction.atomic():
+        returned = BookInstance.objects.filter(pk=copy.pk, book_id=copy.book_id, status='o', borrower=borrower).update(
+            status='a', borrower=None, due_back=None)
+        if not returned:
+            return False
+        record_transitions([Transition(copy.book_id, 'o', copy.book_id, 'a', old_borrower_id=borrower.pk)])
+    count_loan_event('return')
+    copy.status, copy.borrower, copy.due_back = 'a', None, None
+    copy.remember_loaded_values('status', 'borrower_id', 'due_back')
+    return True
+
+
+## per-copy results of checkout_copies()
+BORROWED = 'borrowed'
+UNAVAILABLE = 'unavailable'
+UNKNOWN = 'unknown'
+
+
+def checkout_copies(copy_ids, borrower, due_back):
+    ## Lend several copies to borrower in one transaction. Return {copy id: BORROWED, UNAVAILABLE or UNKNOWN}.
+    ## Available copies are locked and claimed with one UPDATE; the others are reported, they do not stop the checkout.
+    copy_ids = set(copy_ids)
+    with transaction.atomic():
+        ## a concurrent checkout of the same copies waits here, then sees them as no longer available
+        claimable = dict(BookInstance.objects.select_for_update()
+                         .filter(pk__in=copy_ids, status='a').values_list('pk', 'book_id'))
+        if claimable:
+            BookInstance.objects.filter(pk__in=claimable).update(status='o', borrower=borrower, due_back=due_back)
+            record_transitions([Transition(book_id, 'a', book_id, 'o', new_borrower_id=borrower.pk)
+                                for book_id in claimable.values()])
+    count_loan_event('borrow', len(claimable))
+    existing = set(BookInstance.objects.filter(pk__in=copy_ids - set(claimable)).values_list('pk', flat=True))
+    results = {}
+    for copy_id in copy_ids:
+        if copy_id in claimable:
+            results[copy_id] = BORROWED
+        elif copy_id in existing:
+            results[copy_id] = UNAVAILABLE
+        else:
+            results[copy_id] = UNKNOWN
+    return results
+
+
+## result of checkin_copies(): number of copies returned, and the ids that were not on loan or do not exist
+CheckinResult = namedtuple('CheckinResult', ['returned', 'not_on_loan', 'unknown'])
+
+CHECKIN_CHUNK_SIZE = 1000
+
+
+def checkin_copies(copy_ids, chunk_size=CHECKIN_CHUNK_SIZE):
+    ## Take back the given copies, whoever borrowed them (e.g. returned books scanned in by a librarian).
+    ## copy_ids can be any iterable (e.g. a generator reading a file); it is consumed in chunks, one transaction per chunk.
+    returned = 0
+    not_on_loan = []
+    unknown = []
+    for chunk in chunked(copy_ids, chunk_size):
+        chunk = set(chunk)
+        with transaction.atomic():
+            on_loan = {copy_id: (book_id, borrower_id) for copy_id, book_id, borrower_id in BookInstance.objects
+                       .select_for_update().filter(pk__in=chunk, status='o').values_list('pk', 'book_id', 'borrower_id')}
+            if on_loan:
+                BookInstance.objects.filter(pk__in=on_loan).update(status='a', borrower=None, due_back=None)
+                record_transitions([Transition(book_id, 'o', book_id, 'a', old_borrower_id=borrower_id)
+                                    for book_id, borrower_id in on_loan.values()])
+        count_loan_event('return', len(on_loan))
+        returned += len(on_loan)
+        others = chunk - set(on_loan)
+        existing = set(BookInstance.objects.filter(pk__in=others).values_list('pk', flat=True))
+        not_on_loan.extend(sorted(existing, key=str))
+        unknown.extend(sorted(others - existing, key=str))
+    return CheckinResult(returned, not_on_loan, unknown)
+
+
+def chunked(iterable, size):
+    ## yield lists of at most size items from iterable
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_copy_ids(lines, invalid):
+    ## Yield the UUIDs found in lines of text (one per line, blank lines ignored). Other lines are appended to invalid.
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield uuid.UUID(line)
+        except ValueError:
+            invalid.append(line)
+
+
+## result of renew_loans(): number of loans renewed, and (copy id, due date) of the loans that could not be renewed
+RenewalResult = namedtuple('RenewalResult', ['renewed', 'rejected'])
+
+## a loan cannot be renewed beyond this many weeks from today (the rule of RenewBookForm)
+RENEWAL_WEEKS_LIMIT = 12
+RENEWAL_CHUNK_SIZE = 1000
+
+
+def renew_loans(loans, renewal_date=None, weeks=None, chunk_size=RENEWAL_CHUNK_SIZE):
+    ## Renew the copies on loan in the loans queryset, either until renewal_date or by extending each loan by weeks
+    ## (counted from its due date, or from today if it is already overdue). The loans are locked and updated chunk by chunk,
+    ## one UPDATE per chunk. Loans that would end more than RENEWAL_WEEKS_LIMIT weeks ahead, or (with renewal_date)
+    ## are already due later, are left as they are and reported.
+    today = datetime.date.today()
+    if renewal_date is not None:
+        ## renewing must not shorten a loan
+        within_limit = Q(due_back__isnull=True) | Q(due_back__lte=renewal_date)
+    else:
+        extension = datetime.timedelta(weeks=weeks)
+        latest = today + datetime.timedelta(weeks=RENEWAL_WEEKS_LIMIT) - extension
+        within_limit = Q(due_back__isnull=True) | Q(due_back__lte=latest)
+
+    loans = loans.filter(status__exact='o').order_by('pk')
+    renewed = 0
+    rejected = []
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            chunk = loans if last_pk is None else loans.filter(pk__gt=last_pk)
+            chunk = list(chunk.select_for_update().values_list('pk', 'book_id', 'due_back')[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            copies = BookInstance.objects.filter(pk__in=[pk for pk, book_id, due_back in chunk])
+            rejected.extend(copies.exclude(within_limit).order_by('pk').values_list('pk', 'due_back'))
+            if renewal_date is not None:
+                new_due_back = Value(renewal_date)
+            else:
+                ## one CASE branch per due date in the chunk, so that the dates are computed without database-specific date arithmetic
+                due_dates = {due_back for pk, book_id, due_back in chunk if due_back is not None and due_back > today}
+                new_due_back = Case(
+                    *[When(due_back=due_back, then=Value(due_back + extension)) for due_back in sorted(due_dates)],
+                    default=Value(today + extension), output_field=DateField())
+            count = copies.filter(within_limit).update(due_back=new_due_back)
+            renewed += count
+            if count:
+                ## nothing but the due dates changes; this drops the cached copies section of the books
+                record_transitions([Transition(book_id, 'o', book_id, 'o') for book_id in {book_id for pk, book_id, due_back in chunk}])
+    count_loan_event('renew', renewed)
+    return RenewalResult(renewed, rejected)
+
+
+STATUS_CHUNK_SIZE = 5000
+
+
+def change_status(copies, status, borrower=None, due_back=None, chunk_size=STATUS_CHUNK_SIZE):
+    ## Set the status of all the copies in a queryset, e.g. a shipment moved from maintenance to the shelves.
+    ## A copy that is not on loan has no borrower and no due date, so these are cleared, unless status is 'o':
+    ## then only available copies are lent, to borrower until due_back. Copies already in the status are left alone.
+    ## The copies are locked and updated chunk by chunk, one UPDATE per chunk. Return the number of copies changed.
+    if status not in dict(BookInstance.LOAN_STATUS):
+        raise ValueError('Unknown status %r' % status)
+    if status == 'o':
+        if borrower is None or due_back is None:
+            raise ValueError('Copies on loan need a borrower and a due date')
+        copies = copies.filter(status__exact='a')
+        values = {'status': status, 'borrower': borrower, 'due_back': due_back}
+    else:
+        copies = copies.exclude(status__exact=status)
+        values = {'status': status, 'borrower': None, 'due_back': None}
+    new_borrower_id = borrower.pk if borrower is not None and status == 'o' else None
+
+    copies = copies.order_by('pk')
+    changed = 0
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            chunk = copies if last_pk is None else copies.filter(pk__gt=last_pk)
+            chunk = list(chunk.select_for_update().values_list('pk', 'book_id', 'status', 'borrower_id')[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            BookInstance.objects.filter(pk__in=[pk for pk, book_id, old_status, old_borrower_id in chunk]).update(**values)
+            record_transitions([Transition(book_id, old_status, book_id, status, old_borrower_id, new_borrower_id)
+                                for pk, book_id, old_status, old_borrower_id in chunk])
+            changed += len(chunk)
+    return changed
@@ -0,0 +1,88 @@
+'''
+This script measures the latency of every page of the site (see catalog/benchmark.py) and saves the results as JSON,
+so that runs can be compared. Run it against a benchmark database (see locallibrary/settings_bench.py):
+python manage.py migrate --settings=locallibrary.settings_bench
+python manage.py generate_catalog --books 100000 --copies-per-book 5 --users 1000 --active-loans 20000 --settings=locallibrary.settings_bench
+python manage.py benchmark --iterations 50 --output bench.json --settings=locallibrary.settings_bench
+python manage.py benchmark --routes books,book_details --compare bench.json --settings=locallibrary.settings_bench
+--seed-books fills the catalog up to that many books first (with generate_catalog, readers and loans scaled
+to the number of books added); a database that holds that many books already is used as it is:
+python manage.py benchmark --seed-books 100000 --output bench.json --settings=locallibrary.settings_bench
+'''
+
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmark import ROUTES, run
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency and queries of every route, and report p50/p95/p99 and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10, help='Requests per route and worker (default 10)')
+        parser.add_argument('--warmup', type=int, default=1, help='Unmeasured rounds before the measured ones (default 1)')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of workers sending requests at the same time (default 1)')
+        parser.add_argument('--routes', help='Comma-separated route names to run (default: all): %s' % ', '.join(
+            route.name for route in ROUTES))
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--seed-books', dest='seed_books', type=int, default=0,
+                            help='Generate books first until the catalog holds this many (default: use the catalog as it is)')
+
+    def handle(self, *args, **options):
+        routes = ROUTES
+        if options['routes']:
+            names = options['routes'].split(',')
+            unknown = set(names) - {route.name for route in ROUTES}
+            if unknown:
+                raise CommandError('Unknown routes: %s' % ', '.join(sorted(unknown)))
+            routes = [route for route in ROUTES if route.name in names]
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                baseline = json.load(previous)['routes']
+
+        existing = Book.objects.count()
+        if options['seed_books'] > existing:
+            self.seed(options['seed_books'] - existing, existing)
+
+        try:
+            report = run(routes, options['iterations'], options['concurrency'], options['warmup'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write('%-22s %-9s %8s %8s %8s %8s %7s %6s' % (
+            'route', 'session', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'queries', 'errors'))
+        for name, route in report['routes'].items():
+            line = '%-22s %-9s %8s %8s %8s %8s %7s %6d' % (
+                name, route['session'], route['p50_ms'], route['p95_ms'], route['p99_ms'], route['max_ms'],
+                route['queries_mean'], route['errors'])
+            if baseline and baseline.get(name, {}).get('p95_ms') and route['p95_ms'] is not None:
+                line += '  p95 %+.0f%%' % (100.0 * route['p95_ms'] / baseline[name]['p95_ms'] - 100)
+            self.stdout.write(line)
+        for name, route in report['routes'].items():
+            if route['error_kinds']:
+                self.stdout.write(self.style.WARNING('%s: %s' % (name, ', '.join(route['error_kinds']))))
+        self.stdout.write('%d requests in %.1fs: %.1f requests/s, %d errors (%s, %s books)' % (
+            report['requests'], report['elapsed'], report['throughput'] or 0, report['errors'],
+            report['environment']['database'], report['dataset']['num_books']))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS('Results saved to %s' % options['output']))
+
+    def seed(self, books, existing):
+        ## Add books to the catalog, with one reader per 20 books and one copy in 5 on loan. The seed of the generator
+        ## (which names the readers) is the number of books already there, so that topping up a catalog works.
+        self.stdout.write('Generating %d books...' % books)
+        out = StringIO()
+        call_command('generate_catalog', books=books, copies_per_book=3, users=max(books // 20, 10),
+                     active_loans=books * 3 // 5, seed=existing, stdout=out)
+        self.stdout.write(out.getvalue().strip())
@@ -0,0 +1,38 @@
+'''
+This script checks in returned copies (BookInstance) from a list of copy ids, one per line,
+e.g. exported from a barcode scanner. The list is read line by line and checked in in chunks.
+python manage.py checkin_books returns.txt
+python manage.py checkin_books < returns.txt
+'''
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from catalog.loans import CHECKIN_CHUNK_SIZE, checkin_copies, parse_copy_ids
+
+
+class Command(BaseCommand):
+    help = 'Check in returned copies, given one copy id per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default='-',
+                            help='File with one copy id per line (default: read standard input)')
+        parser.add_argument('--chunk-size', type=int, default=CHECKIN_CHUNK_SIZE,
+                            help='Number of copies checked in per transaction (default %d)' % CHECKIN_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        invalid = []
+        if options['file'] == '-':
+            result = checkin_copies(parse_copy_ids(sys.stdin, invalid), options['chunk_size'])
+        else:
+            with open(options['file'], encoding='utf-8') as lines:
+                result = checkin_copies(parse_copy_ids(lines, invalid), options['chunk_size'])
+
+        for copy_id in result.not_on_loan:
+            self.stdout.write('Not on loan: %s' % copy_id)
+        for copy_id in result.unknown:
+            self.stdout.write('Unknown copy: %s' % copy_id)
+        for line in invalid:
+            self.stdout.write('Invalid id: %s' % line)
+        self.stdout.write(self.style.SUCCESS('Checked in %d copies.' % result.returned))
@@ -0,0 +1,32 @@
+'''
+This script exports the books (with author, language and genres) or the copies of the catalog,
+as JSON Lines or CSV, e.g. for analytics or backups. The rows are streamed, so memory use stays flat.
+An export of books can be imported again with import_catalog.
+python manage.py export_catalog books > books.jsonl
+python manage.py export_catalog copies --format csv --output copies.csv
+'''
+
+from django.core.management.base import BaseCommand
+
+from catalog.exporter import EXPORT_CHUNK_SIZE, EXPORTS, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Export the books or copies of the catalog as JSON Lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl', help='Output format (default jsonl)')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Number of rows fetched from the database at a time (default %d)' % EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        lines = export_lines(options['kind'], options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            ## self.stdout adds a newline to every write; the lines already end with one
+            for line in lines:
+                self.stdout.write(line, ending='')
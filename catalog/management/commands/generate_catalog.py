@@ -0,0 +1,51 @@
+'''
+This script fills the database with a synthetic catalog for benchmarks: authors, genres, languages, books,
+copies and readers, with realistic skew (see catalog/generator.py). The same --seed gives the same catalog.
+The catalog and borrower counters are recounted at the end.
+python manage.py generate_catalog --books 1000000 --copies-per-book 10 --users 50000 --active-loans 200000
+python manage.py generate_catalog --books 1000 --seed 7
+'''
+
+import time
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from catalog.generator import BATCH_SIZE, CatalogGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog of books, copies, readers and loans for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000, help='Number of books (default 1000)')
+        parser.add_argument('--copies-per-book', dest='copies_per_book', type=int, default=3,
+                            help='Average number of copies per book, at least 1 (default 3)')
+        parser.add_argument('--users', type=int, default=100, help='Number of readers (default 100)')
+        parser.add_argument('--active-loans', dest='active_loans', type=int, default=100,
+                            help='Number of copies on loan (default 100); fewer if the popular books run out of copies')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default 0)')
+        parser.add_argument('--password', help='Password of the readers (default: they cannot log in)')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=BATCH_SIZE,
+                            help='Number of records per INSERT (default %d)' % BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['books'] < 0 or options['copies_per_book'] < 1 or options['users'] < 0 or options['active_loans'] < 0:
+            raise CommandError('Counts cannot be negative, and every book has at least one copy')
+        if User.objects.filter(username__startswith='reader%d_' % options['seed']).exists():
+            raise CommandError('Readers of seed %d already exist; use another --seed' % options['seed'])
+
+        started = time.perf_counter()
+        generator = CatalogGenerator(options['books'], options['copies_per_book'], options['users'],
+                                     options['active_loans'], options['seed'], options['batch_size'], options['password'])
+        generator.generate()
+        ## bulk_create() sends no signals: recount the catalog and borrower counters
+        call_command('reconcile_stats', stdout=StringIO())
+
+        created = generator.created
+        self.stdout.write(self.style.SUCCESS(
+            'Generated %d books, %d copies (%d on loan), %d authors, %d genres, %d languages and %d readers in %.1fs.' % (
+                created['books'], created['copies'], created['loans'], created['authors'], created['genres'],
+                created['languages'], created['users'], time.perf_counter() - started)))
@@ -0,0 +1,97 @@
+'''
+This script imports books, with their author, genres, language and copies, from a CSV or JSON Lines file.
+Each record has the fields title, summary, isbn, pubdate (YYYY-MM-DD), author_first_name, author_last_name,
+genres (a list in JSON, separated by ";" in CSV), language (code or name, e.g. en or English),
+copies (number of copies to create), status (a, m or r; default a) and imprint.
+The file is read record by record and written in batches (see catalog/importer.py).
+Invalid records are skipped and reported with their line number; --errors writes them to a JSON Lines file.
+python manage.py import_catalog books.csv
+python manage.py import_catalog books.jsonl --dry-run --errors rejected.jsonl
+python manage.py import_catalog --format jsonl < books.jsonl
+'''
+
+import csv
+import json
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importer import CatalogImporter
+
+
+FORMATS = ('csv', 'jsonl')
+
+
+def read_records(lines, format):
+    ## Yield (line number, record) for each record of the input; a record that cannot be parsed is a str (the error)
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield line_number, 'Invalid JSON: %s' % error
+            continue
+        yield line_number, record if isinstance(record, dict) else 'Expected a JSON object'
+
+
+class Command(BaseCommand):
+    help = 'Import books, authors, genres, languages and copies from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default='-', help='CSV or JSON Lines file (default: read standard input)')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format (default: from the file extension, .csv or .jsonl)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of books written per batch (default 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Check the records without writing anything')
+        parser.add_argument('--errors', help='Write the rejected records and their errors to this JSON Lines file')
+
+    def handle(self, *args, **options):
+        format = options['format']
+        if format is None:
+            format = options['file'].rsplit('.', 1)[-1].lower()
+            format = {'json': 'jsonl', 'ndjson': 'jsonl'}.get(format, format)
+            if format not in FORMATS:
+                raise CommandError('Cannot tell the format of %s, use --format' % options['file'])
+
+        importer = CatalogImporter(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        rejected = []
+        if options['file'] == '-':
+            self.load(importer, read_records(sys.stdin, format), rejected)
+        else:
+            with open(options['file'], encoding='utf-8', newline='') as lines:
+                self.load(importer, read_records(lines, format), rejected)
+
+        for line_number, errors, record in rejected:
+            self.stdout.write('Line %d: %s' % (line_number, '; '.join(
+                '%s: %s' % (name, ' '.join(messages)) for name, messages in sorted(errors.items()))))
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8') as report:
+                for line_number, errors, record in rejected:
+                    report.write(json.dumps({'line': line_number, 'errors': errors, 'record': record}) + '\n')
+
+        created = importer.created
+        summary = '%d books, %d copies, %d authors, %d genres and %d languages; %d records rejected.' % (
+            created['books'], created['copies'], created['authors'], created['genres'], created['languages'], len(rejected))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Dry run, nothing written. Would import ' + summary))
+        else:
+            self.stdout.write(self.style.SUCCESS('Imported ' + summary))
+
+    @staticmethod
+    def load(importer, records, rejected):
+        for line_number, record in records:
+            if isinstance(record, str):
+                rejected.append((line_number, {'record': [record]}, None))
+                continue
+            try:
+                importer.add(record)
+            except ValidationError as error:
+                rejected.append((line_number, error.message_dict, record))
+        importer.flush()
@@ -0,0 +1,137 @@
+'''
+This script emails every borrower one digest of their loans that are overdue or due within the next few days.
+Each loan is only reminded once per due date (see LoanNotice), so the script can be run daily (e.g. from cron),
+re-run after a failure, or interrupted: the next run only sends what has not been sent yet.
+python manage.py notify_borrowers
+python manage.py notify_borrowers --days 3 --dry-run   # only count the digests that would be sent
+'''
+
+import datetime
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.conf import settings
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Exists, OuterRef, Q, Value, When
+
+from catalog.models import BookInstance, LoanNotice
+
+
+class Command(BaseCommand):
+    help = 'Email borrowers a digest of their overdue and soon due loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3,
+                            help='Remind loans due within this many days (default 3)')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Count the digests without sending them')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of loans fetched from the database at a time (default 2000)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of digests whose notices are recorded together before sending (default 100)')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        ## the loans to remind, one borrower after the other; notices already sent are left out,
+        ## which is what makes the job resumable
+        loans = (BookInstance.objects.on_loan()
+                 .filter(borrower__isnull=False, due_back__lte=today + datetime.timedelta(days=options['days']))
+                 .annotate(kind=Case(When(due_back__lt=today, then=Value(LoanNotice.OVERDUE)),
+                                     default=Value(LoanNotice.DUE_SOON), output_field=CharField()))
+                 .annotate(noticed=Exists(LoanNotice.objects.filter(copy=OuterRef('pk'), borrower=OuterRef('borrower'),
+                                                                    kind=OuterRef('kind'), due_back=OuterRef('due_back'))))
+                 .filter(noticed=False)
+                 .order_by('borrower_id', 'due_back', 'id')
+                 .values_list('id', 'kind', 'due_back', 'book__title', 'borrower_id', 'borrower__username', 'borrower__email'))
+
+        sent = skipped = 0
+        ## (message, notices) of the borrowers of the current batch
+        digests = []
+        connection = None if options['dry_run'] else mail.get_connection()
+        if connection is not None:
+            connection.open()
+        try:
+            ## iterator() streams the rows (with a server-side cursor on PostgreSQL), one borrower is held in memory at a time
+            for borrower_id, rows in groupby(loans.iterator(chunk_size=options['chunk_size']), key=lambda row: row[4]):
+                rows = list(rows)
+                username, email = rows[0][5], rows[0][6]
+                if not email:
+                    skipped += 1
+                    continue
+                if options['dry_run']:
+                    sent += 1
+                    continue
+                digests.append((self.digest(username, email, rows),
+                                [LoanNotice(copy_id=copy_id, borrower_id=borrower_id, kind=kind, due_back=due_back)
+                                 for copy_id, kind, due_back, title, _, _, _ in rows]))
+                if len(digests) >= options['batch_size']:
+                    sent += self.flush(connection, digests)
+            if digests:
+                sent += self.flush(connection, digests)
+        finally:
+            if connection is not None:
+                connection.close()
+
+        if options['dry_run']:
+            self.stdout.write('%d digests to send, %d borrowers without an email address.' % (sent, skipped))
+        else:
+            self.stdout.write(self.style.SUCCESS('Sent %d digests, skipped %d borrowers without an email address.' % (sent, skipped)))
+
+    def flush(self, connection, digests):
+        ## Record the notices of a batch of digests, then send the digests over the open connection; return the number sent.
+        ## Recording first claims the loans: a run started at the same time skips them instead of mailing them again.
+        ## The digests are sent one at a time (still over one SMTP connection), so that if sending fails, only the claims
+        ## of the digests not sent yet are released: the next run sends those, and only those.
+        claimed = self.claim(digests)
+        for number, (message, notices) in enumerate(claimed):
+            try:
+                connection.send_messages([message])
+            except Exception:
+                unsent = [notice for message, notices in claimed[number:] for notice in notices]
+                LoanNotice.objects.filter(reduce(or_, (Q(copy_id=notice.copy_id, borrower_id=notice.borrower_id,
+                                                         kind=notice.kind, due_back=notice.due_back)
+                                                       for notice in unsent))).delete()
+                raise
+        del digests[:]
+        return len(claimed)
+
+    @staticmethod
+    def claim(digests):
+        ## Insert the notices of the digests and return the digests whose notices were all inserted. The batch is inserted
+        ## at once; if another run recorded some of its notices in the meantime, each borrower is claimed on its own and
+        ## the borrowers already (even partly) claimed are left out: their other loans are reminded by the next run.
+        try:
+            with transaction.atomic():
+                LoanNotice.objects.bulk_create([notice for message, notices in digests for notice in notices])
+            return list(digests)
+        except IntegrityError:
+            pass
+        claimed = []
+        for message, notices in digests:
+            try:
+                with transaction.atomic():
+                    LoanNotice.objects.bulk_create(notices)
+            except IntegrityError:
+                continue
+            claimed.append((message, notices))
+        return claimed
+
+    @staticmethod
+    def digest(username, email, rows):
+        lines = ['Dear %s,' % username, '']
+        overdue = [row for row in rows if row[1] == LoanNotice.OVERDUE]
+        due_soon = [row for row in rows if row[1] == LoanNotice.DUE_SOON]
+        if overdue:
+            lines.append('These books are overdue, please return them as soon as possible:')
+            lines.extend('- %s (due %s)' % (row[3], row[2]) for row in overdue)
+            lines.append('')
+        if due_soon:
+            lines.append('These books are due soon:')
+            lines.extend('- %s (due %s)' % (row[3], row[2]) for row in due_soon)
+            lines.append('')
+        lines.append('Local Library')
+        subject = 'Overdue books' if overdue else 'Books due soon'
+        return mail.EmailMessage(subject, '\n'.join(lines), settings.DEFAULT_FROM_EMAIL, [email])
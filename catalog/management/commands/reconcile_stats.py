@@ -0,0 +1,68 @@
+'''
+This script recounts the catalog statistics shown on the dashboard, and the number of loans of every borrower,
+and fixes any drift in the stored counters.
+Run it periodically (e.g. from cron):
+python manage.py reconcile_stats
+python manage.py reconcile_stats --dry-run   # only report drift
+'''
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from catalog.models import BookInstance, BorrowerStats, CatalogStats
+
+
+class Command(BaseCommand):
+    help = 'Recount the catalog statistics (CatalogStats) and the loans of each borrower (BorrowerStats), and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Report drift without changing the stored counters')
+
+    def handle(self, *args, **options):
+        self.reconcile_catalog(options['dry_run'])
+        self.reconcile_borrowers(options['dry_run'])
+
+    def reconcile_catalog(self, dry_run):
+        with transaction.atomic():
+            ## lock the stats row so that concurrent bumps wait until the recount is stored
+            stats = CatalogStats.objects.select_for_update().filter(pk=CatalogStats.SINGLETON_ID).first()
+            counts = CatalogStats.count_all()
+            drift = {}
+            for name, value in counts.items():
+                stored = getattr(stats, name) if stats else None
+                if stored != value:
+                    drift[name] = (stored, value)
+
+            if not drift:
+                self.stdout.write('Catalog stats are up to date.')
+                return
+            for name, (stored, value) in sorted(drift.items()):
+                self.stdout.write('%s: stored %s, counted %s' % (name, stored, value))
+            if dry_run:
+                return
+            CatalogStats.objects.update_or_create(pk=CatalogStats.SINGLETON_ID, defaults=counts)
+            self.stdout.write(self.style.SUCCESS('Fixed %d counter(s).' % len(drift)))
+
+    def reconcile_borrowers(self, dry_run):
+        with transaction.atomic():
+            ## lock the stored counters, then count the loans of all borrowers in one query
+            stored = dict(BorrowerStats.objects.select_for_update().values_list('user_id', 'active_loans'))
+            counted = dict(BookInstance.objects.filter(status__exact='o', borrower__isnull=False)
+                           .order_by().values('borrower').annotate(n=Count('id')).values_list('borrower', 'n'))
+            ## a borrower without a row is only drift if they have loans; load() creates the row on demand
+            drift = {user_id: (stored.get(user_id), counted.get(user_id, 0))
+                     for user_id in set(stored) | set(counted)
+                     if stored.get(user_id, 0) != counted.get(user_id, 0)}
+
+            if not drift:
+                self.stdout.write('Borrower stats are up to date.')
+                return
+            for user_id, (old, new) in sorted(drift.items()):
+                self.stdout.write('loans of user %s: stored %s, counted %s' % (user_id, old, new))
+            if dry_run:
+                return
+            for user_id, (old, new) in drift.items():
+                BorrowerStats.objects.update_or_create(pk=user_id, defaults={'active_loans': new})
+            self.stdout.write(self.style.SUCCESS('Fixed %d borrower counter(s).' % len(drift)))
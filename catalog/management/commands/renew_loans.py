@@ -0,0 +1,36 @@
+'''
+This script renews many loans at once, e.g. all the loans of a borrower or all loans due in a given week.
+python manage.py renew_loans --borrower jane --weeks 3
+python manage.py renew_loans --due-after 2018-12-17 --due-before 2018-12-21 --until 2019-01-14
+'''
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.forms import BulkRenewForm
+from catalog.loans import RENEWAL_CHUNK_SIZE, renew_loans
+
+
+class Command(BaseCommand):
+    help = 'Renew the loans selected by borrower, book and/or due date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--borrower', help='Username of the borrower')
+        parser.add_argument('--book', type=int, help='Id of the book')
+        parser.add_argument('--due-after', dest='due_after', help='Only loans due on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--due-before', dest='due_before', help='Only loans due on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--until', dest='renewal_date', help='Renew the loans until this date (YYYY-MM-DD)')
+        parser.add_argument('--weeks', type=int, help='Or extend each loan by this many weeks')
+        parser.add_argument('--chunk-size', type=int, default=RENEWAL_CHUNK_SIZE,
+                            help='Number of loans renewed per transaction (default %d)' % RENEWAL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        ## the options are checked by the same form as the bulk renewal view
+        form = BulkRenewForm({name: options[name] for name in BulkRenewForm.base_fields if options.get(name) is not None})
+        if not form.is_valid():
+            raise CommandError('; '.join('%s: %s' % (name, ' '.join(errors)) for name, errors in form.errors.items()))
+
+        result = renew_loans(form.get_loans(), form.cleaned_data['renewal_date'], form.cleaned_data['weeks'],
+                             options['chunk_size'])
+        for copy_id, due_back in result.rejected:
+            self.stdout.write('Not renewed: %s (due %s)' % (copy_id, due_back))
+        self.stdout.write(self.style.SUCCESS('Renewed %d loans.' % result.renewed))
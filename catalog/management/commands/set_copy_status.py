@@ -0,0 +1,66 @@
+'''
+This script changes the status of many copies (BookInstance) at once, e.g. a shipment back from maintenance.
+The copies are selected by book, current status and/or a file of copy ids (one per line).
+python manage.py set_copy_status a --book 12 --from-status m
+python manage.py set_copy_status m --ids-file shipment.txt
+python manage.py set_copy_status o --ids-file class_set.txt --borrower jane --due-back 2018-12-21
+'''
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import BookInstance
+from catalog.loans import STATUS_CHUNK_SIZE, change_status, chunked, parse_copy_ids
+
+
+class Command(BaseCommand):
+    help = 'Set the status of the selected copies'
+
+    def add_arguments(self, parser):
+        statuses = [status for status, name in BookInstance.LOAN_STATUS]
+        parser.add_argument('status', choices=statuses, help='New status: %s' % ', '.join(
+            '%s (%s)' % (status, name) for status, name in BookInstance.LOAN_STATUS))
+        parser.add_argument('--book', type=int, help='Only copies of this book (id)')
+        parser.add_argument('--from-status', dest='from_status', choices=statuses, help='Only copies in this status')
+        parser.add_argument('--ids-file', dest='ids_file', help='Only the copies listed in this file, one id per line')
+        parser.add_argument('--borrower', help='Username of the borrower (status o only)')
+        parser.add_argument('--due-back', dest='due_back', help='Due date, YYYY-MM-DD (status o only)')
+        parser.add_argument('--chunk-size', type=int, default=STATUS_CHUNK_SIZE,
+                            help='Number of copies changed per transaction (default %d)' % STATUS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        copies = BookInstance.objects.all()
+        if options['book'] is not None:
+            copies = copies.filter(book_id=options['book'])
+        if options['from_status']:
+            copies = copies.filter(status__exact=options['from_status'])
+        if options['book'] is None and not options['from_status'] and not options['ids_file']:
+            raise CommandError('Select the copies with --book, --from-status and/or --ids-file')
+
+        borrower = due_back = None
+        if options['status'] == 'o':
+            try:
+                borrower = User.objects.get(username=options['borrower'])
+                due_back = datetime.datetime.strptime(options['due_back'] or '', '%Y-%m-%d').date()
+            except User.DoesNotExist:
+                raise CommandError('Lending copies needs --borrower with an existing username')
+            except ValueError:
+                raise CommandError('Lending copies needs --due-back as YYYY-MM-DD')
+        elif options['borrower'] or options['due_back']:
+            raise CommandError('--borrower and --due-back only apply to status o')
+
+        if options['ids_file']:
+            ## the file is read chunk_size ids at a time, like checkin_copies() does, so that no statement lists every id
+            changed = 0
+            invalid = []
+            with open(options['ids_file'], encoding='utf-8') as lines:
+                for copy_ids in chunked(parse_copy_ids(lines, invalid), options['chunk_size']):
+                    changed += change_status(copies.filter(pk__in=copy_ids), options['status'], borrower, due_back,
+                                             options['chunk_size'])
+            for line in invalid:
+                self.stdout.write('Invalid id: %s' % line)
+        else:
+            changed = change_status(copies, options['status'], borrower, due_back, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Changed the status of %d copies.' % changed))
@@ -0,0 +1,50 @@
+'''
+This script compares the copy counters stored on each Book (copies_available, copies_on_loan, ...)
+with the copies actually found in BookInstance, and repairs any drift.
+python manage.py verify_book_counts
+python manage.py verify_book_counts --dry-run   # only report drift
+'''
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Book
+from catalog.counters import find_drift
+
+
+class Command(BaseCommand):
+    help = 'Verify the copy counters on Book against BookInstance and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Report drift without repairing it')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of books checked per query (default 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_pk = 0
+        ## walk the books in primary key ranges so that each query only counts the copies of one batch
+        while True:
+            batch = list(Book.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            checked += len(batch)
+            with transaction.atomic():
+                ## lock the batch, so that counters are not bumped between counting and repairing
+                list(Book.objects.select_for_update().filter(pk__in=batch).values_list('pk', flat=True))
+                for book, drift in find_drift(Book.objects.filter(pk__in=batch)):
+                    drifted += 1
+                    self.stdout.write('%s (id %s): %s' % (book.title, book.pk, ', '.join(
+                        '%s stored %s, counted %s' % (name, stored, counted) for name, (stored, counted) in sorted(drift.items()))))
+                    if not options['dry_run']:
+                        Book.objects.filter(pk=book.pk).update(**{name: counted for name, (stored, counted) in drift.items()})
+
+        if not drifted:
+            self.stdout.write('Checked %d books, all counters are correct.' % checked)
+        elif options['dry_run']:
+            self.stdout.write('Checked %d books, %d with drift.' % (checked, drifted))
+        else:
+            self.stdout.write(self.style.SUCCESS('Checked %d books, repaired %d.' % (checked, drifted)))
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+'''
+Prometheus metrics of the site, shared by all the worker processes (served at /metrics).
+
+Each process (e.g. each gunicorn worker) adds to its own file in METRICS_DIR, metrics_<pid>.db, which it maps in
+memory: recording a sample is an in-memory update, with no system call, no lock between processes and no network
+service. The /metrics view reads the files of every process, adds them up and writes the Prometheus text format.
+All the metrics are counters (histograms are counters too), so the files of workers that have exited still count.
+Empty METRICS_DIR when the server starts, or the counters carry on from the previous run.
+
+Recorded metrics (see METRICS):
+- requests, server errors, latency histogram and SQL queries, by route (the URL name, e.g. 'books'), by MetricsMiddleware
+- loan events (borrow, return, renew), by the loan functions (loans.py) and the renewal view
+
+Metrics are off unless METRICS_DIR is set; then recording costs nothing but a settings lookup.
+'''
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from glob import glob
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+
+## name: (type, help text)
+METRICS = {
+    'catalog_http_requests_total': ('counter', 'Requests, by route (URL name), method and status code.'),
+    'catalog_http_errors_total': ('counter', 'Requests answered with a server error (status 5xx), by route.'),
+    'catalog_http_request_duration_seconds': ('histogram', 'Time to answer a request, by route.'),
+    'catalog_db_queries_total': ('counter', 'SQL queries run to answer the requests, by route.'),
+    'catalog_loan_events_total': ('counter', 'Copies borrowed, returned and renewed, by event.'),
+}
+## upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+## route label of requests whose URL matches no view (e.g. 404s)
+UNRESOLVED = 'unresolved'
+
+
+'''
+# per-process file
+'''
+## file layout: header (bytes used), then entries of (key length, key padded so that the value is 8-byte aligned, value)
+HEADER = struct.Struct('<I4x')
+LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+def padded_length(length):
+    return length + (-(LENGTH.size + length) % 8)
+
+def read_entries(data):
+    ## yield (key, value, offset of the value) of the entries of a metrics file
+    used, = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+    while offset < used:
+        length, = LENGTH.unpack_from(data, offset)
+        key = bytes(data[offset + LENGTH.size:offset + LENGTH.size + length]).decode('utf-8')
+        value_offset = offset + LENGTH.size + padded_length(length)
+        value, = VALUE.unpack_from(data, value_offset)
+        yield key, value, value_offset
+        offset = value_offset + VALUE.size
+
+
+class MetricsFile(object):
+    ## The samples of one process, in a file mapped in memory. Only that process writes to it; readers can read it
+    ## at any time, because an entry is complete before the header counts it.
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size < self.INITIAL_SIZE:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used, = HEADER.unpack_from(self.map, 0)
+        if not self.used:
+            self.used = HEADER.size
+            HEADER.pack_into(self.map, 0, self.used)
+        ## offset of the value of each key; a file left by an earlier process with the same pid is carried on
+        self.offsets = {key: offset for key, value, offset in read_entries(self.map)}
+
+    def inc(self, key, amount=1):
+        with self.lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self.add(key)
+            value, = VALUE.unpack_from(self.map, offset)
+            VALUE.pack_into(self.map, offset, value + amount)
+
+    def add(self, key):
+        encoded = key.encode('utf-8')
+        entry = struct.Struct('<I%dsd' % padded_length(len(encoded)))
+        if self.used + entry.size > len(self.map):
+            self.grow(self.used + entry.size)
+        entry.pack_into(self.map, self.used, len(encoded), encoded, 0.0)
+        offset = self.used + entry.size - VALUE.size
+        self.used += entry.size
+        HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+'''
+# registry
+'''
+def sample_key(name, suffix='', **labels):
+    return json.dumps([name, suffix, sorted((label, str(value)) for label, value in labels.items())])
+
+def format_value(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+class Registry(object):
+    ## The metrics stored in directory: recording into this process's file, and reading all of them
+    def __init__(self, directory):
+        self.directory = directory
+        self.pid = None
+        self.file = None
+        self.lock = threading.Lock()
+
+    def store(self):
+        ## the file of this process; a process forked after the first sample (e.g. from a preloaded gunicorn
+        ## master) gets its own file instead of writing to its parent's
+        pid = os.getpid()
+        if self.pid != pid:
+            with self.lock:
+                if self.pid != pid:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.file = MetricsFile(os.path.join(self.directory, 'metrics_%d.db' % pid))
+                    self.pid = pid
+        return self.file
+
+    def inc(self, name, amount=1, **labels):
+        self.store().inc(sample_key(name, **labels), amount)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        ## add value to a histogram; every bucket is written, so that a new series has all of its buckets
+        store = self.store()
+        for bound in buckets:
+            store.inc(sample_key(name, '_bucket', le=format_value(bound), **labels), 1 if value <= bound else 0)
+        store.inc(sample_key(name, '_bucket', le='+Inf', **labels))
+        store.inc(sample_key(name, '_sum', **labels), value)
+        store.inc(sample_key(name, '_count', **labels))
+
+    def collect(self):
+        ## return {key: value} summed over the files of all the processes
+        samples = defaultdict(float)
+        for path in glob(os.path.join(self.directory, 'metrics_*.db')):
+            with open(path, 'rb') as metrics_file:
+                data = metrics_file.read()
+            if len(data) >= HEADER.size:
+                for key, value, offset in read_entries(data):
+                    samples[key] += value
+        return samples
+
+    def render(self):
+        ## the metrics in the Prometheus text exposition format (version 0.0.4)
+        families = defaultdict(list)
+        for key, value in self.collect().items():
+            name, suffix, labels = json.loads(key)
+            labels = dict(labels)
+            le = labels.pop('le', None)
+            ## series by series; in a histogram, buckets in increasing order, then sum and count
+            order = (sorted(labels.items()), suffix != '_bucket', float(le) if le is not None else 0, suffix)
+            if le is not None:
+                labels['le'] = le
+            families[name].append((order, name + suffix, labels, value))
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for order, sample_name, labels, value in sorted(families[name], key=lambda sample: sample[0]):
+                label_text = ','.join('%s="%s"' % (label, escape(labels[label])) for label in sorted(labels))
+                lines.append('%s%s %s' % (sample_name, '{%s}' % label_text if label_text else '', format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry():
+    ## the registry of METRICS_DIR, or None if metrics are off
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if not directory:
+        return None
+    registry = _registries.get(directory)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(directory, Registry(directory))
+    return registry
+
+
+def count_loan_event(event, count=1):
+    ## record count copies borrowed, returned or renewed (event 'borrow', 'return' or 'renew')
+    registry = get_registry()
+    if registry is not None and count:
+        registry.inc('catalog_loan_events_total', count, event=event)
+
+
+'''
+# middleware
+'''
+class MetricsMiddleware(object):
+    ## Records the count, status, latency and SQL queries of every request by route; put it near the top of
+    ## MIDDLEWARE so that the latency covers the other middleware
+    def __init__(self, get_response):
+        if get_registry() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registry = get_registry()
+        if registry is None:
+            return self.get_response(request)
+        queries = [0]
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        seconds = perf_counter() - started
+
+        route = request.resolver_match.view_name if request.resolver_match else UNRESOLVED
+        registry.inc('catalog_http_requests_total', route=route, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            registry.inc('catalog_http_errors_total', route=route)
+        registry.observe('catalog_http_request_duration_seconds', seconds, route=route)
+        registry.inc('catalog_db_queries_total', queries[0], route=route)
+        return response
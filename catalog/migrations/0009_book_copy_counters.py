@@ -0,0 +1,47 @@
+# Generated by Django 2.1.15 on 2026-10-18 17:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_copy_counters(apps, schema_editor):
+    # count the existing copies of every book, one UPDATE per loan status
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    counters = {'m': 'copies_maintenance', 'o': 'copies_on_loan', 'a': 'copies_available', 'r': 'copies_reserved'}
+    for status, name in counters.items():
+        copies = (BookInstance.objects.filter(book=OuterRef('pk'), status=status)
+                  .order_by().values('book').annotate(n=Count('id')).values('n'))
+        Book.objects.update(**{name: Coalesce(Subquery(copies, output_field=models.IntegerField()), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_maintenance',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_reserved',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_copy_counters, migrations.RunPython.noop),
+    ]
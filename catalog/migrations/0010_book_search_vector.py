@@ -0,0 +1,76 @@
+# Generated by Django 2.1.15 on 2026-10-18 17:59
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The search document of a book: title and author name (weight A) and summary (weight B).
+# It is maintained by triggers, so bulk inserts and updates keep it current as well.
+CREATE_TRIGGERS = '''
+CREATE FUNCTION catalog_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(
+            (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = NEW.author_id), '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.summary, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalog_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, summary, author_id ON catalog_book
+    FOR EACH ROW EXECUTE PROCEDURE catalog_book_search_vector_update();
+
+CREATE FUNCTION catalog_author_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    IF NEW.first_name IS DISTINCT FROM OLD.first_name OR NEW.last_name IS DISTINCT FROM OLD.last_name THEN
+        -- touching author_id fires the book trigger above
+        UPDATE catalog_book SET author_id = author_id WHERE author_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalog_author_search_vector_trigger
+    AFTER UPDATE OF first_name, last_name ON catalog_author
+    FOR EACH ROW EXECUTE PROCEDURE catalog_author_search_vector_update();
+
+UPDATE catalog_book SET title = title;
+
+CREATE INDEX catalog_book_search_vector_idx ON catalog_book USING gin (search_vector);
+'''
+
+DROP_TRIGGERS = '''
+DROP INDEX IF EXISTS catalog_book_search_vector_idx;
+DROP TRIGGER IF EXISTS catalog_author_search_vector_trigger ON catalog_author;
+DROP FUNCTION IF EXISTS catalog_author_search_vector_update();
+DROP TRIGGER IF EXISTS catalog_book_search_vector_trigger ON catalog_book;
+DROP FUNCTION IF EXISTS catalog_book_search_vector_update();
+'''
+
+
+# triggers and GIN indexes only exist on PostgreSQL; other databases (e.g. SQLite for local benchmarks) skip them
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGERS)
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGERS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_book_copy_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:05
+
+import warnings
+
+from django.db import migrations
+
+
+# Trigram GIN indexes for the autocomplete endpoints (see AutocompleteView in views.py).
+# Django compiles __icontains to UPPER("column"::text) LIKE UPPER(%s) on PostgreSQL,
+# so the indexes are built on the same expression for the planner to use them.
+CREATE_INDEXES = '''
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX catalog_author_last_name_trgm_idx ON catalog_author USING gin ((UPPER(last_name::text)) gin_trgm_ops);
+CREATE INDEX catalog_author_first_name_trgm_idx ON catalog_author USING gin ((UPPER(first_name::text)) gin_trgm_ops);
+CREATE INDEX catalog_book_title_trgm_idx ON catalog_book USING gin ((UPPER(title::text)) gin_trgm_ops);
+'''
+
+DROP_INDEXES = '''
+DROP INDEX IF EXISTS catalog_book_title_trgm_idx;
+DROP INDEX IF EXISTS catalog_author_first_name_trgm_idx;
+DROP INDEX IF EXISTS catalog_author_last_name_trgm_idx;
+'''
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # pg_trgm ships with PostgreSQL's contrib package; without it the autocomplete still works, but scans the tables
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        available = cursor.fetchone() is not None
+    if not available:
+        warnings.warn('pg_trgm is not available on this PostgreSQL server; skipping the trigram indexes. '
+                      'Install the contrib package and re-run this migration to create them.')
+        return
+    schema_editor.execute(CREATE_INDEXES)
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bookinstance',
+            options={'ordering': ['due_back'], 'permissions': (('view_all_borrow', 'View all borrowed books'), ('can_renew_book', 'Renew a book'), ('can_checkin_book', 'Check in returned books'))},
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+def count_copies_on_loan(apps, schema_editor):
+    # the stats row, if there is one already, starts with the current number of loans
+    CatalogStats = apps.get_model('catalog', 'CatalogStats')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    CatalogStats.objects.update(num_instances_on_loan=BookInstance.objects.filter(status='o').count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_checkin_permission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogstats',
+            name='num_instances_on_loan',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_copies_on_loan, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'book', '-due_back', 'id'], name='bookinstance_loans_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:10
+
+from django.db import migrations
+
+
+# Partial index for BookInstance.objects.overdue() and the overdue report (see OverdueListView in views.py).
+# Only copies on loan are indexed, so the index stays a small fraction of the table.
+# Django 2.1 cannot declare partial indexes in Meta.indexes, hence the raw SQL.
+# PostgreSQL and SQLite both support the WHERE clause.
+CREATE_INDEX = '''
+CREATE INDEX catalog_bookinstance_overdue_idx ON catalog_bookinstance (due_back, id) WHERE status = 'o';
+'''
+
+DROP_INDEX = '''
+DROP INDEX IF EXISTS catalog_bookinstance_overdue_idx;
+'''
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(CREATE_INDEX)
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_loans_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
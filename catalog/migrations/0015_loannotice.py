@@ -0,0 +1,34 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0014_overdue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanNotice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('s', 'Due soon'), ('o', 'Overdue')], max_length=1)),
+                ('due_back', models.DateField()),
+                ('sent', models.DateTimeField(auto_now_add=True)),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.BookInstance')),
+            ],
+            options={
+                'ordering': ['-sent'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='loannotice',
+            unique_together={('copy', 'kind', 'due_back')},
+        ),
+    ]
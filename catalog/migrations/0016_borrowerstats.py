@@ -0,0 +1,40 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_active_loans(apps, schema_editor):
+    # one row for every user with copies on loan
+    BorrowerStats = apps.get_model('catalog', 'BorrowerStats')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    loans = (BookInstance.objects.filter(status='o', borrower__isnull=False)
+             .order_by().values('borrower').annotate(n=models.Count('id')).values_list('borrower', 'n'))
+    BorrowerStats.objects.bulk_create([BorrowerStats(user_id=user_id, active_loans=n) for user_id, n in loans], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0009_alter_user_last_name_max_length'),
+        ('catalog', '0015_loannotice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('active_loans', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'borrower stats',
+            },
+        ),
+        migrations.RunPython(count_active_loans, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinstance_borrower_idx'),
+        ),
+    ]
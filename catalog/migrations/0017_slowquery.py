@@ -0,0 +1,31 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_borrowerstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('captured', models.DateTimeField(auto_now_add=True)),
+                ('duration_ms', models.FloatField(verbose_name='duration (ms)')),
+                ('view', models.CharField(max_length=200)),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('fingerprint', models.CharField(db_index=True, max_length=40)),
+                ('stack', models.TextField(blank=True, help_text='Innermost lines of project code that ran the query')),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN output, taken the first time the shape of the query was captured')),
+                ('full_scan', models.BooleanField(default=False, help_text='The plan reads a whole table (sequential scan)')),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:23
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0017_slowquery'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='loannotice',
+            unique_together={('copy', 'borrower', 'kind', 'due_back')},
+        ),
+    ]
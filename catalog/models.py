@@ -1,8 +1,29 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 import uuid
 from django.contrib.auth.models import User
 from datetime import date
+from django.db.models import F, Case, When, Value, BooleanField
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.contrib.postgres.search import SearchVectorField
+
+''' "LoadedValuesMixin" remembers the field values a record was loaded with, so that signal handlers can tell what changed on save'''
+class LoadedValuesMixin(object):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(LoadedValuesMixin, cls).from_db(db, field_names, values)
+        ## field_names are attribute names (e.g. 'book_id' for the book ForeignKey)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def remember_loaded_values(self, *attnames):
+        ## after the record is written, the written values are what the database holds
+        if getattr(self, '_loaded_values', None) is None:
+            self._loaded_values = {}
+        for attname in attnames:
+            self._loaded_values[attname] = getattr(self, attname)
 
 # Create your models here.
 ''' "Book" model represents a book (but not a specific copy)'''
@@ -34,10 +55,25 @@ class Book(models.Model):
     ## auto_now_add=True sets the datetime only when the model is first created
     create_dt = models.DateTimeField(auto_now_add=True, help_text='Creation datetime of the record')
     
+    ## Number of copies (BookInstance) in each loan status, so that list pages can show availability without a join.
+    ## The counters are maintained by counters.record_transitions() (called from signals.py and bulk operations).
+    ## "manage.py verify_book_counts" detects and repairs drift.
+    copies_available = models.IntegerField(default=0, editable=False)
+    copies_on_loan = models.IntegerField(default=0, editable=False)
+    copies_reserved = models.IntegerField(default=0, editable=False)
+    copies_maintenance = models.IntegerField(default=0, editable=False)
+    COPY_COUNTERS = ('copies_available', 'copies_on_loan', 'copies_reserved', 'copies_maintenance')
+    
+    ## Full-text search document made of title, author name and summary (used by BookSearchView).
+    ## It is computed by a database trigger on insert/update of the book and on rename of its author (see migration 0010).
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     # Meta
     class Meta:
         ## Sort the records by title A-Z and publication date new-old
         ordering = ['title', '-pubdate']
+        ## composite index matching the ordering (plus id as a tie-breaker) for keyset pagination of the book list
+        indexes = [models.Index(fields=['title', '-pubdate', 'id'], name='book_keyset_idx')]
         permissions = (('can_create_book','Add new books'),
                        ('can_update_book','Update book details'),
                        ('can_delete_book', 'Delete books'),
@@ -48,6 +84,15 @@ class Book(models.Model):
         ## use book title as the representation
         return self.title
     
+    def save(self, *args, **kwargs):
+        ## The copy counters and the search document are changed by the database while a book is being edited
+        ## (UPDATE ... SET x = x + 1, triggers), so never write back the values held in memory when an existing book is saved.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            database_fields = self.COPY_COUNTERS + ('search_vector',)
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in database_fields]
+        super(Book, self).save(*args, **kwargs)
+    
     def get_absolute_url(self):
         ## Returns the url to access a detail record for this book.
         ## 'book_details' is the view that display the record. It will be created separately.
@@ -58,9 +103,19 @@ class Book(models.Model):
         return ", ".join(genre.name for genre in self.genre.all()[:3])
     ## Create a short_description that can be used in the admin site 
     display_genre.short_description = 'Genre'
+    
+    @staticmethod
+    def invalidate_copies_cache(*book_ids):
+        ## Drop the cached copies section of book_details.html (see BookDetailView) for the given books.
+        ## Called whenever a copy of these books changes; code that updates copies in bulk must call it too.
+        ## The keys are deleted once the transaction commits: deleted earlier, a request could cache the copies again
+        ## as they were before the change, and a rolled back change has nothing to invalidate.
+        keys = [make_template_fragment_key('book_copies', [book_id]) for book_id in set(book_ids) if book_id is not None]
+        if keys:
+            transaction.on_commit(lambda: cache.delete_many(keys))
         
 ''' "Genre" model represents that category of a book'''
-class Genre(models.Model):
+class Genre(LoadedValuesMixin, models.Model):
     # Fields
     name = models.CharField(max_length = 200, help_text = 'Enter genre of the book (e.g. Science Fiction)')
     
@@ -84,6 +139,8 @@ class Author(models.Model):
     # Meta
     class Meta:
         ordering = ['last_name', 'first_name']
+        ## composite index matching the ordering (plus id as a tie-breaker) for keyset pagination of the author list
+        indexes = [models.Index(fields=['last_name', 'first_name', 'id'], name='author_keyset_idx')]
     
     # Methods:
     def __str__(self):
@@ -93,8 +150,25 @@ class Author(models.Model):
     def get_absolute_url(self):
         return reverse('author_details', args=[str(self.id)])
 
+''' "BookInstanceQuerySet" computes the loan state of copies in SQL, e.g. BookInstance.objects.overdue() '''
+class BookInstanceQuerySet(models.QuerySet):
+    def on_loan(self):
+        return self.filter(status__exact='o')
+    
+    def overdue(self, today=None):
+        ## copies on loan that are past their due date (served by the partial index catalog_bookinstance_overdue_idx)
+        return self.on_loan().filter(due_back__lt=today or date.today())
+    
+    def annotate_overdue(self, today=None):
+        ## add an "overdue" flag to every row, the same test as BookInstance.is_overdue but computed by the database
+        return self.annotate(overdue=Case(
+            When(due_back__lt=today or date.today(), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+
 ''' "BookInstance" model represents a specific copy of a book '''
-class BookInstance(models.Model):
+class BookInstance(LoadedValuesMixin, models.Model):
     # Fields:
     ## UUIDField allocates a globally unique value for each instance (one for every book you can find in the library)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID for this particular book across whole library')
@@ -115,14 +189,23 @@ class BookInstance(models.Model):
     )
     status = models.CharField(max_length=1, choices=LOAN_STATUS, blank=True, default='m', help_text='Book availability')
     
+    objects = BookInstanceQuerySet.as_manager()
+    
     # Meta
     class Meta:
         ordering = ['due_back']
+        indexes = [
+            ## composite index matching the sort order of the librarian's list of all loans (AllBorrowListView)
+            models.Index(fields=['status', 'book', '-due_back', 'id'], name='bookinstance_loans_idx'),
+            ## the loans of one borrower by due date (MyBorrowListView)
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinstance_borrower_idx'),
+        ]
         
         ## declare a permission for viewing all borrowed books
         ## Define multiple permissions in a tuple. Each permission is a tuple with (permission_name, permission_display_value)
         permissions = (('view_all_borrow', 'View all borrowed books'),
                        ('can_renew_book', 'Renew a book'),
+                       ('can_checkin_book', 'Check in returned books'),
                 )
         
     # Methods
@@ -131,6 +214,7 @@ class BookInstance(models.Model):
         return '%s (%s)' % (self.book.title, self.id)
     
     ## check whether the copy of book is overdue. 
+    ## To flag a list of copies, use BookInstance.objects.annotate_overdue() instead and read the "overdue" attribute.
     @property ### @property here defines a read-only property BookInstance.is_overdue
               ### see examples at https://docs.python.org/3/library/functions.html#property
     def is_overdue(self):
@@ -156,3 +240,153 @@ class Language(models.Model):
     # Methods
     def __str__(self):
         return self.name
+
+''' "CatalogStats" model keeps a single row of pre-computed counters shown on the dashboard (catalog.views.index)'''
+class CatalogStats(models.Model):
+    ## the counters are kept up to date incrementally by signal handlers (see signals.py) and by bulk-update paths calling bump().
+    ## "manage.py reconcile_stats" recounts everything and fixes any drift.
+    num_books = models.IntegerField(default=0)
+    num_instances = models.IntegerField(default=0)
+    num_instances_available = models.IntegerField(default=0)
+    num_instances_on_loan = models.IntegerField(default=0)
+    num_authors = models.IntegerField(default=0)
+    num_genre_c = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+    
+    ## the table only ever holds the row with this primary key
+    SINGLETON_ID = 1
+    
+    # Meta
+    class Meta:
+        verbose_name_plural = 'catalog stats'
+    
+    # Methods
+    def __str__(self):
+        return 'Catalog stats (updated %s)' % self.updated
+    
+    @staticmethod
+    def count_all():
+        ## Return the counters computed from scratch. This scans all the counted tables.
+        return {
+            'num_books': Book.objects.count(),
+            'num_instances': BookInstance.objects.count(),
+            'num_instances_available': BookInstance.objects.filter(status__exact='a').count(),
+            'num_instances_on_loan': BookInstance.objects.filter(status__exact='o').count(),
+            'num_authors': Author.objects.count(),
+            'num_genre_c': Genre.objects.filter(name__icontains='c').count(),
+        }
+    
+    @classmethod
+    def reconcile(cls):
+        ## Recount everything and store the result. Return the stats row.
+        stats, created = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=cls.count_all())
+        return stats
+    
+    @classmethod
+    def load(cls):
+        ## Return the stats row, creating it from a full count the first time it is needed
+        try:
+            return cls.objects.get(pk=cls.SINGLETON_ID)
+        except cls.DoesNotExist:
+            return cls.reconcile()
+    
+    @classmethod
+    def bump(cls, **deltas):
+        ## Add the given deltas to the counters in a single UPDATE, e.g. CatalogStats.bump(num_books=1)
+        ## F() expressions let the database do the arithmetic, so concurrent bumps do not overwrite each other.
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        updates = {name: F(name) + delta for name, delta in deltas.items()}
+        ## auto_now is only applied by save(), so set the timestamp explicitly
+        updates['updated'] = timezone.now()
+        if not cls.objects.filter(pk=cls.SINGLETON_ID).update(**updates):
+            ## no row yet: a full count already includes the change being recorded
+            cls.reconcile()
+
+''' "BorrowerStats" keeps the number of copies each user has on loan, shown on "My borrowed books" (MyBorrowListView)'''
+class BorrowerStats(models.Model):
+    ## kept up to date by counters.record_transitions(); "manage.py reconcile_stats" recounts them
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    active_loans = models.IntegerField(default=0)
+    
+    # Meta
+    class Meta:
+        verbose_name_plural = 'borrower stats'
+    
+    # Methods
+    def __str__(self):
+        return 'Loans of user %s' % self.user_id
+    
+    @staticmethod
+    def count_loans(user_id):
+        return BookInstance.objects.filter(borrower_id=user_id, status__exact='o').count()
+    
+    @classmethod
+    def load(cls, user_id):
+        ## Return the stats row of a user, creating it from a count the first time it is needed
+        try:
+            return cls.objects.get(pk=user_id)
+        except cls.DoesNotExist:
+            stats, created = cls.objects.get_or_create(pk=user_id, defaults={'active_loans': cls.count_loans(user_id)})
+            return stats
+    
+    @classmethod
+    def bump(cls, deltas):
+        ## Add {user id: delta} to the loan counters, one UPDATE per distinct delta
+        groups = {}
+        for user_id, delta in deltas.items():
+            if delta:
+                groups.setdefault(delta, []).append(user_id)
+        for delta, user_ids in sorted(groups.items()):
+            if cls.objects.filter(pk__in=sorted(user_ids)).update(active_loans=F('active_loans') + delta) < len(user_ids):
+                ## some users have no row yet: a count already includes the change being recorded
+                for user_id in user_ids:
+                    cls.load(user_id)
+
+''' "LoanNotice" records a reminder sent to a borrower about one copy, so that it is sent only once (see notify_borrowers)'''
+class LoanNotice(models.Model):
+    DUE_SOON = 's'
+    OVERDUE = 'o'
+    KIND = (
+        (DUE_SOON, 'Due soon'),
+        (OVERDUE, 'Overdue'),
+    )
+    copy = models.ForeignKey('BookInstance', on_delete=models.CASCADE)
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=1, choices=KIND)
+    ## the due date the notice was about: a renewed loan gets new notices
+    due_back = models.DateField()
+    sent = models.DateTimeField(auto_now_add=True)
+    
+    # Meta
+    class Meta:
+        ordering = ['-sent']
+        unique_together = (('copy', 'borrower', 'kind', 'due_back'),)
+    
+    # Methods
+    def __str__(self):
+        return '%s notice for %s (due %s)' % (self.get_kind_display(), self.copy_id, self.due_back)
+
+''' "SlowQuery" is a query that took longer than SLOW_QUERY_THRESHOLD_MS, kept in a ring buffer of the latest SLOW_QUERY_BUFFER_SIZE (see slowqueries.py)'''
+class SlowQuery(models.Model):
+    captured = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField('duration (ms)')
+    ## URL name of the view that ran the query, or the path if it has none
+    view = models.CharField(max_length=200)
+    ## the statement with its placeholders; the parameters are not kept, as they can hold personal data
+    sql = models.TextField('SQL')
+    ## hash of the shape of the statement (querybudget.fingerprint), the same for every run of a query
+    fingerprint = models.CharField(max_length=40, db_index=True)
+    stack = models.TextField(blank=True, help_text='Innermost lines of project code that ran the query')
+    plan = models.TextField(blank=True, help_text='EXPLAIN output, taken the first time the shape of the query was captured')
+    full_scan = models.BooleanField(default=False, help_text='The plan reads a whole table (sequential scan)')
+    
+    # Meta
+    class Meta:
+        ordering = ['-id']
+        verbose_name_plural = 'slow queries'
+    
+    # Methods
+    def __str__(self):
+        return '%.0f ms in %s' % (self.duration_ms, self.view)
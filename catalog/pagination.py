@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+'''
+Keyset (a.k.a. seek or cursor) pagination for list views.
+
+Django's Paginator uses OFFSET, so the database still reads every row before the requested page,
+and it runs a COUNT(*) for the page count. A keyset paginator remembers the sort key of the last row shown
+and asks for rows "after" it instead, which an index on the sort key answers directly:
+page 10,000 costs the same as page 1.
+
+The sort key is encoded into opaque next/previous tokens that are passed as the ?cursor= URL parameter.
+
+Nullable sort fields are supported: NULL sorts after every other value (NULLS LAST ascending, NULLS FIRST descending),
+which is how PostgreSQL orders a plain index, so such an index still serves the query.
+'''
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+'''
+define KeysetPaginator
+# ordering is a list of model field names, with a leading '-' for descending order (like QuerySet.order_by()).
+# The fields, taken together, must be unique: end the ordering with the primary key.
+'''
+class KeysetPaginator(object):
+    ## direction markers stored in the cursor
+    FORWARD = 'n'
+    BACKWARD = 'p'
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        opts = queryset.model._meta
+        ## model fields in sort order, with a flag for descending fields
+        self.fields = [(opts.get_field(name.lstrip('-')), name.startswith('-')) for name in self.ordering]
+
+    def page(self, cursor=None):
+        ## Return the page following (or preceding) the row the cursor points at. No cursor means the first page.
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = self.FORWARD, None
+        forward = direction == self.FORWARD
+
+        queryset = self.queryset.order_by(*self.sort_ordering(forward))
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(values, forward))
+        ## fetch one extra row to find out whether there is another page in this direction
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        ## a cursor means we arrived from a neighbouring page, so there is a page back the way we came
+        has_next = more if forward else values is not None
+        has_previous = values is not None if forward else more
+        next_cursor = self.encode_cursor(rows[-1], self.FORWARD) if has_next and rows else None
+        previous_cursor = self.encode_cursor(rows[0], self.BACKWARD) if has_previous and rows else None
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def sort_ordering(self, forward):
+        ## walking backwards reads the same index in reverse
+        ordering = []
+        for (field, descending), name in zip(self.fields, self.ordering):
+            if not forward:
+                descending = not descending
+            if field.null:
+                ## place NULL explicitly, so that the order does not depend on the database
+                expression = F(field.attname)
+                ordering.append(expression.desc(nulls_first=True) if descending else expression.asc(nulls_last=True))
+            else:
+                ordering.append(('-' if descending else '') + name.lstrip('-'))
+        return tuple(ordering)
+
+    def seek_filter(self, values, forward):
+        ## Build (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ..., flipping the comparison for descending fields
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.fields, values):
+            condition |= equal & self.beyond(field, value, forward != descending)
+            if value is None:
+                equal &= Q(**{'%s__isnull' % field.attname: True})
+            else:
+                equal &= Q(**{field.attname: value})
+        ## The database cannot start an index scan from the OR chain alone: the redundant a >= x in front of it
+        ## gives the scan its starting point on the first column
+        (field, descending), value = self.fields[0], values[0]
+        return self.at_or_beyond(field, value, forward != descending) & condition
+
+    @staticmethod
+    def at_or_beyond(field, value, larger):
+        ## Condition for the values of field equal to value or larger (or smaller), NULL being larger than any value
+        if value is None:
+            return Q(**{'%s__isnull' % field.attname: True}) if larger else Q()
+        if larger:
+            condition = Q(**{'%s__gte' % field.attname: value})
+            if field.null:
+                condition |= Q(**{'%s__isnull' % field.attname: True})
+            return condition
+        return Q(**{'%s__lte' % field.attname: value})
+
+    @staticmethod
+    def beyond(field, value, larger):
+        ## Condition for the values of field larger (or smaller) than value, NULL being larger than any value
+        if value is None:
+            ## nothing is larger than NULL; everything else is smaller
+            return Q(pk__in=[]) if larger else Q(**{'%s__isnull' % field.attname: False})
+        if larger:
+            condition = Q(**{'%s__gt' % field.attname: value})
+            if field.null:
+                condition |= Q(**{'%s__isnull' % field.attname: True})
+            return condition
+        return Q(**{'%s__lt' % field.attname: value})
+
+    def encode_cursor(self, obj, direction):
+        values = [self.dump_value(getattr(obj, field.attname)) for field, descending in self.fields]
+        data = json.dumps([direction, values], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode((cursor + padding).encode('ascii')).decode('utf-8'))
+            if direction not in (self.FORWARD, self.BACKWARD) or len(values) != len(self.fields):
+                raise InvalidCursor('Invalid cursor')
+            return direction, [field.to_python(value) for (field, descending), value in zip(self.fields, values)]
+        except (ValueError, TypeError, UnicodeError, binascii.Error, ValidationError):
+            raise InvalidCursor('Invalid cursor')
+
+    @staticmethod
+    def dump_value(value):
+        ## dates and UUIDs are stored as strings; field.to_python() converts them back
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        if isinstance(value, (int, float, str)) or value is None:
+            return value
+        return str(value)
+
+
+'''
+define KeysetPage, the page returned by KeysetPaginator
+# It behaves like a list of the objects on the page, similar to django.core.paginator.Page
+'''
+class KeysetPage(object):
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Keyset page of %d objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+'''
+define KeysetPaginationMixin for generic.ListView
+# Pages are addressed with ?cursor=<token>. Links with ?page=<number> keep working through the regular OFFSET paginator.
+'''
+class KeysetPaginationMixin(object):
+    ## sort fields for the keyset; defaults to the ordering of the model (Meta.ordering) followed by the primary key
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        ordering = list(self.keyset_ordering or self.get_ordering() or self.model._meta.ordering)
+        pk_name = self.model._meta.pk.name
+        ## the primary key makes the sort key unique, so that no row is skipped or repeated between pages
+        if pk_name not in ordering and '-' + pk_name not in ordering:
+            ordering.append(pk_name)
+        return ordering
+
+    def get_sort_ordering(self):
+        ## the order_by() arguments of the pages, NULL placed as on the pages; e.g. for an export in the same order
+        return KeysetPaginator(self.model._default_manager.none(), 1, self.get_keyset_ordering()).sort_ordering(forward=True)
+
+    def paginate_queryset(self, queryset, page_size):
+        page_kwarg = self.page_kwarg
+        if self.kwargs.get(page_kwarg) or self.request.GET.get(page_kwarg):
+            return super(KeysetPaginationMixin, self).paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_keyset_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+'''
+define EstimatedCountPaginator, a Paginator for the admin changelists of large tables
+# Counting every row of a table with tens of millions of rows takes seconds on PostgreSQL, on every page view.
+# For an unfiltered list of a large table the page count is taken from the planner's row estimate (pg_class.reltuples)
+# instead, which ANALYZE/autovacuum keep close to the real count. Small tables, filtered lists and other databases are counted.
+'''
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    ## tables estimated to hold fewer rows than this are counted exactly
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
+
+    def estimated_count(self):
+        ## Return the planner's estimate of the number of rows of an unfiltered queryset, or None
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct or query.low_mark or query.high_mark is not None:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        ## -1 (PostgreSQL 14+) or 0 means the table has not been analyzed yet
+        if row is None or row[0] <= 0:
+            return None
+        return int(row[0])
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''
+Query budgets and N+1 detection for views.
+
+Every SQL statement of a request is recorded with its shape (the statement with its values and IN lists collapsed)
+and its origin: the template line that ran it (e.g. {{ book.author }} inside a {% for %}), or else the innermost
+line of project code. A SELECT of the same shape coming N_PLUS_ONE_THRESHOLD times or more from the same origin is
+an N+1: one query per item of a loop, where select_related() or prefetch_related() would make one in all.
+
+A view declares the most queries it may make with the @query_budget(n) decorator (function views) or a
+query_budget attribute (class-based views). QueryBudgetMiddleware checks every request in development (only when DEBUG is on),
+and QueryBudgetTestMixin lets the tests check every catalog view, so that CI fails on a new N+1.
+'''
+
+import logging
+import os
+import re
+import sys
+from collections import Counter, namedtuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Node
+from django.urls import resolve
+
+
+## a SELECT repeated this many times from one origin is reported as an N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+Query = namedtuple('Query', ['shape', 'origin'])
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+'''
+# fingerprints
+'''
+def fingerprint(sql):
+    ## the shape of a statement: literals become ?, IN lists become IN (...), whitespace is collapsed
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\bIN \([^)]*\)', 'IN (...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+def query_origin(frame):
+    ## Where the query run from frame comes from: 'template.html:12' for a template node being rendered,
+    ## else 'catalog/views.py:34' for the innermost frame of project code
+    code_origin = None
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        ## type() rather than isinstance(), which would evaluate lazy objects (e.g. request.user) and query again
+        if issubclass(type(node), Node) and getattr(node, 'origin', None) is not None and getattr(node, 'token', None) is not None:
+            return '%s:%d' % (node.origin.template_name or node.origin.name, node.token.lineno)
+        filename = frame.f_code.co_filename
+        if (code_origin is None and filename.startswith(PROJECT_DIR) and filename != __file__
+                and 'site-packages' not in filename):
+            code_origin = '%s:%d' % (os.path.relpath(filename, PROJECT_DIR), frame.f_lineno)
+        frame = frame.f_back
+    return code_origin or 'unknown'
+
+
+'''
+# recording
+'''
+class QueryRecorder(object):
+    ## Context manager recording the shape and origin of the queries run on this thread's default connection
+    def __init__(self):
+        self.queries = []
+        self.wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(Query(fingerprint(sql), query_origin(sys._getframe(1))))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wrapper.__exit__(*exc_info)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        ## Return [(query, count)] of the SELECTs run threshold times or more from one origin, most repeated first
+        counts = Counter(query for query in self.queries if query.shape.startswith('SELECT'))
+        return [(query, count) for query, count in counts.most_common() if count >= threshold]
+
+    def problems(self, budget=None):
+        ## Return the N+1 patterns and budget overrun as messages (empty if all is well)
+        problems = ['N+1: %d x %s at %s' % (count, query.shape, query.origin) for query, count in self.repeated()]
+        if budget is not None and len(self.queries) > budget:
+            problems.append('%d queries, over the budget of %d' % (len(self.queries), budget))
+        return problems
+
+
+'''
+# budgets
+'''
+def query_budget(queries):
+    ## Decorator declaring the most queries a function view may make (class-based views set a query_budget attribute)
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+def view_budget(view_func):
+    ## the query budget declared by a view function or class-based view (through as_view()), or None
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view_func, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+class QueryBudgetMiddleware(object):
+    ## Development middleware: records the queries of every request, reports N+1 patterns and budget overruns and
+    ## adds the query count as an X-Query-Count header. Problems are logged, or raised with QUERY_BUDGET_STRICT = True.
+    ## It turns itself off unless DEBUG is on, so production, the test runner and the benchmark profile do not pay for it.
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(len(recorder.queries))
+        problems = recorder.problems(getattr(request, 'query_budget', None))
+        if problems:
+            message = '%s %s: %s' % (request.method, request.path, '; '.join(problems))
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_budget(view_func)
+
+
+class QueryBudgetTestMixin(object):
+    ## TestCase mixin: assertQueryBudget() requests a page and fails on an N+1 or if its view goes over its budget
+    def assertQueryBudget(self, url, **kwargs):
+        with QueryRecorder() as recorder:
+            response = self.client.get(url, **kwargs)
+        problems = recorder.problems(view_budget(resolve(urlparse(url).path).func))
+        if problems:
+            self.fail('GET %s: %s' % (url, '; '.join(problems)))
+        return response
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+Signal handlers that keep the pre-computed counters (CatalogStats and the copy counters on Book) up to date,
+and drop the cached copies section of a book when one of its copies changes.
+The handlers are connected when the app is ready (see CatalogConfig.ready() in apps.py).
+
+Note that QuerySet.update() and bulk_create() do not send these signals.
+Code using them must call CatalogStats.bump() or counters.record_transitions() itself.
+'''
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from catalog.models import Book, Author, Genre, BookInstance, CatalogStats
+from catalog.counters import Transition, record_transitions
+
+
+'''
+# helpers
+'''
+def genre_counts_as_c(name):
+    ## the dashboard counts genre values containing letter 'c' (case in-sensitive, same as __icontains)
+    return bool(name) and 'c' in name.lower()
+
+def loaded_or_current(instance, attname):
+    ## Return the value a record had in the database before it was changed in memory.
+    ## Records loaded through the ORM remember their values (LoadedValuesMixin). Otherwise read the row again.
+    loaded_values = getattr(instance, '_loaded_values', None)
+    if loaded_values is not None and attname in loaded_values:
+        return loaded_values[attname]
+    return type(instance)._default_manager.filter(pk=instance.pk).values_list(attname, flat=True).first()
+
+
+'''
+# Book and Author: count records
+'''
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CatalogStats.bump(num_books=1)
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    CatalogStats.bump(num_books=-1)
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CatalogStats.bump(num_authors=1)
+
+@receiver(post_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    CatalogStats.bump(num_authors=-1)
+
+
+'''
+# Genre: count names containing letter 'c'. A rename can move a genre in or out of the count.
+'''
+@receiver(pre_save, sender=Genre)
+def genre_before_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        instance._stats_old_name = None
+    else:
+        instance._stats_old_name = loaded_or_current(instance, 'name')
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = genre_counts_as_c(None if created else instance._stats_old_name)
+    new = genre_counts_as_c(instance.name)
+    CatalogStats.bump(num_genre_c=int(new) - int(old))
+    ## the saved values become the "loaded" values so that a second save is not counted twice
+    instance.remember_loaded_values('name')
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted(sender, instance, **kwargs):
+    if genre_counts_as_c(instance.name):
+        CatalogStats.bump(num_genre_c=-1)
+
+
+'''
+# BookInstance: update the copy counters of the book(s) and borrower(s) concerned and CatalogStats (see counters.py)
+'''
+@receiver(pre_save, sender=BookInstance)
+def bookinstance_before_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        instance._old_status = None
+        instance._old_book_id = None
+        instance._old_borrower_id = None
+    else:
+        instance._old_status = loaded_or_current(instance, 'status')
+        instance._old_book_id = loaded_or_current(instance, 'book_id')
+        instance._old_borrower_id = loaded_or_current(instance, 'borrower_id')
+
+@receiver(post_save, sender=BookInstance)
+def bookinstance_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        transition = Transition(None, None, instance.book_id, instance.status, new_borrower_id=instance.borrower_id)
+    else:
+        transition = Transition(instance._old_book_id, instance._old_status, instance.book_id, instance.status,
+                                instance._old_borrower_id, instance.borrower_id)
+    record_transitions([transition])
+    instance.remember_loaded_values('status', 'book_id', 'borrower_id')
+
+@receiver(post_delete, sender=BookInstance)
+def bookinstance_deleted(sender, instance, **kwargs):
+    record_transitions([Transition(instance.book_id, instance.status, instance.book_id, None, old_borrower_id=instance.borrower_id)])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+Capture of slow queries into a ring buffer (SlowQuery), browsed from the admin.
+
+SlowQueryMiddleware times every query of a request. The queries that take SLOW_QUERY_THRESHOLD_MS or more are kept
+in memory with a summary of the project code that ran them, and saved when the response is ready, outside the
+request's own transactions. The buffer keeps the latest SLOW_QUERY_BUFFER_SIZE captures; older ones are deleted.
+
+The first capture of a query shape (see querybudget.fingerprint) is explained with EXPLAIN (ANALYZE false) on
+PostgreSQL, or EXPLAIN QUERY PLAN on SQLite, which plan the statement without running it again. Later captures of
+the same shape copy that plan. Plans that read a whole table are flagged (full_scan), e.g. a filter on a column
+with no index.
+
+A query that is not slow costs two clock readings. Capture is off unless SLOW_QUERY_THRESHOLD_MS is set.
+Queries run while a streaming response is sent (e.g. the catalog export) are not timed.
+'''
+
+import hashlib
+import os
+import re
+import sys
+from collections import namedtuple
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection, transaction
+
+from catalog.models import SlowQuery
+from catalog.querybudget import PROJECT_DIR, fingerprint, query_origin
+
+
+SLOW_QUERY_BUFFER_SIZE = 1000
+## captures kept per request at most, in case everything is slow
+MAX_CAPTURES_PER_REQUEST = 20
+## lines of project code kept in the stack summary
+STACK_DEPTH = 8
+
+EXPLAINABLE = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+
+CapturedQuery = namedtuple('CapturedQuery', ['sql', 'params', 'many', 'duration_ms', 'stack'])
+
+
+def stack_summary(frame):
+    ## The innermost STACK_DEPTH frames of project code, outermost first, e.g. 'catalog/views.py:120 in get_queryset',
+    ## under the template line that ran the query, if any
+    lines = []
+    origin = query_origin(frame)
+    while frame is not None and len(lines) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and 'site-packages' not in filename and filename != __file__:
+            lines.append('%s:%d in %s' % (os.path.relpath(filename, PROJECT_DIR), frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    lines.reverse()
+    ## query_origin() is either a template line or, like the lines above, a line of Python code
+    if origin != 'unknown' and not origin.rpartition(':')[0].endswith('.py'):
+        lines.append('template %s' % origin)
+    return '\n'.join(lines)
+
+
+class SlowQueryRecorder(object):
+    ## execute_wrapper() keeping the queries that take threshold_ms or more
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.captured = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = perf_counter() - started
+            if seconds >= self.threshold and len(self.captured) < MAX_CAPTURES_PER_REQUEST:
+                ## the parameters of executemany() can be a generator, already consumed: they are not kept
+                self.captured.append(CapturedQuery(sql, None if many else params, many, seconds * 1000,
+                                                   stack_summary(sys._getframe(1))))
+
+
+def explain(sql, params):
+    ## the plan of a statement, without running it; '' if it cannot be explained (e.g. SAVEPOINT)
+    if not EXPLAINABLE.match(sql):
+        return ''
+    ## the other databases take no options
+    options = {'analyze': False} if connection.vendor == 'postgresql' else {}
+    try:
+        ## in a savepoint, so that a failure does not break an enclosing transaction
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('%s %s' % (connection.ops.explain_query_prefix(**options), sql), params)
+            ## PostgreSQL returns one line of text per row, SQLite the description in the last column
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as error:
+        return 'EXPLAIN failed: %s' % error
+
+def is_full_scan(plan):
+    ## PostgreSQL: 'Seq Scan on catalog_bookinstance'; SQLite: 'SCAN TABLE catalog_bookinstance' (with no index)
+    return any('Seq Scan' in line or (line.lstrip().startswith('SCAN') and 'INDEX' not in line)
+               for line in plan.splitlines())
+
+
+def save_slow_queries(captured, view):
+    ## Add the captured queries to the buffer, explaining the new shapes, and drop the oldest captures
+    last = None
+    for query in captured:
+        shape = hashlib.sha1(fingerprint(query.sql).encode('utf-8')).hexdigest()
+        plan = (SlowQuery.objects.filter(fingerprint=shape).exclude(plan='').order_by('-pk')
+                .values_list('plan', flat=True).first())
+        if plan is None and not query.many:
+            plan = explain(query.sql, query.params)
+        last = SlowQuery.objects.create(duration_ms=query.duration_ms, view=view[:200], sql=query.sql, fingerprint=shape,
+                                        stack=query.stack, plan=plan or '', full_scan=is_full_scan(plan or ''))
+    if last is not None:
+        size = getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', SLOW_QUERY_BUFFER_SIZE)
+        SlowQuery.objects.filter(pk__lte=last.pk - size).delete()
+
+
+class SlowQueryMiddleware(object):
+    ## Captures the slow queries of every request; put it near the top of MIDDLEWARE so that the queries of the
+    ## other middleware (e.g. the session) are timed too
+    def __init__(self, get_response):
+        if not getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD_MS)
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if recorder.captured:
+            view = request.resolver_match.view_name if request.resolver_match else request.path
+            save_slow_queries(recorder.captured, view)
+        return response
@@ -0,0 +1,55 @@
+/*
+ Load the options of <select data-autocomplete-url="..."> elements on demand (see AutocompleteSelect in forms.py).
+ A search box is added in front of each select. Typing at least 3 characters asks the autocomplete URL for matches,
+ which replace the options that are not selected.
+*/
+(function () {
+    var MIN_LENGTH = 3;
+    var DELAY = 250; // milliseconds to wait after the last key stroke
+
+    function replaceOptions(select, results) {
+        // keep the selected options (and the empty option of a single select), drop the others
+        Array.prototype.slice.call(select.options).forEach(function (option) {
+            if (!option.selected && option.value !== '') {
+                select.removeChild(option);
+            }
+        });
+        var present = {};
+        Array.prototype.slice.call(select.options).forEach(function (option) {
+            present[option.value] = true;
+        });
+        results.forEach(function (result) {
+            if (!present[String(result.id)]) {
+                select.appendChild(new Option(result.text, result.id));
+            }
+        });
+    }
+
+    function attach(select) {
+        var search = document.createElement('input');
+        var timer = null;
+        search.type = 'search';
+        search.placeholder = 'Type to search';
+        search.autocomplete = 'off';
+        select.parentNode.insertBefore(search, select);
+        select.parentNode.insertBefore(document.createElement('br'), select);
+
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            var text = search.value.trim();
+            if (text.length < MIN_LENGTH) {
+                return;
+            }
+            timer = setTimeout(function () {
+                var url = select.getAttribute('data-autocomplete-url') + '?q=' + encodeURIComponent(text);
+                fetch(url, {credentials: 'same-origin'})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) { replaceOptions(select, data.results); });
+            }, DELAY);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        Array.prototype.slice.call(document.querySelectorAll('select[data-autocomplete-url]')).forEach(attach);
+    });
+})();
@@ -0,0 +1,93 @@
+import datetime
+import logging
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TransactionTestCase
+
+from catalog.loans import borrow_copy, return_copy
+from catalog.models import Author, Book, BookInstance, Language
+
+## the throughput of the stress test is logged at DEBUG level: run the tests with CATALOG_LOG_LEVEL=DEBUG to see it
+logger = logging.getLogger(__name__)
+
+'''
+# stress test for borrow_copy()/return_copy(): many threads race for the same copy
+# TransactionTestCase is needed because every thread uses its own database connection, which cannot see
+# data created inside the transaction of a regular TestCase.
+'''
+class BorrowRaceTest(TransactionTestCase):
+    number_of_patrons = 20
+    number_of_rounds = 10
+
+    def setUp(self):
+        # the in-memory SQLite test database locks its tables against the other threads: the losers would fail
+        # with 'database table is locked' instead of losing the race
+        if connection.vendor != 'postgresql':
+            self.skipTest('concurrent transactions need PostgreSQL')
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='en')
+        self.test_book = Book.objects.create(
+            title='Book Title',
+            summary='My book summary',
+            isbn='ABCDEFG',
+            author=test_author,
+            language=test_language,
+            pubdate=datetime.date.today(),
+        )
+        self.copy = BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='a')
+        self.patrons = [User.objects.create_user(username=f'patron{number}', password='1X<ISRUkw+tuK')
+                        for number in range(self.number_of_patrons)]
+
+    # start one thread per patron at the same moment; return the result of each call.
+    # An exception in a thread is raised again here, so that a crashing loser fails the test.
+    def race(self, action):
+        barrier = threading.Barrier(len(self.patrons))
+        results = [None] * len(self.patrons)
+        errors = []
+
+        def run(index, patron):
+            try:
+                # every thread loads its own copy of the record, as a request would
+                copy = BookInstance.objects.get(pk=self.copy.pk)
+                barrier.wait()
+                results[index] = action(copy, patron)
+            except Exception as error:
+                errors.append(error)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index, patron)) for index, patron in enumerate(self.patrons)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def test_exactly_one_concurrent_borrow_succeeds(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        started = time.perf_counter()
+        for round in range(self.number_of_rounds):
+            results = self.race(lambda copy, patron: borrow_copy(copy, patron, due_back))
+            self.assertEqual(results.count(True), 1)
+            self.assertEqual(results.count(False), len(self.patrons) - 1)
+            winner = self.patrons[results.index(True)]
+
+            copy = BookInstance.objects.get(pk=self.copy.pk)
+            self.assertEqual((copy.status, copy.borrower), ('o', winner))
+            # only the winner can return it, and only once
+            results = self.race(lambda copy, patron: return_copy(copy, winner))
+            self.assertEqual(results.count(True), 1)
+            self.assertEqual(results.count(False), len(self.patrons) - 1)
+        elapsed = time.perf_counter() - started
+
+        attempts = 2 * self.number_of_rounds * self.number_of_patrons
+        throughput = '%d concurrent borrow/return attempts in %.2fs (%.0f attempts/s)' % (attempts, elapsed, attempts / elapsed)
+        logger.debug(throughput)
+        self.test_book.refresh_from_db()
+        self.assertEqual((self.test_book.copies_available, self.test_book.copies_on_loan), (1, 0), throughput)
@@ -35,4 +35,24 @@ class RenewBookFormTest(TestCase):
     def test_renew_form_date_max(self):
         date = timezone.now() + datetime.timedelta(weeks=12) 
         form = RenewBookForm(data={'renewal_date': date})
-        self.assertTrue(form.is_valid())
\ No newline at end of file
+        self.assertTrue(form.is_valid())
+
+from catalog.forms import BulkRenewForm
+
+# test class for BulkRenewForm
+class BulkRenewFormTest(TestCase):
+    def test_renewal_date_follows_renew_book_rule(self):
+        date = datetime.date.today() + datetime.timedelta(weeks=12, days=1)
+        form = BulkRenewForm(data={'renewal_date': date, 'due_before': datetime.date.today()})
+        self.assertFalse(form.is_valid())
+        self.assertIn('renewal_date', form.errors)
+    
+    def test_date_or_weeks_required(self):
+        self.assertFalse(BulkRenewForm(data={'due_before': datetime.date.today()}).is_valid())
+        self.assertFalse(BulkRenewForm(data={'due_before': datetime.date.today(), 'weeks': 3,
+                                             'renewal_date': datetime.date.today()}).is_valid())
+        self.assertTrue(BulkRenewForm(data={'due_before': datetime.date.today(), 'weeks': 3}).is_valid())
+    
+    def test_selection_required(self):
+        form = BulkRenewForm(data={'weeks': 3})
+        self.assertFalse(form.is_valid())
@@ -63,4 +63,507 @@ class AuthorModelTest(TestCase):
     def test_get_absolute_url(self):
         author = Author.objects.get(id=1)
         # This will also fail if the urlconf is not defined.
-        self.assertEquals(author.get_absolute_url(), '/catalog/author/1/')
\ No newline at end of file
+        self.assertEquals(author.get_absolute_url(), '/catalog/author/1/')
+
+
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+
+from catalog.models import Book, BookInstance, Genre, Language, CatalogStats
+
+'''
+# test class for CatalogStats: counters follow saves/deletes and reconcile fixes drift
+'''
+class CatalogStatsTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.genre = Genre.objects.create(name='Science Fiction')
+        self.language = Language.objects.create(name='en')
+        self.book = Book.objects.create(
+            title='Book Title',
+            summary='My book summary',
+            isbn='ABCDEFG',
+            author=self.author,
+            language=self.language,
+            pubdate=datetime.date.today(),
+        )
+    
+    # stats read from the row should match a full recount
+    def assertStatsMatchCount(self):
+        stats = CatalogStats.load()
+        for name, value in CatalogStats.count_all().items():
+            self.assertEqual(getattr(stats, name), value, name)
+    
+    def test_counters_follow_creates(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        stats = CatalogStats.load()
+        self.assertEqual(stats.num_books, 1)
+        self.assertEqual(stats.num_instances, 2)
+        self.assertEqual(stats.num_instances_available, 1)
+        self.assertEqual(stats.num_authors, 1)
+        self.assertEqual(stats.num_genre_c, 1)
+    
+    def test_status_change_updates_available_count(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        # change status on a record loaded from the database
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'a'
+        copy.save()
+        # saving again without a change must not count twice
+        copy.save()
+        self.assertEqual(CatalogStats.load().num_instances_available, 1)
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(CatalogStats.load().num_instances_available, 0)
+        self.assertStatsMatchCount()
+    
+    def test_genre_rename_and_deletes(self):
+        self.genre.name = 'Fantasy'
+        self.genre.save()
+        self.assertEqual(CatalogStats.load().num_genre_c, 0)
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.delete()
+        self.book.delete()
+        self.author.delete()
+        self.assertStatsMatchCount()
+    
+    def test_reconcile_command_fixes_drift(self):
+        CatalogStats.objects.filter(pk=CatalogStats.SINGLETON_ID).update(num_books=100, num_authors=-3)
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertStatsMatchCount()
+
+
+'''
+# test class for the copy counters on Book (see counters.py)
+'''
+from catalog.counters import Transition, record_transitions
+
+class BookCopyCountersTest(TestCase):
+    def setUp(self):
+        self.language = Language.objects.create(name='en')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        language=self.language, pubdate=datetime.date.today())
+        self.other_book = Book.objects.create(title='Other Title', summary='My book summary', isbn='ABCDEFG',
+                                              language=self.language, pubdate=datetime.date.today())
+    
+    def counts(self, book):
+        book.refresh_from_db()
+        return (book.copies_available, book.copies_on_loan, book.copies_reserved, book.copies_maintenance)
+    
+    def test_counters_follow_saves_and_deletes(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        self.assertEqual(self.counts(self.book), (1, 0, 0, 1))
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(self.counts(self.book), (0, 1, 0, 1))
+        # moving a copy to another book
+        copy.book = self.other_book
+        copy.save()
+        self.assertEqual(self.counts(self.book), (0, 0, 0, 1))
+        self.assertEqual(self.counts(self.other_book), (0, 1, 0, 0))
+        copy.delete()
+        self.assertEqual(self.counts(self.other_book), (0, 0, 0, 0))
+    
+    def test_saving_a_stale_book_keeps_counters(self):
+        stale_book = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        stale_book.title = 'New Title'
+        stale_book.save()
+        self.assertEqual(self.counts(self.book), (1, 0, 0, 0))
+    
+    def test_record_transitions_for_bulk_updates(self):
+        for copy in range(3):
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        BookInstance.objects.create(book=self.other_book, imprint='Imprint', status='m')
+        # a bulk update does not send signals, so it records its transitions itself
+        copies = list(BookInstance.objects.values_list('book_id', 'status'))
+        BookInstance.objects.update(status='r')
+        record_transitions(Transition(book_id, status, book_id, 'r') for book_id, status in copies)
+        self.assertEqual(self.counts(self.book), (0, 0, 3, 0))
+        self.assertEqual(self.counts(self.other_book), (0, 0, 1, 0))
+    
+    def test_verify_command_repairs_drift(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        Book.objects.filter(pk=self.book.pk).update(copies_available=7, copies_on_loan=2)
+        out = StringIO()
+        call_command('verify_book_counts', '--dry-run', stdout=out)
+        self.assertIn('copies_available stored 7, counted 1', out.getvalue())
+        self.assertEqual(self.counts(self.book), (7, 2, 0, 0))
+        call_command('verify_book_counts', stdout=StringIO())
+        self.assertEqual(self.counts(self.book), (1, 0, 0, 0))
+
+
+'''
+# test class for the overdue queries of BookInstance
+'''
+class BookInstanceOverdueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date.today()
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', pubdate=today)
+        cls.late = BookInstance.objects.create(book=test_book, imprint='Imprint', status='o', due_back=today - datetime.timedelta(days=3))
+        cls.due_today = BookInstance.objects.create(book=test_book, imprint='Imprint', status='o', due_back=today)
+        cls.no_due_date = BookInstance.objects.create(book=test_book, imprint='Imprint', status='o')
+        # not on loan any more, so not overdue whatever its due date says
+        cls.returned = BookInstance.objects.create(book=test_book, imprint='Imprint', status='a', due_back=today - datetime.timedelta(days=3))
+    
+    def test_overdue_lists_late_loans_only(self):
+        self.assertEqual(list(BookInstance.objects.overdue()), [self.late])
+    
+    def test_overdue_on_a_given_day(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.assertEqual(set(BookInstance.objects.overdue(tomorrow)), {self.late, self.due_today})
+    
+    def test_annotation_matches_is_overdue(self):
+        for copy in BookInstance.objects.annotate_overdue():
+            self.assertEqual(copy.overdue, copy.is_overdue)
+
+
+'''
+# test class for the notify_borrowers command
+'''
+from django.contrib.auth.models import User
+from unittest import mock
+from django.core import mail
+from catalog.management.commands.notify_borrowers import Command
+from catalog.models import LoanNotice
+
+class NotifyBorrowersTest(TestCase):
+    def setUp(self):
+        today = datetime.date.today()
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', pubdate=today)
+        self.reader = User.objects.create_user(username='reader', email='reader@example.com', password='1X<ISRUkw+tuK')
+        no_email = User.objects.create_user(username='noemail', password='1X<ISRUkw+tuK')
+        
+        def loan(borrower, days, status='o'):
+            return BookInstance.objects.create(book=test_book, imprint='Imprint', status=status, borrower=borrower,
+                                               due_back=today + datetime.timedelta(days=days))
+        self.overdue = loan(self.reader, -2)
+        self.due_soon = loan(self.reader, 1)
+        loan(self.reader, 10)
+        loan(self.reader, -2, status='a')
+        loan(no_email, -1)
+    
+    def notify(self):
+        out = StringIO()
+        call_command('notify_borrowers', days=3, stdout=out)
+        return out.getvalue()
+    
+    def test_one_digest_per_borrower(self):
+        self.assertIn('Sent 1 digests, skipped 1 borrowers', self.notify())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertEqual(mail.outbox[0].subject, 'Overdue books')
+        self.assertEqual(set(LoanNotice.objects.values_list('copy_id', 'kind')),
+                         {(self.overdue.pk, LoanNotice.OVERDUE), (self.due_soon.pk, LoanNotice.DUE_SOON)})
+    
+    def test_second_run_sends_nothing(self):
+        self.notify()
+        self.assertIn('Sent 0 digests', self.notify())
+        self.assertEqual(len(mail.outbox), 1)
+    
+    def test_renewed_loan_is_reminded_again(self):
+        self.notify()
+        self.overdue.due_back = datetime.date.today() + datetime.timedelta(days=2)
+        self.overdue.save()
+        self.notify()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].subject, 'Books due soon')
+        # the other loan due soon was already reminded
+        self.assertEqual(mail.outbox[1].body.count('- Book Title'), 1)
+    
+    def test_loans_claimed_by_another_run_are_skipped(self):
+        # another run records the overdue notice while this one is preparing its digests
+        digest = Command.digest
+        def claim_first(username, email, rows):
+            LoanNotice.objects.create(copy=self.overdue, borrower=self.reader, kind=LoanNotice.OVERDUE,
+                                      due_back=self.overdue.due_back)
+            return digest(username, email, rows)
+        with mock.patch.object(Command, 'digest', side_effect=claim_first):
+            self.assertIn('Sent 0 digests', self.notify())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(LoanNotice.objects.count(), 1)
+    
+    def test_failed_send_releases_the_notices_not_sent(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='1X<ISRUkw+tuK')
+        late = BookInstance.objects.create(book=self.overdue.book, imprint='Imprint', status='o', borrower=other,
+                                           due_back=self.overdue.due_back)
+        # the reader's digest is sent, then the connection fails on the other borrower's
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=[1, OSError]):
+            with self.assertRaises(OSError):
+                self.notify()
+        self.assertEqual(set(LoanNotice.objects.values_list('borrower_id', flat=True)), {self.reader.pk})
+        self.assertIn('Sent 1 digests', self.notify())
+        self.assertEqual(mail.outbox[0].to, ['other@example.com'])
+        self.assertTrue(LoanNotice.objects.filter(copy=late, borrower=other).exists())
+    
+    def test_dry_run_sends_and_records_nothing(self):
+        out = StringIO()
+        call_command('notify_borrowers', dry_run=True, stdout=out)
+        self.assertIn('1 digests to send', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(LoanNotice.objects.exists())
+
+
+'''
+# test class for the per-borrower loan counter (BorrowerStats)
+'''
+from catalog.models import BorrowerStats
+from catalog.loans import borrow_copy, return_copy, checkout_copies, checkin_copies
+
+class BorrowerStatsTest(TestCase):
+    def setUp(self):
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        pubdate=datetime.date.today())
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        self.other = User.objects.create_user(username='other', password='1X<ISRUkw+tuK')
+        self.copies = [BookInstance.objects.create(book=test_book, imprint='Imprint', status='a') for copy in range(5)]
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+    
+    def assertLoans(self, user, count):
+        self.assertEqual(BorrowerStats.load(user.pk).active_loans, count)
+        self.assertEqual(BorrowerStats.count_loans(user.pk), count)
+    
+    def test_loan_paths_keep_count(self):
+        borrow_copy(self.copies[0], self.reader, self.due_back)
+        checkout_copies([copy.pk for copy in self.copies[1:4]], self.reader, self.due_back)
+        self.assertLoans(self.reader, 4)
+        return_copy(self.copies[0], self.reader)
+        checkin_copies([self.copies[1].pk, self.copies[2].pk])
+        self.assertLoans(self.reader, 1)
+    
+    def test_saves_and_deletes_keep_count(self):
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status, copy.borrower = 'o', self.reader
+        copy.save()
+        self.assertLoans(self.reader, 1)
+        # lending the copy to someone else moves the loan
+        copy.borrower = self.other
+        copy.save()
+        self.assertLoans(self.reader, 0)
+        self.assertLoans(self.other, 1)
+        copy.delete()
+        self.assertLoans(self.other, 0)
+    
+    def test_reconcile_fixes_drift(self):
+        checkout_copies([copy.pk for copy in self.copies], self.reader, self.due_back)
+        BorrowerStats.objects.filter(pk=self.reader.pk).update(active_loans=2)
+        out = StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertIn('loans of user %s: stored 2, counted 5' % self.reader.pk, out.getvalue())
+        self.assertLoans(self.reader, 5)
+
+
+'''
+# test class for change_status() and the set_copy_status command
+'''
+import os
+import tempfile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from catalog.loans import change_status
+from catalog.counters import find_drift
+
+class ChangeStatusTest(TestCase):
+    def setUp(self):
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             pubdate=datetime.date.today())
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        for status in 'mmmmaar':
+            BookInstance.objects.create(book=self.test_book, imprint='Imprint', status=status)
+        BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='o', borrower=self.reader, due_back=self.due_back)
+    
+    def assertCounters(self, **counters):
+        self.test_book.refresh_from_db()
+        self.assertEqual({name: getattr(self.test_book, name) for name in counters}, counters)
+        self.assertEqual(list(find_drift(Book.objects.all())), [])
+        self.assertEqual(CatalogStats.load().num_instances_available, BookInstance.objects.filter(status='a').count())
+    
+    def test_change_status_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(change_status(BookInstance.objects.filter(status='m'), 'a', chunk_size=2), 4)
+        # one UPDATE per chunk of 2 copies
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "catalog_bookinstance"')]
+        self.assertEqual(len(updates), 2)
+        self.assertCounters(copies_available=6, copies_maintenance=0)
+    
+    def test_copies_taken_off_loan_lose_borrower(self):
+        self.assertEqual(change_status(BookInstance.objects.all(), 'm'), 4)
+        self.assertFalse(BookInstance.objects.exclude(borrower=None, due_back=None).exists())
+        self.assertCounters(copies_maintenance=8, copies_on_loan=0, copies_available=0)
+        self.assertEqual(BorrowerStats.load(self.reader.pk).active_loans, 0)
+    
+    def test_only_available_copies_are_lent(self):
+        self.assertEqual(change_status(BookInstance.objects.all(), 'o', self.reader, self.due_back), 2)
+        self.assertCounters(copies_on_loan=3, copies_available=0, copies_maintenance=4)
+        self.assertEqual(BorrowerStats.load(self.reader.pk).active_loans, 3)
+        with self.assertRaises(ValueError):
+            change_status(BookInstance.objects.all(), 'o')
+    
+    def test_command(self):
+        out = StringIO()
+        call_command('set_copy_status', 'r', book=self.test_book.pk, from_status='m', stdout=out)
+        self.assertIn('Changed the status of 4 copies.', out.getvalue())
+        self.assertCounters(copies_reserved=5, copies_maintenance=0)
+    
+    def test_command_reads_ids_file_in_chunks(self):
+        copy_ids = list(BookInstance.objects.filter(status='m').values_list('pk', flat=True))
+        handle, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as output:
+            output.write('\n'.join([str(copy_id) for copy_id in copy_ids] + ['', 'not-an-id']))
+        out = StringIO()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                call_command('set_copy_status', 'a', ids_file=path, chunk_size=3, stdout=out)
+        finally:
+            os.remove(path)
+        self.assertIn('Invalid id: not-an-id', out.getvalue())
+        self.assertIn('Changed the status of 4 copies.', out.getvalue())
+        self.assertCounters(copies_available=6, copies_maintenance=0)
+        # no statement lists more ids than a chunk (ids are shown with dashes on PostgreSQL, without on SQLite)
+        self.assertLessEqual(max(sum(str(copy_id) in query['sql'] or copy_id.hex in query['sql'] for copy_id in copy_ids)
+                                 for query in queries.captured_queries), 3)
+
+
+'''
+# test class for CatalogImporter and the import_catalog command
+'''
+import json
+import os
+import tempfile
+from catalog.importer import CatalogImporter
+
+class ImportCatalogTest(TestCase):
+    def setUp(self):
+        self.existing_author = Author.objects.create(first_name='John', last_name='Smith')
+        self.existing_genre = Genre.objects.create(name='Fantasy')
+        self.records = [
+            {'title': 'First Book', 'summary': 'Summary', 'isbn': '1234567890123', 'pubdate': '2016-03-01',
+             'author_first_name': 'John', 'author_last_name': 'Smith', 'genres': ['Fantasy', 'Science Fiction'],
+             'language': 'English', 'copies': 3, 'imprint': 'Imprint, 2016'},
+            {'title': 'Second Book', 'summary': 'Summary', 'isbn': '1234567890124', 'pubdate': '2017-05-02',
+             'author_first_name': 'Jane', 'author_last_name': 'Doe', 'genres': ['Science Fiction', 'Comedy'],
+             'language': 'fr', 'copies': 2, 'status': 'm'},
+            {'title': 'Third Book', 'summary': 'Summary', 'isbn': '1234567890125', 'pubdate': '2018-01-03',
+             'author_first_name': 'Jane', 'author_last_name': 'Doe', 'genres': [], 'copies': 0},
+        ]
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as output:
+            for record in self.records:
+                output.write(json.dumps(record) + '\n')
+            output.write('{"title": "Bad Book", "isbn": "12345678901234567", "pubdate": "someday", "copies": -1}\n')
+            output.write('not json\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_import(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as report:
+            call_command('import_catalog', self.path, batch_size=2, errors=report.name, stdout=out)
+            rejected = [json.loads(line) for line in report]
+        self.assertIn('Imported 3 books, 5 copies, 1 authors, 2 genres and 2 languages; 2 records rejected.', out.getvalue())
+        self.assertEqual([entry['line'] for entry in rejected], [4, 5])
+        self.assertEqual(sorted(rejected[0]['errors']), ['copies', 'isbn', 'pubdate', 'summary'])
+
+        first = Book.objects.get(title='First Book')
+        self.assertEqual(first.author, self.existing_author)
+        self.assertEqual(sorted(first.genre.values_list('name', flat=True)), ['Fantasy', 'Science Fiction'])
+        self.assertEqual(first.language.name, 'en')
+        self.assertEqual(first.copies_available, 3)
+        self.assertEqual(first.bookinstance_set.filter(imprint='Imprint, 2016', status='a').count(), 3)
+        second = Book.objects.get(title='Second Book')
+        self.assertEqual((second.author.last_name, second.copies_maintenance, second.copies_available), ('Doe', 2, 0))
+        self.assertEqual(Book.objects.get(title='Third Book').author, second.author)
+
+        # bulk_create() sends no signals: the importer keeps the counters right itself
+        self.assertEqual(list(find_drift(Book.objects.all())), [])
+        stats = CatalogStats.load()
+        self.assertEqual(
+            (stats.num_books, stats.num_authors, stats.num_genre_c, stats.num_instances, stats.num_instances_available),
+            (3, 2, 2, 5, 3))
+
+    def test_values_of_the_wrong_type_are_rejected(self):
+        record = self.records[0]
+        with open(self.path, 'w') as output:
+            for bad in ({'genres': [1, 2]}, {'genres': 7}, {'author_first_name': 5}, {'language': ['en']},
+                        {'title': {'text': 'First Book'}, 'pubdate': 20160301}, {'imprint': 2016}):
+                output.write(json.dumps(dict(record, **bad)) + '\n')
+        out = StringIO()
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as report:
+            call_command('import_catalog', self.path, errors=report.name, stdout=out)
+            rejected = [json.loads(line) for line in report]
+        self.assertIn('6 records rejected', out.getvalue())
+        self.assertEqual([sorted(entry['errors']) for entry in rejected],
+                         [['genres'], ['genres'], ['author_first_name'], ['language'], ['pubdate', 'title'], ['imprint']])
+        self.assertFalse(Book.objects.exists())
+    
+    def test_batches_use_constant_queries(self):
+        importer = CatalogImporter(batch_size=100)
+        for number in range(50):
+            importer.add(dict(self.records[1], title='Book %d' % number, copies=2))
+        with CaptureQueriesContext(connection) as queries:
+            importer.flush()
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT') and 'catalog_catalogstats' not in query['sql']]
+        # authors, genres, language, books, genre rows, copies (books one by one where ids are not returned)
+        if connection.features.can_return_ids_from_bulk_insert:
+            self.assertEqual(len(inserts), 6)
+        self.assertEqual(BookInstance.objects.count(), 100)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('import_catalog', self.path, dry_run=True, stdout=out)
+        self.assertIn('Would import 3 books, 5 copies, 1 authors, 2 genres and 2 languages; 2 records rejected.', out.getvalue())
+        self.assertIn('Line 5: record: Invalid JSON', out.getvalue())
+        self.assertEqual((Book.objects.count(), Author.objects.count(), Genre.objects.count()), (0, 1, 1))
+
+
+'''
+# test class for CatalogGenerator and the generate_catalog command
+'''
+from django.core.management.base import CommandError
+from catalog.generator import CatalogGenerator
+
+class GenerateCatalogTest(TestCase):
+    def generate(self, seed):
+        generator = CatalogGenerator(books=200, copies_per_book=5, users=20, active_loans=100, seed=seed)
+        generator.generate()
+        return generator
+    
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_catalog', books=200, copies_per_book=5, users=20, active_loans=100, stdout=out)
+        self.assertIn('Generated 200 books, 1000 copies', out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith='reader0_').count(), 20)
+        # copy counters set at insert, catalog and borrower counters reconciled
+        self.assertEqual(list(find_drift(Book.objects.all())), [])
+        self.assertEqual(CatalogStats.load().num_instances, 1000)
+        self.assertEqual(CatalogStats.load().num_instances_on_loan, BookInstance.objects.filter(status='o').count())
+        self.assertEqual(sum(BorrowerStats.objects.values_list('active_loans', flat=True)),
+                         BookInstance.objects.filter(status='o').count())
+        # the same seed cannot be generated twice (usernames would clash)
+        with self.assertRaises(CommandError):
+            call_command('generate_catalog', books=1, stdout=StringIO())
+    
+    def test_skewed_and_reproducible(self):
+        generator = self.generate(seed=5)
+        copies = sorted(Book.objects.values_list('copies_available', 'copies_on_loan', 'copies_reserved', 'copies_maintenance'),
+                        key=sum, reverse=True)
+        # popular books have many copies, most books fewer than the average of 5
+        self.assertGreater(sum(copies[0]), 20)
+        self.assertLess(sum(copies[len(copies) // 2]), 5)
+        self.assertGreater(generator.created['loans'], 50)
+        self.assertFalse(BookInstance.objects.filter(status='o', borrower=None).exists())
+        
+        first = list(BookInstance.objects.order_by('pk').values_list('pk', 'status', 'due_back'))
+        BookInstance.objects.all().delete()
+        Book.objects.all().delete()
+        User.objects.all().delete()
+        self.generate(seed=5)
+        self.assertEqual(list(BookInstance.objects.order_by('pk').values_list('pk', 'status', 'due_back')), first)
@@ -182,6 +182,17 @@ class MyBorrowListViewTest(TestCase):
                 self.assertTrue(last_date <= book.due_back)
                 last_date = book.due_back
 
+    def test_my_borrow_queries_do_not_grow_with_page(self):
+        for copy in BookInstance.objects.all():
+            copy.status = 'o'
+            copy.save()
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.get(reverse('my_borrow'))
+        # session, user, permissions (2), loan counter and the page with its books
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('my_borrow'))
+        self.assertEqual(response.context['num_myborrow'], 15)
+
 '''
 # test class for renew_book_librarian
 '''
@@ -367,4 +378,1163 @@ class AuthorCreateTest(TestCase):
         login = self.client.login(username='user2', password='p1o2i3u4')
         response = self.client.get(reverse('author_create'))
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'author_form.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'author_form.html')
+
+from catalog.pagination import KeysetPaginator
+'''
+# test class for keyset (cursor) pagination of BookListView and AuthorListView
+'''
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 13 authors, and 9 books sharing 3 titles so that the descending publication date decides the order
+        for author_id in range(13):
+            Author.objects.create(first_name=f'Christian {author_id}', last_name=f'Surname {author_id % 4}')
+        test_language = Language.objects.create(name='en')
+        for book_id in range(9):
+            Book.objects.create(
+                title=f'Book Title {book_id % 3}',
+                summary='My book summary',
+                isbn='ABCDEFG',
+                author=Author.objects.first(),
+                language=test_language,
+                pubdate=datetime.date(2000 + book_id, 1, 1),
+            )
+        User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def setUp(self):
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    # follow the next cursors from the first page and collect every row shown
+    def walk_forward(self, url_name, context_name):
+        response = self.client.get(reverse(url_name))
+        rows = list(response.context[context_name])
+        pages = [rows]
+        while response.context['page_obj'].has_next():
+            response = self.client.get(reverse(url_name), {'cursor': response.context['page_obj'].next_cursor})
+            self.assertEqual(response.status_code, 200)
+            pages.append(list(response.context[context_name]))
+        return pages, response
+    
+    def test_book_pages_follow_model_ordering(self):
+        pages, response = self.walk_forward('books', 'list_of_books')
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        shown = [book.pk for page in pages for book in page]
+        self.assertEqual(shown, list(Book.objects.order_by('title', '-pubdate', 'id').values_list('pk', flat=True)))
+    
+    def test_author_pages_walk_back_to_first_page(self):
+        pages, response = self.walk_forward('authors', 'author_list')
+        self.assertEqual([len(page) for page in pages], [10, 3])
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['author_list']), pages[0])
+        self.assertFalse(response.context['page_obj'].has_previous())
+    
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('authors'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+    
+    # the seek condition starts with a plain bound on the first sort field, where an index scan can start
+    def test_seek_filter_bounds_first_field(self):
+        paginator = KeysetPaginator(Book.objects.all(), 4, ['title', '-pubdate', 'id'])
+        book = Book.objects.get(pubdate=datetime.date(2004, 1, 1))
+        values = [book.title, book.pubdate, book.pk]
+        self.assertIn('"catalog_book"."title" >= Book Title 1 AND',
+                      str(Book.objects.filter(paginator.seek_filter(values, True)).query))
+        self.assertIn('"catalog_book"."title" <= Book Title 1 AND',
+                      str(Book.objects.filter(paginator.seek_filter(values, False)).query))
+        ordered = list(Book.objects.order_by('title', '-pubdate', 'id'))
+        self.assertEqual(list(Book.objects.filter(paginator.seek_filter(values, True)).order_by('title', '-pubdate', 'id')),
+                         ordered[ordered.index(book) + 1:])
+
+
+'''
+# test class for BookDetailView: fixed number of queries, and the cached copies section
+'''
+from django.core.cache import cache
+from django.test import override_settings
+
+class BookDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='en')
+        cls.test_book = Book.objects.create(
+            title='Book Title',
+            summary='My book summary',
+            isbn='ABCDEFG',
+            author=test_author,
+            language=test_language,
+            pubdate=datetime.date.today(),
+        )
+        cls.test_book.genre.set([Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Crime')])
+        User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def add_copies(self, number, status='a'):
+        for copy in range(number):
+            BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status=status)
+    
+    def test_query_count_does_not_grow_with_copies(self):
+        self.add_copies(1)
+        # session + user, book with author and language, genres, copies, and 2 permission lookups for the sidebar
+        with self.assertNumQueries(7):
+            self.client.get(reverse('book_details', args=[self.test_book.pk]))
+        self.add_copies(10)
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('book_details', args=[self.test_book.pk]))
+        self.assertEqual(response.content.decode().count('Borrow the Copy'), 11)
+
+
+'''
+# test class for the invalidation of the cached copies section
+# TransactionTestCase is needed because the cache is only invalidated when the transaction changing a copy commits
+'''
+from django.db import transaction
+from django.test import TransactionTestCase
+
+@override_settings(CATALOG_COPIES_CACHE_TIMEOUT=60)
+class BookCopiesCacheTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             author=Author.objects.create(first_name='John', last_name='Smith'),
+                                             language=Language.objects.create(name='en'), pubdate=datetime.date.today())
+        for copy in range(2):
+            BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='a')
+        User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def borrow_buttons(self):
+        response = self.client.get(reverse('book_details', args=[self.test_book.pk]))
+        return response.content.decode().count('Borrow the Copy')
+    
+    def test_cached_copies_skip_query_until_a_copy_changes(self):
+        self.client.get(reverse('book_details', args=[self.test_book.pk]))
+        # the copies come from the cache
+        with self.assertNumQueries(6):
+            self.client.get(reverse('book_details', args=[self.test_book.pk]))
+        # saving a copy drops the cached section
+        copy = BookInstance.objects.first()
+        copy.status = 'm'
+        copy.save()
+        self.assertEqual(self.borrow_buttons(), 1)
+    
+    def test_cache_is_kept_until_commit(self):
+        self.assertEqual(self.borrow_buttons(), 2)
+        with transaction.atomic():
+            BookInstance.objects.filter(pk=BookInstance.objects.first().pk).update(status='m')
+            Book.invalidate_copies_cache(self.test_book.pk)
+            # a request made before the commit still sees the cached copies
+            self.assertEqual(self.borrow_buttons(), 2)
+        self.assertEqual(self.borrow_buttons(), 1)
+        # a change that is rolled back does not drop the cached section
+        try:
+            with transaction.atomic():
+                copy = BookInstance.objects.get(status='a')
+                copy.status = 'm'
+                copy.save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.assertNumQueries(6):
+            self.assertEqual(self.borrow_buttons(), 1)
+
+
+'''
+# test class for BookSearchView (full-text search maintained by database triggers)
+'''
+class BookSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        test_language = Language.objects.create(name='en')
+        for title, summary in (('The Dispossessed', 'An anarchist physicist travels between twin planets.'),
+                               ('A Wizard of Earthsea', 'A young wizard hunts the shadow he released.'),
+                               ('Planets and Moons', 'A survey of the solar system.')):
+            Book.objects.create(title=title, summary=summary, isbn='ABCDEFG', author=cls.author,
+                                language=test_language, pubdate=datetime.date.today())
+        User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def setUp(self):
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def search(self, terms):
+        response = self.client.get(reverse('book_search'), {'q': terms})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'book_search.html')
+        return [book.title for book in response.context['list_of_books']]
+    
+    # ranking, stemming and the author name need the PostgreSQL search document; other databases only match titles
+    def require_full_text_search(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('full-text search is only available on PostgreSQL')
+    
+    def test_title_match_ranks_above_summary_match(self):
+        self.require_full_text_search()
+        # 'planets' is in one title and in another summary; stemming matches 'planet'
+        self.assertEqual(self.search('planet'), ['Planets and Moons', 'The Dispossessed'])
+    
+    def test_search_by_author_name_follows_rename(self):
+        self.require_full_text_search()
+        self.assertEqual(len(self.search('guin')), 3)
+        self.author.last_name = 'Smith'
+        self.author.save()
+        self.assertEqual(self.search('guin'), [])
+        self.assertEqual(len(self.search('smith')), 3)
+    
+    def test_search_follows_book_update(self):
+        self.require_full_text_search()
+        book = Book.objects.get(title='A Wizard of Earthsea')
+        book.summary = 'Dragons.'
+        book.save()
+        self.assertEqual(self.search('dragon'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.search('shadow'), [])
+    
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.search(''), [])
+    
+    def test_title_search_on_every_database(self):
+        self.assertEqual(self.search('Earthsea'), ['A Wizard of Earthsea'])
+
+
+'''
+# test class for the autocomplete views and the Book form widgets using them
+'''
+class AutocompleteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for author_id in range(30):
+            Author.objects.create(first_name=f'Christian {author_id}', last_name=f'Surname {author_id}')
+        cls.le_guin = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        Genre.objects.create(name='Fantasy')
+        Genre.objects.create(name='Science Fiction')
+        test_user = User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+        test_user.user_permissions.add(Permission.objects.get(name='Update book details'))
+    
+    def setUp(self):
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def autocomplete(self, url_name, text):
+        response = self.client.get(reverse(url_name), {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [result['text'] for result in response.json()['results']]
+    
+    def test_author_matches_every_word(self):
+        self.assertEqual(self.autocomplete('autocomplete_author', 'guin urs'), ['Le Guin, Ursula'])
+        self.assertEqual(self.autocomplete('autocomplete_author', 'Le Guin, Ursula'), ['Le Guin, Ursula'])
+    
+    def test_result_count_is_capped(self):
+        self.assertEqual(len(self.autocomplete('autocomplete_author', 'surname')), 20)
+    
+    def test_short_query_returns_nothing(self):
+        self.assertEqual(self.autocomplete('autocomplete_genre', 'fa'), [])
+        self.assertEqual(self.autocomplete('autocomplete_genre', 'fan'), ['Fantasy'])
+    
+    def test_book_form_only_renders_selected_options(self):
+        book = Book.objects.create(title='The Dispossessed', summary='My book summary', isbn='ABCDEFG',
+                                   author=self.le_guin, pubdate=datetime.date.today())
+        book.genre.set(Genre.objects.filter(name='Fantasy'))
+        response = self.client.get(reverse('book_update', args=[book.pk]))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('data-autocomplete-url="%s"' % reverse('autocomplete_author'), content)
+        self.assertIn('Le Guin, Ursula', content)
+        self.assertIn('Fantasy', content)
+        self.assertNotIn('Surname 1', content)
+        self.assertNotIn('Science Fiction', content)
+
+
+'''
+# test class for borrow_book_instance_view and return_book_instance_view
+'''
+class BorrowReturnViewTest(TestCase):
+    def setUp(self):
+        self.test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        pubdate=datetime.date.today())
+        self.copy = BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a')
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+    
+    def test_borrow_then_return(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('borrow_book', args=[self.copy.pk]), {'due_back': self.due_back})
+        self.assertRedirects(response, reverse('my_borrow'))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('o', self.test_user1, self.due_back))
+        response = self.client.post(reverse('return_book', args=[self.copy.pk]))
+        self.assertRedirects(response, reverse('my_borrow'))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('a', None, None))
+    
+    def test_borrowing_without_return_date_shows_form_error(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('borrow_book', args=[self.copy.pk]), {'due_back': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', 'due_back', 'This field is required.')
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'a')
+    
+    def test_borrowing_a_copy_on_loan_reports_error(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.post(reverse('borrow_book', args=[self.copy.pk]), {'due_back': self.due_back})
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('borrow_book', args=[self.copy.pk]), {'due_back': self.due_back})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['error'], 'Sorry, this copy is no longer available')
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.borrower, self.test_user1)
+
+
+'''
+# test class for checkout_view (borrow several copies in one request)
+'''
+import json
+
+class CheckoutViewTest(TestCase):
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             pubdate=datetime.date.today())
+        self.available = [BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='a') for copy in range(3)]
+        self.on_loan = BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='o')
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+    
+    def checkout(self, copies, due_back):
+        return self.client.post(reverse('checkout'), json.dumps({'copies': copies, 'due_back': str(due_back)}),
+                                content_type='application/json')
+    
+    def test_reports_result_per_copy(self):
+        unknown = str(uuid.uuid4())
+        copies = [str(copy.pk) for copy in self.available] + [str(self.on_loan.pk), unknown, 'not-a-uuid']
+        response = self.checkout(copies, self.due_back)
+        self.assertEqual(response.status_code, 200)
+        results = {item['id']: item['result'] for item in response.json()['results']}
+        self.assertEqual(response.json()['borrowed'], 3)
+        self.assertEqual(results[str(self.on_loan.pk)], 'unavailable')
+        self.assertEqual(results[unknown], 'unknown')
+        self.assertEqual(results['not-a-uuid'], 'invalid')
+        self.assertEqual(BookInstance.objects.filter(borrower=self.test_user, status='o', due_back=self.due_back).count(), 3)
+        self.test_book.refresh_from_db()
+        self.assertEqual((self.test_book.copies_available, self.test_book.copies_on_loan), (0, 4))
+    
+    def test_invalid_due_date_borrows_nothing(self):
+        response = self.checkout([str(copy.pk) for copy in self.available], datetime.date.today() + datetime.timedelta(weeks=5))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 3)
+    
+    def test_missing_due_date_borrows_nothing(self):
+        copies = [str(copy.pk) for copy in self.available]
+        for body in ({'copies': copies}, {'copies': copies, 'due_back': ''}, {'copies': copies, 'due_back': None}):
+            response = self.client.post(reverse('checkout'), json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json(), {'error': 'This field is required.'})
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 3)
+    
+    def test_copies_must_be_a_list(self):
+        for copies in (str(self.available[0].pk), {'id': str(self.available[0].pk)}, 3):
+            self.assertEqual(self.checkout(copies, self.due_back).status_code, 400, copies)
+        response = self.client.post(reverse('checkout'), '[1, 2]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 3)
+    
+    def test_get_not_allowed(self):
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 405)
+
+
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+'''
+# test class for the check-in view and the checkin_books command
+'''
+class CheckinTest(TestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        self.librarian.user_permissions.add(Permission.objects.get(name='Check in returned books'))
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             pubdate=datetime.date.today())
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.on_loan = [BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='o',
+                                                    borrower=borrower, due_back=due_back) for copy in range(3)]
+        self.available = BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='a')
+        self.unknown = uuid.uuid4()
+        self.lines = [str(copy.pk) for copy in self.on_loan] + ['', str(self.available.pk), str(self.unknown), 'not-a-uuid']
+    
+    def assertCheckedIn(self):
+        self.assertFalse(BookInstance.objects.filter(status='o').exists())
+        self.assertFalse(BookInstance.objects.exclude(borrower=None).exists())
+        self.test_book.refresh_from_db()
+        self.assertEqual((self.test_book.copies_available, self.test_book.copies_on_loan), (4, 0))
+    
+    def test_permission_required(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('checkin'), '\n'.join(self.lines), content_type='text/plain')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BookInstance.objects.filter(status='o').count(), 3)
+    
+    def test_text_body_returns_json(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('checkin'), '\n'.join(self.lines), content_type='text/plain')
+        self.assertEqual(response.json(), {
+            'returned': 3,
+            'not_on_loan': [str(self.available.pk)],
+            'unknown': [str(self.unknown)],
+            'invalid': ['not-a-uuid'],
+        })
+        self.assertCheckedIn()
+    
+    def test_form_renders_summary(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        self.assertTemplateUsed(self.client.get(reverse('checkin')), 'checkin.html')
+        response = self.client.post(reverse('checkin'), {'copies': '\r\n'.join(self.lines)})
+        self.assertEqual(response.context['result']['returned'], 3)
+        self.assertContains(response, str(self.unknown))
+        self.assertCheckedIn()
+    
+    def test_command_checks_in_from_file(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'returns.txt')
+            with open(path, 'w') as returns:
+                returns.write('\n'.join(self.lines))
+            call_command('checkin_books', path, chunk_size=2, stdout=out)
+        self.assertIn('Checked in 3 copies.', out.getvalue())
+        self.assertIn('Not on loan: %s' % self.available.pk, out.getvalue())
+        self.assertIn('Unknown copy: %s' % self.unknown, out.getvalue())
+        self.assertCheckedIn()
+
+
+'''
+# test class for AllBorrowListView: cursor pages over nullable sort fields, and the CSV export
+'''
+class AllBorrowListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        librarian.user_permissions.add(Permission.objects.get(name='View all borrowed books'))
+        borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        books = [Book.objects.create(title=f'Book Title {book_id}', summary='My book summary', isbn='ABCDEFG',
+                                     pubdate=datetime.date.today()) for book_id in range(2)]
+        # 45 loans: 3 books (one of them missing), and some loans without a due date
+        for number in range(45):
+            due_back = None if number % 7 == 0 else datetime.date.today() + datetime.timedelta(days=number % 5)
+            BookInstance.objects.create(book=(books + [None])[number % 3], imprint='Imprint', status='o',
+                                        borrower=borrower, due_back=due_back)
+        BookInstance.objects.create(book=books[0], imprint='Imprint', status='a')
+    
+    def setUp(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+    
+    def expected_order(self):
+        # book ascending and due date descending, NULL after every value in both cases
+        loans = BookInstance.objects.filter(status='o')
+        loans = sorted(loans, key=lambda copy: str(copy.id))
+        loans = sorted(loans, key=lambda copy: (copy.due_back is None, copy.due_back or datetime.date.min), reverse=True)
+        loans = sorted(loans, key=lambda copy: (copy.book_id is None, copy.book_id or 0))
+        return [copy.pk for copy in loans]
+    
+    def test_cursor_pages_show_every_loan_once(self):
+        response = self.client.get(reverse('all_borrow'))
+        self.assertEqual(response.context['num_borrow'], 45)
+        pages = [[copy.pk for copy in response.context['allborrowedbook']]]
+        while response.context['page_obj'].has_next():
+            response = self.client.get(reverse('all_borrow'), {'cursor': response.context['page_obj'].next_cursor})
+            pages.append([copy.pk for copy in response.context['allborrowedbook']])
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual([pk for page in pages for pk in page], self.expected_order())
+        
+        # and back again
+        for page in reversed(pages[:-1]):
+            response = self.client.get(reverse('all_borrow'), {'cursor': response.context['page_obj'].previous_cursor})
+            self.assertEqual([copy.pk for copy in response.context['allborrowedbook']], page)
+        self.assertFalse(response.context['page_obj'].has_previous())
+    
+    def test_related_rows_loaded_with_the_page(self):
+        self.client.get(reverse('all_borrow'))
+        # session, user, permissions (2), stats row and the page itself, whatever the page size
+        with self.assertNumQueries(6):
+            self.client.get(reverse('all_borrow'))
+    
+    def test_csv_export_streams_every_loan(self):
+        response = self.client.get(reverse('all_borrow'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'copy,title,imprint,borrower,due_back')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(pk) for pk in self.expected_order()])
+
+
+'''
+# test class for OverdueListView
+'''
+class OverdueListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        librarian.user_permissions.add(Permission.objects.get(name='View all borrowed books'))
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        pubdate=datetime.date.today())
+        # 25 loans, 21 of them overdue by 1 to 21 days
+        for days in range(-4, 21):
+            BookInstance.objects.create(book=test_book, imprint='Imprint', status='o',
+                                        due_back=datetime.date.today() - datetime.timedelta(days=days + 1))
+    
+    def test_permission_required(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.client.get(reverse('overdue')).status_code, 403)
+    
+    def test_most_overdue_first(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('overdue'))
+        self.assertEqual(response.context['num_overdue'], 21)
+        copies = list(response.context['overduebook'])
+        self.assertEqual(len(copies), 20)
+        self.assertEqual([copy.due_back for copy in copies], sorted(copy.due_back for copy in copies))
+        self.assertTrue(all(copy.is_overdue for copy in copies))
+        response = self.client.get(reverse('overdue'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['overduebook']), 1)
+
+
+'''
+# test class for the bulk renewal view and the renew_loans command
+'''
+class BulkRenewTest(TestCase):
+    def setUp(self):
+        librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        librarian.user_permissions.add(Permission.objects.get(name='Renew a book'))
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        other = User.objects.create_user(username='other', password='1X<ISRUkw+tuK')
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             pubdate=datetime.date.today())
+        self.today = datetime.date.today()
+        
+        def loan(borrower, days):
+            return BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='o', borrower=borrower,
+                                               due_back=self.today + datetime.timedelta(days=days))
+        self.overdue = loan(self.reader, -3)
+        self.due_soon = [loan(self.reader, 5) for copy in range(3)]
+        # 11 weeks ahead: 3 more weeks would break the 12 weeks rule
+        self.due_late = loan(self.reader, 77)
+        self.not_selected = loan(other, 5)
+    
+    def renew(self, **data):
+        return self.client.post(reverse('bulk_renew'), json.dumps(data, default=str), content_type='application/json')
+    
+    def test_permission_required(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.assertEqual(self.renew(borrower='reader', weeks=3).status_code, 302)
+    
+    def test_extend_by_weeks(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        response = self.renew(borrower='reader', weeks=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'renewed': 4,
+            'rejected': [{'id': str(self.due_late.pk), 'due_back': (self.today + datetime.timedelta(days=77)).isoformat()}],
+        })
+        three_weeks = datetime.timedelta(weeks=3)
+        # an overdue loan is extended from today
+        self.overdue.refresh_from_db()
+        self.assertEqual(self.overdue.due_back, self.today + three_weeks)
+        self.assertEqual(set(BookInstance.objects.filter(pk__in=[copy.pk for copy in self.due_soon]).values_list('due_back', flat=True)),
+                         {self.today + datetime.timedelta(days=5) + three_weeks})
+        self.not_selected.refresh_from_db()
+        self.assertEqual(self.not_selected.due_back, self.today + datetime.timedelta(days=5))
+    
+    def test_renew_until_date(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        renewal_date = self.today + datetime.timedelta(weeks=4)
+        response = self.renew(due_before=self.today + datetime.timedelta(days=5), renewal_date=renewal_date)
+        self.assertEqual(response.json()['renewed'], 5)
+        self.assertEqual(BookInstance.objects.filter(due_back=renewal_date).count(), 5)
+    
+    def test_invalid_renewal_date_renews_nothing(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        response = self.renew(borrower='reader', renewal_date=self.today + datetime.timedelta(weeks=13))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('renewal_date', response.json()['errors'])
+    
+    def test_body_must_be_a_json_object(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        for body in ('[1, 2]', '"reader"', '3', 'not json'):
+            response = self.client.post(reverse('bulk_renew'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json(), {'error': 'Expected a JSON object'})
+    
+    def test_command_renews_in_chunks(self):
+        out = StringIO()
+        call_command('renew_loans', borrower='reader', weeks=3, chunk_size=2, stdout=out)
+        self.assertIn('Renewed 4 loans.', out.getvalue())
+        self.assertIn('Not renewed: %s' % self.due_late.pk, out.getvalue())
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from catalog.pagination import EstimatedCountPaginator
+'''
+# test class for the admin changelists: the number of queries does not depend on the number of rows
+'''
+class AdminChangelistQueriesTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='1X<ISRUkw+tuK')
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        self.genres = [Genre.objects.create(name=f'Genre {number}') for number in range(4)]
+        self.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+    
+    def add_books(self, count):
+        for number in range(count):
+            author = Author.objects.create(first_name='John', last_name=f'Smith {number}')
+            book = Book.objects.create(title=f'Book Title {number}', summary='My book summary', isbn='ABCDEFG',
+                                       author=author, pubdate=datetime.date.today())
+            book.genre.set(self.genres)
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=self.borrower,
+                                        due_back=datetime.date.today())
+    
+    def count_queries(self, url_name):
+        self.client.get(reverse(url_name))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def assertConstantQueries(self, url_name):
+        self.add_books(2)
+        few = self.count_queries(url_name)
+        self.add_books(10)
+        self.assertEqual(self.count_queries(url_name), few)
+    
+    def test_book_changelist(self):
+        self.assertConstantQueries('admin:catalog_book_changelist')
+    
+    def test_bookinstance_changelist(self):
+        self.assertConstantQueries('admin:catalog_bookinstance_changelist')
+    
+    def test_author_changelist(self):
+        self.assertConstantQueries('admin:catalog_author_changelist')
+
+
+'''
+# test class for EstimatedCountPaginator
+'''
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(30):
+            Author.objects.create(first_name='John', last_name=f'Smith {number}')
+    
+    def test_small_table_is_counted(self):
+        self.assertEqual(EstimatedCountPaginator(Author.objects.all(), 10).count, 30)
+    
+    def test_large_table_uses_estimate(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('row estimates are only read from PostgreSQL')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE catalog_author')
+        paginator = EstimatedCountPaginator(Author.objects.all(), 10)
+        paginator.estimate_threshold = 10
+        self.assertEqual(paginator.estimated_count(), 30)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 30)
+    
+    def test_filtered_list_is_counted(self):
+        paginator = EstimatedCountPaginator(Author.objects.filter(last_name__endswith='1'), 10)
+        paginator.estimate_threshold = 0
+        self.assertIsNone(paginator.estimated_count())
+        self.assertEqual(paginator.count, 3)
+
+
+'''
+# test class for the paginated inlines of the admin change pages
+'''
+class PaginatedInlineTest(TestCase):
+    def setUp(self):
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='1X<ISRUkw+tuK')
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             author=Author.objects.create(first_name='John', last_name='Smith'),
+                                             language=Language.objects.create(name='en'), pubdate=datetime.date.today())
+        self.test_book.genre.set([Genre.objects.create(name='Fantasy')])
+        self.add_copies(45)
+        self.url = reverse('admin:catalog_book_change', args=[self.test_book.pk])
+    
+    def add_copies(self, count):
+        for number in range(count):
+            BookInstance.objects.create(book=self.test_book, imprint=f'Imprint {number}', status='a')
+    
+    def test_inline_shows_one_page(self):
+        response = self.client.get(self.url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), 20)
+        self.assertContains(response, '45 book instances, page 1 of 3')
+        response = self.client.get(self.url, {formset.page_param: 3})
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 5)
+    
+    def test_change_page_queries_do_not_grow_with_copies(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self.add_copies(100)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(many), len(few))
+    
+    def test_save_one_page(self):
+        response = self.client.get(self.url, {'bookinstance_set-page': 2})
+        formset = response.context['inline_admin_formsets'][0].formset
+        copies = [form.instance for form in formset.initial_forms]
+        data = {
+            'title': self.test_book.title, 'summary': self.test_book.summary, 'isbn': self.test_book.isbn,
+            'pubdate': self.test_book.pubdate, 'language': self.test_book.language_id, 'author': self.test_book.author_id,
+            'genre': [genre.pk for genre in self.test_book.genre.all()],
+            'bookinstance_set-TOTAL_FORMS': len(copies), 'bookinstance_set-INITIAL_FORMS': len(copies),
+            'bookinstance_set-MIN_NUM_FORMS': 0, 'bookinstance_set-MAX_NUM_FORMS': 1000,
+        }
+        for index, copy in enumerate(copies):
+            data.update({
+                f'bookinstance_set-{index}-id': copy.pk,
+                f'bookinstance_set-{index}-book': self.test_book.pk,
+                f'bookinstance_set-{index}-imprint': copy.imprint,
+                f'bookinstance_set-{index}-status': 'm' if index == 0 else copy.status,
+                f'bookinstance_set-{index}-due_back': '',
+                f'bookinstance_set-{index}-borrower': '',
+            })
+        response = self.client.post(self.url + '?bookinstance_set-page=2', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BookInstance.objects.get(pk=copies[0].pk).status, 'm')
+        self.assertEqual(BookInstance.objects.filter(status='m').count(), 1)
+        self.test_book.refresh_from_db()
+        self.assertEqual((self.test_book.copies_available, self.test_book.copies_maintenance), (44, 1))
+    
+    def test_author_page_pages_books(self):
+        author = self.test_book.author
+        for number in range(11):
+            Book.objects.create(title=f'Book Title {number}', summary='My book summary', isbn='ABCDEFG',
+                                author=author, pubdate=datetime.date.today())
+        response = self.client.get(reverse('admin:catalog_author_change', args=[author.pk]))
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 10)
+        self.assertContains(response, '12 books, page 1 of 2')
+
+
+'''
+# test class for the status actions of the BookInstance admin
+'''
+class BookInstanceAdminActionTest(TestCase):
+    def test_mark_selected_copies_available(self):
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='1X<ISRUkw+tuK')
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        pubdate=datetime.date.today())
+        copies = [BookInstance.objects.create(book=test_book, imprint='Imprint', status='m') for copy in range(5)]
+        response = self.client.post(reverse('admin:catalog_bookinstance_changelist'), {
+            'action': 'mark_available',
+            '_selected_action': [copy.pk for copy in copies[:3]],
+        }, follow=True)
+        self.assertContains(response, '3 copies marked as available.')
+        test_book.refresh_from_db()
+        self.assertEqual((test_book.copies_available, test_book.copies_maintenance), (3, 2))
+
+
+'''
+# test class for the catalog export (export_catalog_view and the export_catalog command)
+'''
+import csv
+from catalog.exporter import with_genre_names
+from catalog.models import Author
+
+class ExportCatalogTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        self.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        self.test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                             author=author, language=Language.objects.create(name='en'),
+                                             pubdate=datetime.date(2016, 3, 1))
+        self.test_book.genre.set([Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Comedy')])
+        Book.objects.create(title='No Genre', summary='Summary', isbn='1234', pubdate=datetime.date(2017, 1, 1))
+        self.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.loan = BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='o',
+                                                borrower=self.borrower, due_back=self.due_back)
+        BookInstance.objects.create(book=self.test_book, imprint='Imprint', status='a')
+    
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+    
+    def test_staff_only(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export_catalog', args=['books']))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response.url)
+    
+    def test_books_as_json_lines(self):
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        books = [json.loads(line) for line in self.download(reverse('export_catalog', args=['books'])).splitlines()]
+        self.assertEqual(books[0], {
+            'id': self.test_book.pk, 'title': 'Book Title', 'summary': 'My book summary', 'isbn': 'ABCDEFG',
+            'pubdate': '2016-03-01', 'author_first_name': 'John', 'author_last_name': 'Smith', 'language': 'en',
+            'genres': ['Comedy', 'Fantasy'], 'copies': 2,
+        })
+        self.assertEqual((books[1]['title'], books[1]['genres'], books[1]['author_last_name']), ('No Genre', [], None))
+    
+    def test_copies_as_csv(self):
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        rows = list(csv.DictReader(self.download(reverse('export_catalog', args=['copies']) + '?format=csv').splitlines()))
+        self.assertEqual(len(rows), 2)
+        loan = next(row for row in rows if row['id'] == str(self.loan.pk))
+        self.assertEqual((loan['book_id'], loan['status'], loan['borrower'], loan['due_back']),
+                         (str(self.test_book.pk), 'o', 'borrower', self.due_back.isoformat()))
+        self.assertEqual(self.client.get(reverse('export_catalog', args=['loans'])).status_code, 404)
+    
+    # the genres fallback of the databases without ArrayAgg, tested on every database: one query per chunk of books
+    def test_genre_names_fallback(self):
+        Book.objects.create(title='Third', summary='Summary', isbn='5678', pubdate=datetime.date(2018, 1, 1)).genre.set(
+            Genre.objects.filter(name='Fantasy'))
+        books = Book.objects.order_by('pk').values('id', 'title')
+        with self.assertNumQueries(3):
+            genres = [(book['title'], sorted(book['genre_names'])) for book in with_genre_names(books.iterator(), 2)]
+        self.assertEqual(genres, [('Book Title', ['Comedy', 'Fantasy']), ('No Genre', []), ('Third', ['Fantasy'])])
+    
+    def test_command_output_can_be_imported(self):
+        out = StringIO()
+        call_command('export_catalog', 'books', format='csv', chunk_size=1, stdout=out)
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='') as output:
+            output.write(out.getvalue())
+        try:
+            call_command('import_catalog', path, stdout=StringIO())
+        finally:
+            os.remove(path)
+        copy = Book.objects.filter(title='Book Title').order_by('pk').last()
+        self.assertNotEqual(copy.pk, self.test_book.pk)
+        self.assertEqual((copy.author, copy.language, copy.copies_available), (self.test_book.author, self.test_book.language, 2))
+        self.assertEqual(sorted(copy.genre.values_list('name', flat=True)), ['Comedy', 'Fantasy'])
+
+
+'''
+# test class for the benchmark suite (catalog/benchmark.py and the benchmark command)
+# TransactionTestCase is needed because the benchmark workers are threads with their own database connections
+'''
+from catalog import urls as catalog_urls
+from catalog.benchmark import ROUTES
+from catalog.generator import CatalogGenerator
+
+class BenchmarkTest(TransactionTestCase):
+    def test_every_route_is_benchmarked(self):
+        names = {pattern.name for pattern in catalog_urls.urlpatterns if pattern.name}
+        self.assertEqual(names - {route.name for route in ROUTES}, set())
+        self.assertTrue({'landing', 'register', 'login', 'admin:index'} <= {route.name for route in ROUTES})
+    
+    def test_run_leaves_catalog_unchanged(self):
+        CatalogGenerator(books=30, copies_per_book=3, users=5, active_loans=10, seed=1).generate()
+        before = (Book.objects.count(), Author.objects.count(), BookInstance.objects.filter(status='o').count())
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            out = StringIO()
+            # the in-memory SQLite test database locks its tables against a second thread
+            concurrency = 2 if connection.vendor == 'postgresql' else 1
+            call_command('benchmark', iterations=2, warmup=0, concurrency=concurrency, output=path, stdout=out)
+            with open(path) as results:
+                report = json.load(results)
+        finally:
+            os.remove(path)
+        self.assertEqual(report['requests'], 2 * concurrency * len(ROUTES))
+        self.assertIn('%d requests in' % report['requests'], out.getvalue())
+        self.assertEqual(report['errors'], 0, [(name, route['error_kinds']) for name, route in report['routes'].items() if route['errors']])
+        books = report['routes']['books']
+        self.assertEqual(books['requests'], 2 * concurrency)
+        self.assertLessEqual(books['p50_ms'], books['p95_ms'])
+        self.assertGreater(books['queries_mean'], 0)
+        self.assertEqual((Book.objects.count(), Author.objects.count(), BookInstance.objects.filter(status='o').count()), before)
+    
+    def test_seed_books_fills_the_catalog_once(self):
+        out = StringIO()
+        call_command('benchmark', seed_books=40, routes='books', iterations=1, warmup=0, stdout=out)
+        self.assertIn('Generated 40 books', out.getvalue())
+        self.assertIn('(%s, 40 books)' % connection.vendor, out.getvalue())
+        call_command('benchmark', seed_books=40, routes='books', iterations=1, warmup=0, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 40)
+
+
+'''
+# test class for the query budgets and N+1 detection (catalog/querybudget.py)
+# every page is loaded with several rows in each list, so that a query made once per row shows up
+'''
+from unittest import mock
+from django.template import Context, Template
+from django.urls import resolve
+from catalog.querybudget import QueryBudgetExceeded, QueryBudgetTestMixin, QueryRecorder, fingerprint
+from catalog.views import BookListView
+
+class QueryBudgetTest(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        User.objects.create_superuser(username='librarian', email='librarian@example.com', password='1X<ISRUkw+tuK')
+        genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Crime', 'Poetry')]
+        languages = [Language.objects.create(name=name) for name in ('en', 'fr')]
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        for number in range(5):
+            author = Author.objects.create(first_name='John', last_name='Smith %d' % number)
+            for book_author in (author, cls.author):
+                book = Book.objects.create(title='Planet %d' % number, summary='Summary', isbn='ABCDEFG', author=book_author,
+                                           language=languages[number % 2], pubdate=datetime.date.today())
+                book.genre.set(genres[:number % 3 + 1])
+                # loans of the reader, two of them overdue
+                for days in (-1, 7):
+                    BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.reader,
+                                                due_back=datetime.date.today() + datetime.timedelta(days=days))
+                BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        cls.book = book
+        cls.loan = BookInstance.objects.filter(status='o').first()
+    
+    def test_reader_pages(self):
+        self.client.force_login(self.reader)
+        for url in (reverse('index'), reverse('books'), reverse('book_search') + '?q=planet',
+                    reverse('book_details', args=[self.book.pk]), reverse('authors'),
+                    reverse('author_details', args=[self.author.pk]), reverse('my_borrow'),
+                    reverse('autocomplete_book') + '?q=pla', reverse('borrow_book', args=[self.loan.pk])):
+            with self.subTest(url=url):
+                self.assertEqual(self.assertQueryBudget(url).status_code, 200)
+    
+    def test_librarian_pages(self):
+        self.client.force_login(User.objects.get(username='librarian'))
+        for url in (reverse('all_borrow'), reverse('overdue'), reverse('book_create'),
+                    reverse('book_update', args=[self.book.pk]), reverse('author_update', args=[self.author.pk]),
+                    reverse('renew-book-librarian', args=[self.loan.pk]), reverse('autocomplete_author') + '?q=smi',
+                    reverse('autocomplete_genre') + '?q=a'):
+            with self.subTest(url=url):
+                self.assertEqual(self.assertQueryBudget(url).status_code, 200)
+    
+    def test_list_and_detail_views_declare_budgets(self):
+        for name in ('index', 'books', 'book_search', 'book_details', 'authors', 'author_details', 'my_borrow',
+                     'all_borrow', 'overdue'):
+            view = resolve(reverse(name, args=[1] if name.endswith('_details') else [])).func
+            self.assertIsNotNone(getattr(view, 'query_budget', None) or getattr(view.view_class, 'query_budget', None), name)
+    
+    def test_template_loop_n_plus_one_detected(self):
+        template = Template('{% for book in books %}\n{{ book.author }}\n{% endfor %}')
+        with QueryRecorder() as recorder:
+            template.render(Context({'books': Book.objects.filter(author=self.author)}))
+        (query, count), = recorder.repeated()
+        self.assertEqual(count, 5)
+        self.assertTrue(query.origin.endswith(':2'), query.origin)
+        self.assertIn('FROM "catalog_author"', query.shape)
+        # the same loop with the authors joined makes a single query
+        with QueryRecorder() as recorder:
+            template.render(Context({'books': Book.objects.filter(author=self.author).select_related('author')}))
+        self.assertEqual((len(recorder.queries), recorder.repeated()), (1, []))
+    
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'O''Hara'"),
+                         fingerprint("SELECT  *  FROM t WHERE id = 7 AND name = 'x'"))
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)'), 'SELECT * FROM t WHERE id IN (...)')
+    
+    # the test runner turns DEBUG off, which turns the middleware off
+    @override_settings(DEBUG=True)
+    def test_middleware(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('books'))
+        self.assertLessEqual(int(response['X-Query-Count']), BookListView.query_budget)
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.querybudget', 'WARNING'):
+                self.client.get(reverse('books'))
+            with self.settings(QUERY_BUDGET_STRICT=True), self.assertRaises(QueryBudgetExceeded):
+                # django.request logs the exception as a server error
+                with self.assertLogs('django.request', 'ERROR'):
+                    self.client.get(reverse('books'))
+
+
+'''
+# test class for the Server-Timing instrumentation (catalog/timing.py)
+'''
+import re
+from django.test.utils import CaptureQueriesContext
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def setUp(self):
+        self.client.login(username='testuser', password='1X<ISRUkw+tuK')
+    
+    def test_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+    
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_header_and_log_line(self):
+        with self.assertLogs('catalog.timing', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertEqual(set(timings), {'total', 'mw', 'view', 'tpl', 'sql'})
+        self.assertIn('sql;dur=%s;desc="%d queries"' % (timings['sql'], len(queries)), response['Server-Timing'])
+        record, = logs.records
+        self.assertEqual((record.timing['route'], record.timing['status'], record.timing['sql_count']), ('index', 200, len(queries)))
+        self.assertIn('route=index status=200', record.getMessage())
+        # index.html extends base_generic.html: both are rendered inside the view
+        self.assertGreater(record.timing['template_ms'], 0)
+        self.assertLessEqual(record.timing['template_ms'], record.timing['view_ms'])
+        self.assertLessEqual(record.timing['view_ms'], record.timing['total_ms'])
+    
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.5)
+    def test_requests_outside_the_sample_are_not_timed(self):
+        with mock.patch('catalog.timing.random.random', return_value=0.7):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+        with mock.patch('catalog.timing.random.random', return_value=0.2), self.assertLogs('catalog.timing', 'INFO') as logs:
+            self.assertIn('Server-Timing', self.client.get(reverse('index')))
+        self.assertEqual(len(logs.records), 1)
+
+
+'''
+# test class for the Prometheus metrics (catalog/metrics.py and /metrics)
+'''
+import shutil
+from catalog.metrics import MetricsFile, sample_key
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                       pubdate=datetime.date.today())
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def scrape(self, **headers):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'), **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+    
+    def test_requests_and_loan_events_by_route(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        self.client.post(reverse('borrow_book', args=[self.copy.pk]),
+                         {'due_back': (datetime.date.today() + datetime.timedelta(weeks=2)).isoformat()})
+        self.client.post(reverse('return_book', args=[self.copy.pk]))
+        self.client.get('/catalog/no-such-page/')
+        metrics = self.scrape()
+        self.assertIn('# TYPE catalog_http_request_duration_seconds histogram', metrics)
+        self.assertIn('catalog_http_requests_total{method="GET",route="books",status="200"} 2.0', metrics)
+        self.assertIn('catalog_http_requests_total{method="POST",route="borrow_book",status="302"} 1.0', metrics)
+        self.assertIn('catalog_http_requests_total{method="GET",route="unresolved",status="404"} 1.0', metrics)
+        self.assertIn('catalog_http_request_duration_seconds_bucket{le="+Inf",route="books"} 2.0', metrics)
+        self.assertIn('catalog_http_request_duration_seconds_count{route="books"} 2.0', metrics)
+        self.assertIn('catalog_loan_events_total{event="borrow"} 1.0', metrics)
+        self.assertIn('catalog_loan_events_total{event="return"} 1.0', metrics)
+        queries = re.search(r'^catalog_db_queries_total\{route="books"\} ([\d.]+)$', metrics, re.M)
+        self.assertGreater(float(queries.group(1)), 0)
+        # buckets are cumulative and in increasing order
+        buckets = [float(value) for value in re.findall(r'_bucket\{le="[^"]+",route="books"\} ([\d.]+)', metrics)]
+        self.assertEqual(len(buckets), 12)
+        self.assertEqual(buckets, sorted(buckets))
+    
+    def test_processes_are_added_up(self):
+        # another worker's file, large enough to be grown past its initial size
+        other = MetricsFile(os.path.join(self.directory, 'metrics_999999.db'))
+        self.addCleanup(other.close)
+        for number in range(2000):
+            other.inc(sample_key('catalog_loan_events_total', event='renew'), 2)
+            other.inc(sample_key('catalog_http_requests_total', route='route_%d' % number, method='GET', status=200))
+        renew = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.reader,
+                                            due_back=datetime.date.today())
+        self.client.force_login(User.objects.create_superuser('librarian', 'librarian@example.com', '1X<ISRUkw+tuK'))
+        self.client.post(reverse('renew-book-librarian', args=[renew.pk]),
+                         {'renewal_date': (datetime.date.today() + datetime.timedelta(weeks=2)).isoformat()})
+        metrics = self.scrape()
+        self.assertIn('catalog_loan_events_total{event="renew"} 4001.0', metrics)
+        self.assertIn('catalog_http_requests_total{method="GET",route="route_1999",status="200"} 1.0', metrics)
+    
+    def test_access(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with self.settings(METRICS_DIR=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+'''
+# test class for the slow query buffer (catalog/slowqueries.py and its admin)
+# a threshold of 0.001 ms makes every query slow
+'''
+from catalog.models import SlowQuery
+from catalog.slowqueries import is_full_scan
+
+class SlowQueryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_superuser('librarian', 'librarian@example.com', '1X<ISRUkw+tuK')
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', pubdate=datetime.date.today())
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o', due_back=datetime.date.today() - datetime.timedelta(days=3))
+    
+    def setUp(self):
+        settings_override = override_settings(SLOW_QUERY_THRESHOLD_MS=0.001, SLOW_QUERY_BUFFER_SIZE=100)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.librarian)
+    
+    def test_capture_with_plan_and_stack(self):
+        self.client.get(reverse('overdue'))
+        overdue = SlowQuery.objects.filter(view='overdue', sql__contains='"catalog_bookinstance"."due_back" <').first()
+        self.assertIsNotNone(overdue)
+        self.assertGreater(overdue.duration_ms, 0)
+        self.assertIn('%s', overdue.sql)
+        self.assertIn('catalog_bookinstance', overdue.plan)
+        self.assertEqual(overdue.full_scan, is_full_scan(overdue.plan))
+        self.assertIn('catalog/views.py', overdue.stack)
+        # the same query again: its plan is copied, not explained again
+        with mock.patch('catalog.slowqueries.explain') as explain:
+            self.client.get(reverse('overdue'))
+        again = SlowQuery.objects.filter(fingerprint=overdue.fingerprint).exclude(pk=overdue.pk).get()
+        self.assertEqual(again.plan, overdue.plan)
+        self.assertNotIn(overdue.sql, [call[0][0] for call in explain.call_args_list])
+    
+    def test_buffer_keeps_the_latest(self):
+        with self.settings(SLOW_QUERY_BUFFER_SIZE=3):
+            self.client.get(reverse('overdue'))
+            self.client.get(reverse('books'))
+        self.assertEqual(SlowQuery.objects.count(), 3)
+        self.assertEqual(set(SlowQuery.objects.values_list('view', flat=True)), {'books'})
+    
+    def test_full_scan(self):
+        self.assertTrue(is_full_scan('Seq Scan on catalog_bookinstance  (cost=0.00..1.01 rows=1 width=66)\n  Filter: (due_back < $1)'))
+        self.assertFalse(is_full_scan('Index Scan using bookinstance_borrower_idx on catalog_bookinstance  (cost=0.29..8.30 rows=1 width=66)'))
+        self.assertTrue(is_full_scan('SCAN TABLE catalog_bookinstance'))
+        self.assertFalse(is_full_scan('SEARCH TABLE catalog_bookinstance USING INDEX bookinstance_borrower_idx (borrower_id=?)'))
+    
+    def test_admin_is_read_only(self):
+        self.client.get(reverse('overdue'))
+        query = SlowQuery.objects.filter(view='overdue', sql__contains='"catalog_bookinstance"."due_back" <').first()
+        self.assertEqual(self.client.get(reverse('admin:catalog_slowquery_changelist'), {'full_scan__exact': 1}).status_code, 200)
+        response = self.client.get(reverse('admin:catalog_slowquery_change', args=[query.pk]))
+        # 'Seq Scan on catalog_bookinstance' on PostgreSQL, 'SCAN TABLE catalog_bookinstance' on SQLite
+        self.assertIn('catalog_bookinstance', query.plan)
+        self.assertContains(response, 'catalog_bookinstance')
+        self.assertNotContains(response, 'name="_save"')
+        self.assertEqual(self.client.get(reverse('admin:catalog_slowquery_add')).status_code, 403)
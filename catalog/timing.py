@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+'''
+Server-Timing instrumentation of a sample of the requests (opt-in, light enough for production).
+
+For each sampled request the time is split into:
+- total: the whole request, from ServerTimingMiddleware (first in MIDDLEWARE) down to the view and back
+- view: URL resolution, the view and the rendering of its template, bracketed by ServerTimingViewMiddleware (last in MIDDLEWARE)
+- mw: total - view, i.e. the other middleware, e.g. loading and saving the session
+- sql: the queries run on the default connection during the request, and their number
+- tpl: template rendering, through the template backend below (the queries a template runs are also counted in sql)
+
+The timings are sent to the browser in a Server-Timing header (shown by the network panel of the developer tools)
+and logged as one line of key=value pairs on the 'catalog.timing' logger (also passed as extra={'timing': {...}}).
+
+SERVER_TIMING_SAMPLE_RATE sets the share of requests timed, from 0 (default: both middleware turn themselves off)
+to 1 (every request). A request that is not sampled costs one random number.
+'''
+
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.backends import django as django_backend
+
+
+logger = logging.getLogger(__name__)
+
+## the timer of the request being handled by this thread, None if it is not sampled
+_local = threading.local()
+
+
+def current_timer():
+    return getattr(_local, 'timer', None)
+
+
+class RequestTimer(object):
+    ## Times of one request, in seconds. It is the execute_wrapper() timing the queries.
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.view_seconds = 0.0
+        self.render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += perf_counter() - started
+            self.sql_count += 1
+
+    @contextmanager
+    def rendering(self):
+        ## time a template render; a template rendered from inside another (e.g. by a tag) is not counted twice
+        self.render_depth += 1
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.render_depth -= 1
+            if not self.render_depth:
+                self.template_seconds += perf_counter() - started
+
+
+'''
+# template backend
+'''
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        timer = current_timer()
+        if timer is None:
+            return super(Template, self).render(context, request)
+        with timer.rendering():
+            return super(Template, self).render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    ## The Django template backend, with the rendering time of sampled requests measured (TEMPLATES 'BACKEND')
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super(DjangoTemplates, self).get_template(template_name).template, self)
+
+
+'''
+# middleware
+'''
+def sample_rate():
+    rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0)
+    if rate <= 0:
+        raise MiddlewareNotUsed
+    return rate
+
+
+class ServerTimingMiddleware(object):
+    ## Times a sample of the requests; put it first in MIDDLEWARE so that the total covers the other middleware
+    def __init__(self, get_response):
+        self.rate = sample_rate()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.rate < 1 and random.random() >= self.rate:
+            return self.get_response(request)
+        timer = _local.timer = RequestTimer()
+        started = perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            _local.timer = None
+        total = perf_counter() - started
+        response['Server-Timing'] = ', '.join((
+            'total;dur=%.1f' % (total * 1000),
+            'mw;dur=%.1f;desc="middleware"' % ((total - timer.view_seconds) * 1000),
+            'view;dur=%.1f' % (timer.view_seconds * 1000),
+            'tpl;dur=%.1f;desc="templates"' % (timer.template_seconds * 1000),
+            'sql;dur=%.1f;desc="%d queries"' % (timer.sql_seconds * 1000, timer.sql_count),
+        ))
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'route': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'middleware_ms': round((total - timer.view_seconds) * 1000, 1),
+            'view_ms': round(timer.view_seconds * 1000, 1),
+            'template_ms': round(timer.template_seconds * 1000, 1),
+            'sql_ms': round(timer.sql_seconds * 1000, 1),
+            'sql_count': timer.sql_count,
+        }
+        logger.info(' '.join('%s=%s' % item for item in fields.items()), extra={'timing': fields})
+        return response
+
+
+class ServerTimingViewMiddleware(object):
+    ## Brackets the view for ServerTimingMiddleware; put it last in MIDDLEWARE
+    def __init__(self, get_response):
+        sample_rate()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = current_timer()
+        if timer is None:
+            return self.get_response(request)
+        started = perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            timer.view_seconds += perf_counter() - started
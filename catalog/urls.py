@@ -21,6 +21,9 @@ urlpatterns = [
         ## .as_view() properly converts a class-based view into a view method/function
         path('books/', views.BookListView.as_view(), name='books'),
         
+        ## define a page to search books by title, author and summary (full-text search)
+        path('books/search/', views.BookSearchView.as_view(), name='book_search'),
+        
         ## define a page with detailed information of a book and its associated copies
         ## <int:pk> captures the value from url and specifies the data type
         ## The name 'book_detail' should match with get_absolute_url() method defined in Book model 
@@ -37,9 +40,15 @@ urlpatterns = [
         ## add a view for librarian only with a list of all borrowed books
         path('allborrow/', views.AllBorrowListView.as_view(), name='all_borrow'),
         
+        ## report of overdue copies for librarian
+        path('overdue/', views.OverdueListView.as_view(), name='overdue'),
+        
         ## view for librarian to renew (i.e. edit due date) of a book instance
         path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
         
+        ## JSON view for librarian to renew many loans at once
+        path('renew/', views.bulk_renew_view, name='bulk_renew'),
+        
         ## CreateView, UpdateView and DeleteView for Book model
         path('books/create/', views.BookCreate.as_view(), name='book_create'),
         path('books/<int:pk>/update/', views.BookUpdate.as_view(), name='book_update'),
@@ -50,9 +59,23 @@ urlpatterns = [
         path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author_update'),
         path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author_delete'),
         
+        ## JSON autocomplete for the author and genre fields of the Book create/update forms
+        path('autocomplete/author/', views.AuthorAutocomplete.as_view(), name='autocomplete_author'),
+        path('autocomplete/book/', views.BookAutocomplete.as_view(), name='autocomplete_book'),
+        path('autocomplete/genre/', views.GenreAutocomplete.as_view(), name='autocomplete_genre'),
+        
         ## define a view for borrow books
         path('book/<uuid:pk>/borrow/', views.borrow_book_instance_view, name='borrow_book'),
         
+        ## JSON view to borrow several copies in one request
+        path('checkout/', views.checkout_view, name='checkout'),
+        
+        ## librarians check in returned copies by scanning their ids
+        path('checkin/', views.checkin_view, name='checkin'),
+        
+        ## staff download the catalog (books or copies) as JSON Lines or CSV
+        path('export/<slug:kind>/', views.export_catalog_view, name='export_catalog'),
+        
         #E define a view to return borrowed books
         path('book/<uuid:pk>/return/', views.return_book_instance_view, name='return_book'),
         ]
\ No newline at end of file
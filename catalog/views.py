@@ -1,10 +1,13 @@
 from django.shortcuts import render
+from django.conf import settings
 
 ###########################
 # Create your views here. #
 ###########################
 # Import the model classes that we will use to access data in all our views
-from catalog.models import Book, Author, BookInstance, Genre
+from catalog.models import Book, Author, BookInstance, Genre, CatalogStats, BorrowerStats
+# every catalog view declares how many SQL queries it may make; the tests fail on an N+1 (see querybudget.py)
+from catalog.querybudget import query_budget
 
 # Use login_required to restrict access to logged-in users in function-based views
 from django.contrib.auth.decorators import login_required
@@ -23,20 +26,12 @@ define view.index
                 # If the user is not logged in, this will redirect to the login URL defined in the project settings (settings.LOGIN_URL), 
                 # passing the current absolute path as the next URL parameter.
                 # @login_required must be included for each individual view. It only works for function-based views. For class-based views, use LoginRequiredMixin
+# session and user, stats, sidebar permissions (2), and the session update for num_visits (3 with its savepoint)
+@query_budget(8)
 def index(request):
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    
-    # The 'all()' is implied by default.    
-    num_authors = Author.objects.count()
-    
-    # Count of genre values containing letter 'c'
-    # __icontains is case in-sensitive
-    num_genre_c = Genre.objects.filter(name__icontains='c').count()
+    # Read the counts of the main objects from the pre-computed stats row (one query instead of five COUNT(*) scans)
+    # The counters are maintained by signal handlers in signals.py, see CatalogStats in models.py
+    stats = CatalogStats.load()
     
     # Count the number of visit for a given user/browser by using request.session, which behaves like a dictionary
     ## get current number of visit, start with 0 if first visit
@@ -47,11 +42,13 @@ def index(request):
     request.session['num_visits'] = num_visits
 	
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-		 'num_genre_c': num_genre_c,
+        'num_books': stats.num_books,
+        'num_instances': stats.num_instances,
+        # Available books (status = 'a')
+        'num_instances_available': stats.num_instances_available,
+        'num_authors': stats.num_authors,
+        # Count of genre values containing letter 'c'
+        'num_genre_c': stats.num_genre_c,
         'num_visits': num_visits,
     }
     
@@ -63,9 +60,11 @@ def index(request):
 define BookListView as a class-based view by referring generic class ListView
 '''
 from django.views import generic
+# KeysetPaginationMixin pages through the list with ?cursor= tokens instead of OFFSET (see pagination.py)
+from catalog.pagination import KeysetPaginationMixin
 
 
-class BookListView(LoginRequiredMixin, generic.ListView):
+class BookListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     # The generic view will query the database to get all records for the specified model (Book) 
     # then render a template located, by default, at /locallibrary/catalog/templates/catalog/book_list.html (to be created separately). 
     # Within the template you can access the list of books with the template variable named book_list
@@ -74,6 +73,10 @@ class BookListView(LoginRequiredMixin, generic.ListView):
     # Change the default name (model_name_list) of the template variable. 
     context_object_name = 'list_of_books'  
     
+    # the author of every book is shown, so load it in the same query instead of one query per book
+    def get_queryset(self):
+        return super(BookListView, self).get_queryset().select_related('author')
+    
     # Instead of listing all books (default), futher filter the list of books
 #    queryset = Book.objects.filter(title__icontains='war')[:5] 
     
@@ -83,13 +86,18 @@ class BookListView(LoginRequiredMixin, generic.ListView):
     
     # With pagination, as soon as there are more than "paginate_by" records the view will start paginating the data it sends to the template.
     paginate_by = 4
+    # session, user, stats, the page of books (with their authors) and the permissions for the buttons
+    query_budget = 6
+    # Keyset pagination follows Meta.ordering of Book, i.e. title A-Z and publication date new-old (plus id as a tie-breaker)
+    # It is supported by the composite index 'book_keyset_idx'
+    keyset_ordering = ('title', '-pubdate', 'id')
     
     # Override get_context_data() in order to pass additional context variables to the template (e.g. the list of books is passed by default)
     def get_context_data(self, **kwargs):
         # Call the generic class first to get the context
         context = super(BookListView, self).get_context_data(**kwargs)
-        # Create any data and add it to the context
-        context['num_books'] = Book.objects.all().count()
+        # Create any data and add it to the context. The count is read from the pre-computed stats instead of COUNT(*)
+        context['num_books'] = CatalogStats.load().num_books
         return context
 
 '''
@@ -100,6 +108,26 @@ class BookDetailView(LoginRequiredMixin, generic.DetailView):
     model = Book
     context_object_name = 'book'
     template_name = 'book_details.html'
+    query_budget = 8
+    
+    # Load the book with its author and language (one joined query), then genres and copies (one query each)
+    # instead of resolving every relation lazily from the template
+    def get_queryset(self):
+        queryset = Book.objects.select_related('author', 'language').prefetch_related('genre')
+        # a cached copies section does not need the copies, so only load them when the cache is off
+        # (on a cache miss the template loads them itself, with a single query)
+        if not self.get_copies_cache_timeout():
+            queryset = queryset.prefetch_related('bookinstance_set')
+        return queryset
+    
+    # seconds to cache the rendered copies section of each book; 0 (default) disables the cache
+    def get_copies_cache_timeout(self):
+        return getattr(settings, 'CATALOG_COPIES_CACHE_TIMEOUT', 0)
+    
+    def get_context_data(self, **kwargs):
+        context = super(BookDetailView, self).get_context_data(**kwargs)
+        context['copies_cache_timeout'] = self.get_copies_cache_timeout()
+        return context
 
 '''
 code below shows how BookDetailView would be defined without using generic class
@@ -116,59 +144,160 @@ code below shows how BookDetailView would be defined without using generic class
 #    
 #    return render(request, 'catalog/templates/book_details.html', context={'book': book})
 
+'''
+define BookSearchView, a full-text search over book title, author name and summary
+'''
+from django.db import connection
+from django.db.models import F
+from django.contrib.postgres.search import SearchQuery, SearchRank
+
+
+class BookSearchView(LoginRequiredMixin, generic.ListView):
+    model = Book
+    context_object_name = 'list_of_books'
+    template_name = 'book_search.html'
+    paginate_by = 10
+    query_budget = 6
+    
+    def get_search_terms(self):
+        return self.request.GET.get('q', '').strip()
+    
+    # Match the search terms against the stored search document (Book.search_vector, GIN indexed) and rank the matches.
+    # Title and author name weigh more than the summary, see migration 0010.
+    def get_queryset(self):
+        terms = self.get_search_terms()
+        if not terms:
+            return Book.objects.none()
+        books = Book.objects.select_related('author')
+        # the search document only exists on PostgreSQL. Elsewhere (e.g. SQLite for local benchmarks), fall back to a title match
+        if connection.vendor != 'postgresql':
+            return books.filter(title__icontains=terms)
+        query = SearchQuery(terms, config='english')
+        return books.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query)).order_by('-rank', 'title', 'id')
+    
+    def get_context_data(self, **kwargs):
+        context = super(BookSearchView, self).get_context_data(**kwargs)
+        context['q'] = self.get_search_terms()
+        return context
+
+'''
+define autocomplete views returning JSON options for the Book create/update forms (see AutocompleteSelect in forms.py)
+# GET ?q=<text> returns {"results": [{"id": ..., "text": ...}, ...]}, at most AUTOCOMPLETE_LIMIT entries
+'''
+from django.db.models import Q
+from django.http import JsonResponse
+
+AUTOCOMPLETE_LIMIT = 20
+# trigram indexes (migration 0011) need at least 3 characters to narrow the search
+AUTOCOMPLETE_MIN_LENGTH = 3
+
+class AutocompleteView(LoginRequiredMixin, generic.View):
+    model = None
+    # fields searched for each word of the query (case-insensitive substring match, served by the trigram indexes)
+    search_fields = ()
+    
+    # return the matching records as a queryset; every word of the query has to match one of the search fields
+    def search(self, words):
+        objects = self.model._default_manager.only(*self.search_fields)
+        for word in words:
+            match = Q()
+            for field in self.search_fields:
+                match |= Q(**{'%s__icontains' % field: word})
+            objects = objects.filter(match)
+        return objects
+    
+    def label(self, obj):
+        return str(obj)
+    
+    def get(self, request, *args, **kwargs):
+        text = request.GET.get('q', '').strip()
+        words = text.replace(',', ' ').split()
+        if len(text) < AUTOCOMPLETE_MIN_LENGTH or not words:
+            return JsonResponse({'results': []})
+        objects = self.search(words)[:AUTOCOMPLETE_LIMIT]
+        return JsonResponse({'results': [{'id': obj.pk, 'text': self.label(obj)} for obj in objects]})
+
+class AuthorAutocomplete(AutocompleteView):
+    model = Author
+    search_fields = ('last_name', 'first_name')
+
+class BookAutocomplete(AutocompleteView):
+    model = Book
+    search_fields = ('title',)
+
+class GenreAutocomplete(AutocompleteView):
+    model = Genre
+    search_fields = ('name',)
+
 '''
 define AuthorListView
 '''
-class AuthorListView(LoginRequiredMixin, generic.ListView):
+class AuthorListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model = Author
     context_object_name = 'author_list'
     template_name = 'authors.html'
     paginate_by = 10
+    # 6, and one more to count the authors for the page numbers of the legacy ?page= links
+    query_budget = 7
+    # same as Meta.ordering of Author, supported by the composite index 'author_keyset_idx'
+    keyset_ordering = ('last_name', 'first_name', 'id')
     
     # add count of authors in context
     def get_context_data(self, **kwargs):
         context = super(AuthorListView, self).get_context_data(**kwargs)
-        context['num_authors'] = Author.objects.all().count()
+        context['num_authors'] = CatalogStats.load().num_authors
         return context
 
 '''
 define author_detail_view
 '''
 @login_required
+@query_budget(7)
 def author_detail_view(request, pk):
     try: 
         author = Author.objects.get(pk=pk)
     except Author.DoesNotExist:
         raise Http404('Author does not exist')
     
-    book_count = author.book_set.all().count()
-    context = {'author': author, 'book_count':book_count}
+    # load the books once, with their language and genres, instead of once for the count and once per book in the template
+    books = list(author.book_set.select_related('language').prefetch_related('genre'))
+    context = {'author': author, 'books': books, 'book_count': len(books)}
     return render(request, 'author_details.html', context=context)
 
 '''
 define a list view for borrowed books of logged in user
 '''
-class MyBorrowListView(LoginRequiredMixin,generic.ListView):
+class MyBorrowListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model=BookInstance
     context_object_name = 'myborrowedbook'
     template_name = 'my_borrow.html'
     paginate_by = 10
+    query_budget = 6
+    ## bookinstance_borrower_idx serves this order for one borrower
+    keyset_ordering = ('due_back', 'id')
     
     ## Override the get_queryset() method in generic class, to change the list of records returned. 
     ## This is more flexible than just setting the queryset attribute 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        return (BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o')
+                .select_related('book').annotate_overdue().order_by(*self.keyset_ordering))
     
-    # add count of borrowed books in context
+    # add count of borrowed books in context (kept up to date by the loan code, see counters.py)
     def get_context_data(self, **kwargs):
         context = super(MyBorrowListView, self).get_context_data(**kwargs)
-        context['num_myborrow'] = BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').count()
+        context['num_myborrow'] = BorrowerStats.load(self.request.user.pk).active_loans
         return context
 
 '''
 define a list view for librarian for all borrowed books
+# ?format=csv exports all the loans as a CSV file instead of showing a page
 '''
-class AllBorrowListView(PermissionRequiredMixin, generic.ListView):
+import csv
+from django.http import StreamingHttpResponse
+from catalog.exporter import Echo
+
+
+class AllBorrowListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
     ## permissions are declared under Meta class of Model
     ## Each permission is in format of app_name.permission_name. Multiple permissions can be required in a tuple
     ## permission need to be assigned to user via admin app
@@ -176,13 +305,66 @@ class AllBorrowListView(PermissionRequiredMixin, generic.ListView):
     model = BookInstance
     context_object_name = 'allborrowedbook'
     template_name = 'all_borrow.html'
-    ## return all borrowed books, and order by title and due date
+    paginate_by = 20
+    query_budget = 6
+    ## loans are grouped by book, latest due date first; bookinstance_loans_idx serves this order
+    keyset_ordering = ('book_id', '-due_back', 'id')
+    ## number of rows fetched at a time by the CSV export
+    csv_chunk_size = 2000
+    
+    ## return all borrowed books, with their book and borrower loaded in the same query
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').order_by('book', '-due_back') # due_back is in descending order
+        return (BookInstance.objects.filter(status__exact='o').select_related('book', 'borrower').annotate_overdue()
+                .order_by(*self.keyset_ordering))
+    
     ## add number of borrowed books to context
-    def get_context_date(self, **kwargs):
+    def get_context_data(self, **kwargs):
         context = super(AllBorrowListView, self).get_context_data(**kwargs)
-        context['num_borrow'] = BookInstance.objects.filter(status__exact='o').count()
+        context['num_borrow'] = CatalogStats.load().num_instances_on_loan
+        return context
+    
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'csv':
+            return self.export_csv()
+        return super(AllBorrowListView, self).get(request, *args, **kwargs)
+    
+    def export_csv(self):
+        ## Stream every loan as a CSV row. iterator() fetches the rows in chunks (with a server-side cursor on PostgreSQL),
+        ## so memory use does not grow with the number of loans.
+        loans = (BookInstance.objects.filter(status__exact='o').order_by(*self.get_sort_ordering())
+                 .values_list('id', 'book__title', 'imprint', 'borrower__username', 'due_back'))
+        writer = csv.writer(Echo())
+        
+        def rows():
+            yield writer.writerow(['copy', 'title', 'imprint', 'borrower', 'due_back'])
+            for row in loans.iterator(chunk_size=self.csv_chunk_size):
+                yield writer.writerow(row)
+        
+        response = StreamingHttpResponse(rows(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="loans.csv"'
+        return response
+
+'''
+define a report of overdue copies for librarians
+# the database selects the overdue copies through the partial index catalog_bookinstance_overdue_idx,
+# most overdue first
+'''
+class OverdueListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
+    permission_required = 'catalog.view_all_borrow'
+    model = BookInstance
+    context_object_name = 'overduebook'
+    template_name = 'overdue.html'
+    paginate_by = 20
+    query_budget = 6
+    keyset_ordering = ('due_back', 'id')
+    
+    def get_queryset(self):
+        return BookInstance.objects.overdue().select_related('book', 'borrower').order_by(*self.keyset_ordering)
+    
+    ## add number of overdue copies to context
+    def get_context_data(self, **kwargs):
+        context = super(OverdueListView, self).get_context_data(**kwargs)
+        context['num_overdue'] = BookInstance.objects.overdue().count()
         return context
 
 '''
@@ -195,6 +377,7 @@ from django.urls import reverse
 
 # import defined forms
 from catalog.forms import RenewBookForm
+from catalog.metrics import count_loan_event
 
 # limit permisison
 @permission_required('catalog.can_renew_book')
@@ -210,6 +393,7 @@ def renew_book_librarian(request, pk):
             ## process the data in form.cleaned_data as required (here we just write it to the model due_back field)
             book_instance.due_back = book_renewal_form.cleaned_data['renewal_date']
             book_instance.save()
+            count_loan_event('renew')
             ## redirect to a new URL:
             return HttpResponseRedirect(reverse('all_borrow') )
     ## If this is a GET (or any other method) create the default form.
@@ -232,10 +416,13 @@ from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 
 
+# BookForm/BookUpdateForm only render the selected author and genres, other options are loaded on demand (see forms.py)
+from catalog.forms import BookForm, BookUpdateForm
+
 class BookCreate(PermissionRequiredMixin, CreateView):
     permission_required='catalog.can_create_book'
     model = Book
-    fields = '__all__'
+    form_class = BookForm
     initial = {'language': 'en'} # set initial value in a dictionary
     # success_url can be used to specify a redirect location after completing the creation/updaate. By default these views will redirect on success to a page displaying the newly created/edited model item
     template_name = 'book_form.html'
@@ -243,7 +430,7 @@ class BookCreate(PermissionRequiredMixin, CreateView):
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     permission_required='catalog.can_update_book'
     model = Book
-    fields = ['title', 'author', 'summary','genre']
+    form_class = BookUpdateForm
     template_name = 'book_form.html'
 
 class BookDelete(PermissionRequiredMixin, DeleteView):
@@ -279,30 +466,30 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
 define a view for borrow books
 '''
 from catalog.forms import SetReturnDateForm
+# borrow_copy() and return_copy() change the status with a single conditional UPDATE, so concurrent requests cannot both win
+from catalog.loans import borrow_copy, return_copy, checkout_copies, checkin_copies, parse_copy_ids
 
 @login_required
 def borrow_book_instance_view(request, pk):
     # retreive the book instance
     borrowedbook = get_object_or_404(BookInstance, pk=pk)
+    error_message = None
     # check POST vs GET
     if request.method=='POST':
         return_form = SetReturnDateForm(request.POST)
         # form has to be valid and current book instance is available
-        if return_form.is_valid() and borrowedbook.status == 'a':
-            # update borrower to current user
-            borrowedbook.borrower = request.user
-            # update status to on loan
-            borrowedbook.status = 'o'
-            # update due_back date to the value in form
-            borrowedbook.due_back = return_form.cleaned_data['due_back']
-            # save the changes to BookInstance
-            borrowedbook.save()
-            # redirect to My Borrowed Book view
-            return HttpResponseRedirect(reverse('my_borrow'))
+        if return_form.is_valid():
+            # lend the copy to current user with the due_back date in form, only if it is still available
+            if borrow_copy(borrowedbook, request.user, return_form.cleaned_data['due_back']):
+                # redirect to My Borrowed Book view
+                return HttpResponseRedirect(reverse('my_borrow'))
+            # another patron borrowed the copy first (or it is not available); show its current status
+            borrowedbook.refresh_from_db()
+            error_message = 'Sorry, this copy is no longer available'
     else:
         return_form = SetReturnDateForm(initial={'due_back':'YYYY-MM-DD'})
     
-    context = {'borrowedbook': borrowedbook, 'form':return_form}
+    context = {'borrowedbook': borrowedbook, 'form':return_form, 'error': error_message}
     return render(request, 'borrow_book.html', context)
             
             
@@ -321,21 +508,163 @@ def return_book_instance_view(request, pk):
         if returnbook.status != 'o':
             error_message = 'Book is not currently on loan'
         # avoid non-borrower hijacking the return
-        elif returnbook.borrower != request.user:
+        elif returnbook.borrower_id != request.user.pk:
             error_message = 'Only borrower can return the book'
-        # processing book return
-        else:
-            returnbook.status = 'a'
-            returnbook.borrower = None
-            returnbook.due_back = None
-            returnbook.save()
+        # processing book return, only if the copy is still on loan to current user
+        elif return_copy(returnbook, request.user):
             # redirect to my borrow list
             return HttpResponseRedirect(reverse('my_borrow'))
+        else:
+            # the copy was returned in the meantime (e.g. a second click)
+            returnbook.refresh_from_db()
+            error_message = 'Book is not currently on loan'
     else:
         pass
     context = {'returnbook': returnbook,
                'error':error_message}
     return render(request, 'return_book.html', context)
-            
 
-                
\ No newline at end of file
+
+'''
+define a checkout view to borrow several copies at once (e.g. at the desk)
+# POST a JSON body {"copies": ["<uuid>", ...], "due_back": "YYYY-MM-DD"}. The due date follows the rules of SetReturnDateForm.
+# The response reports the result of each copy: "borrowed", "unavailable", "unknown" or "invalid" (not a UUID).
+'''
+import json
+import uuid
+from django.views.decorators.http import require_POST
+
+# maximum number of copies in one checkout
+CHECKOUT_LIMIT = 50
+
+@login_required
+@require_POST
+def checkout_view(request):
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        copies = data['copies']
+        # a string would otherwise be taken as a list of one-character ids
+        if not isinstance(copies, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with "copies" and "due_back"'}, status=400)
+    if not copies or len(copies) > CHECKOUT_LIMIT:
+        return JsonResponse({'error': 'Check out between 1 and %d copies at a time' % CHECKOUT_LIMIT}, status=400)
+    
+    date_form = SetReturnDateForm({'due_back': data.get('due_back')})
+    if not date_form.is_valid():
+        return JsonResponse({'error': date_form.errors['due_back'][0]}, status=400)
+    due_back = date_form.cleaned_data['due_back']
+    
+    # parse the copy ids; invalid ones are reported but do not stop the checkout
+    copy_ids = {}
+    for copy in copies:
+        try:
+            copy_ids[str(copy)] = uuid.UUID(str(copy))
+        except ValueError:
+            copy_ids[str(copy)] = None
+    results = checkout_copies([copy_id for copy_id in copy_ids.values() if copy_id], request.user, due_back)
+    
+    items = [{'id': copy, 'result': results[copy_id] if copy_id else 'invalid'} for copy, copy_id in copy_ids.items()]
+    return JsonResponse({
+        'due_back': due_back.isoformat(),
+        'borrowed': sum(1 for item in items if item['result'] == 'borrowed'),
+        'results': items,
+    })
+
+
+'''
+define a check-in view for librarians to take back returned copies (e.g. scanned at the returns desk)
+# GET shows a form to paste or scan copy ids into, one per line.
+# POST with Content-Type text/plain takes the ids as the request body and answers with JSON, so that
+# a scanner station can send thousands of ids in one request; the body is read line by line, never as a whole.
+'''
+@permission_required('catalog.can_checkin_book')
+def checkin_view(request):
+    if request.method != 'POST':
+        return render(request, 'checkin.html')
+    
+    invalid = []
+    if request.content_type == 'text/plain':
+        lines = request
+    else:
+        lines = request.POST.get('copies', '').splitlines()
+    result = checkin_copies(parse_copy_ids(lines, invalid))
+    summary = {
+        'returned': result.returned,
+        'not_on_loan': [str(copy_id) for copy_id in result.not_on_loan],
+        'unknown': [str(copy_id) for copy_id in result.unknown],
+        'invalid': invalid,
+    }
+    if request.content_type == 'text/plain':
+        return JsonResponse(summary)
+    return render(request, 'checkin.html', {'result': summary})
+
+
+'''
+define a bulk renewal view for librarians, e.g. to renew the loans of a whole class at the end of the semester
+# POST a JSON object with the fields of BulkRenewForm, e.g. {"borrower": "jane", "weeks": 3}
+'''
+from catalog.forms import BulkRenewForm
+from catalog.loans import renew_loans
+
+@permission_required('catalog.can_renew_book')
+@require_POST
+def bulk_renew_view(request):
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        data = None
+    # valid JSON may still be a list, a string or a number
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    form = BulkRenewForm(data)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    result = renew_loans(form.get_loans(), form.cleaned_data['renewal_date'], form.cleaned_data['weeks'])
+    return JsonResponse({
+        'renewed': result.renewed,
+        'rejected': [{'id': str(copy_id), 'due_back': due_back.isoformat()} for copy_id, due_back in result.rejected],
+    })
+
+
+'''
+define a download of the whole catalog for staff, e.g. for analytics or backups
+# /catalog/export/books/?format=csv (default JSON Lines); the file is streamed as it is read (see exporter.py)
+'''
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from catalog.exporter import EXPORTS, FORMATS, export_lines
+
+@staff_member_required
+def export_catalog_view(request, kind):
+    format = request.GET.get('format', 'jsonl')
+    if kind not in EXPORTS or format not in FORMATS:
+        raise Http404
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_lines(kind, format), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (kind, format)
+    return response
+
+
+'''
+define the Prometheus metrics of the site (see metrics.py), served at /metrics
+# scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without a token configured, staff can look at them in a browser
+'''
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from catalog.metrics import get_registry
+
+def metrics_view(request):
+    registry = get_registry()
+    if registry is None:
+        raise Http404('Metrics are off (METRICS_DIR is not set)')
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+            raise PermissionDenied
+    elif not (request.user.is_active and request.user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -44,10 +44,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # PostgreSQL full-text search and trigram lookups
     'catalog.apps.CatalogConfig', # register new apps here. 
 ]
 
 MIDDLEWARE = [
+    'catalog.timing.ServerTimingMiddleware',  # Off unless SERVER_TIMING_SAMPLE_RATE > 0: Server-Timing header and log line for a sample of the requests
+    'catalog.metrics.MetricsMiddleware',  # Off unless METRICS_DIR is set: request counts, latency and queries by route for /metrics
+    'catalog.slowqueries.SlowQueryMiddleware',  # Off unless SLOW_QUERY_THRESHOLD_MS is set: keeps the slow queries, with their plans, for the admin
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Use the WhiteNoise project for serving of static assets directly from Gunicorn in production
     'django.contrib.sessions.middleware.SessionMiddleware',  # Manages sessions across requests
@@ -56,13 +60,32 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Associates users with requests using sessions.
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.querybudget.QueryBudgetMiddleware',  # Development only (off unless DEBUG): reports N+1 queries and views over their query budget
+    'catalog.timing.ServerTimingViewMiddleware',  # Times the view for ServerTimingMiddleware; keep it last
 ]
 
+# Share of the requests timed by ServerTimingMiddleware, from 0 (off) to 1 (every request), e.g. SERVER_TIMING_SAMPLE_RATE='0.05'
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0))
+
+# Directory where every worker process keeps its metrics, added up by /metrics (see catalog/metrics.py); empty: metrics off.
+# All the gunicorn workers must use the same directory. Empty it before starting gunicorn, e.g. METRICS_DIR='/tmp/locallibrary-metrics'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# Token of the Prometheus scraper ("Authorization: Bearer <token>"); without it, only staff can read /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Queries taking at least this many milliseconds are kept, with their plan, in the "Slow queries" admin (0: off).
+# Only the latest SLOW_QUERY_BUFFER_SIZE are kept.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 0))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 1000))
+
+# Pass environment variable QUERY_BUDGET_STRICT='1' (or 'true') to make QueryBudgetMiddleware raise an error instead of logging a warning
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
 ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'catalog.timing.DjangoTemplates',  # the Django template backend, with the rendering time measured for ServerTimingMiddleware
         'DIRS': ['./templates', ], # add './templates' to DIRS to make the path visiable for user authentication purpose
         'APP_DIRS': True,
         'OPTIONS': {
@@ -160,6 +183,25 @@ STATIC_URL = '/static/'
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Cache the rendered list of copies on the book detail page for this many seconds (0 disables the cache).
+# The cached section is dropped whenever a copy of the book is saved or deleted.
+# Without a CACHES setting Django uses a per-process local-memory cache; with several gunicorn workers,
+# configure a shared cache (e.g. memcached) so that every worker sees the invalidation.
+CATALOG_COPIES_CACHE_TIMEOUT = int(os.environ.get('CATALOG_COPIES_CACHE_TIMEOUT', 0))
+
+# Write the log messages of the catalog app (e.g. the timing lines of ServerTimingMiddleware) to the console,
+# where gunicorn and Heroku collect them. Django's own logging is left as it is.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'catalog': {'handlers': ['console'], 'level': os.environ.get('CATALOG_LOG_LEVEL', 'INFO')},
+    },
+}
+
 # The password reset system requires that your website supports email. To allow testing without actual email, the following line logs any emails sent to the console.
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
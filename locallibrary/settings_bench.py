@@ -0,0 +1,29 @@
+"""
+Settings profile for the benchmark suite ("python manage.py benchmark --settings=locallibrary.settings_bench").
+
+Same as settings.py, with DEBUG off so that pages are measured as they run in production.
+The database is chosen with BENCH_DATABASE:
+- 'sqlite' (default): bench.sqlite3 in the project directory
+- 'postgresql': BENCH_DB_NAME, BENCH_DB_USER, BENCH_DB_PASSWORD, BENCH_DB_HOST and BENCH_DB_PORT (default: the local database of settings.py)
+Create the benchmark database with "migrate" and fill it with "generate_catalog", using the same --settings.
+"""
+
+from locallibrary.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+if os.environ.get('BENCH_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'bench.sqlite3'),
+        }
+    }
+else:
+    DATABASES['default'].update({
+        'NAME': os.environ.get('BENCH_DB_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('BENCH_DB_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('BENCH_DB_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ.get('BENCH_DB_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('BENCH_DB_PORT', DATABASES['default']['PORT']),
+    })
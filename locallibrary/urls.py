@@ -56,3 +56,9 @@ urlpatterns += [
     path('signup/', views.user_signup_view, name='register'),
 ]
 
+
+# Prometheus metrics of all the worker processes (see catalog/metrics.py)
+from catalog.views import metrics_view
+urlpatterns += [
+    path('metrics', metrics_view, name='metrics'),
+]